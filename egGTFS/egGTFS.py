@@ -3,13 +3,24 @@
 
 import sys
 import os
+import builtins
 import warnings
 import math
 import re
+import datetime
 from types import MethodType
 import inspect
 import zipfile
-from io import BytesIO
+import csv
+import json
+import hashlib
+import importlib.util
+import shutil
+import tempfile
+import queue
+import threading
+from io import StringIO,BytesIO
+from concurrent.futures import ThreadPoolExecutor,ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
@@ -28,6 +39,12 @@ from folium.plugins import HeatMap
 class Time:
     pattern=re.compile(r'([0-9]+):([0-9]+):([0-9]+)')
 
+    # 0 時からの経過秒数より Time オブジェクトを生成する
+    @classmethod
+    def fromTotalSecond(cls,inTotalSecond):
+        h,m,s,f=Time.totalSecond2hmsf(int(inTotalSecond))
+        return cls(h,m,s,f)
+
     @classmethod
     def totalSecond2hmsf(cls,inTotalSecond):
         s=inTotalSecond%60
@@ -148,14 +165,117 @@ class indexSet:
         for t in inFieldNameList: setattr(self,t,getIndex(inHeaderIndex,t))
         self.fieldNameList=inFieldNameList
 
-def getDataFrame(inZipFileObj,inFileName,optional=False):
+# fieldTypes : 列の型（'id','time','str' の列は文字列として読み込む。fieldTypesToDtypes を参照）
+# columns    : 読み込む列のリスト（ファイルに存在しない列は無視する。None の場合は全ての列）
+def getDataFrame(inZipFileObj,inFileName,optional=False,fieldTypes=None,columns=None,workers=None):
     if not inFileName in inZipFileObj.namelist():
         if optional:
             return None,False
         else:
             print('ERROR: no '+inFileName+'.'); sys.exit()	
-    binData=inZipFileObj.read(inFileName)
-    return pd.read_csv(BytesIO(binData)),True
+    if workers!=None and workers>1 and \
+       inZipFileObj.getinfo(inFileName).file_size>=parallelParseMinBytes:
+        with inZipFileObj.open(inFileName) as f:
+            df=readCsvInParallel(f,workers,fieldTypes=fieldTypes,columns=columns)
+        if df is not None: return df,True
+    # zip のメンバを展開しながら読み込む（展開後の内容全体をメモリ上に複製しない）
+    with inZipFileObj.open(inFileName) as f:
+        return pd.read_csv(f,dtype=fieldTypesToDtypes(fieldTypes),
+                           usecols=getUsecols(columns)),True
+
+# getDataFrame で workers を指定した場合に、分割して並列に解析するファイルの大きさの下限
+parallelParseMinBytes=4<<20
+# 並列に解析する際に、ファイルから一度に読み込む大きさ
+parallelParseBlockBytes=4<<20
+
+# バイト列 inBytes の中で、引用符の外にある最後の改行の次の位置を返す（無い場合は 0）。
+# inBytes の先頭は引用符の外であるものとする（"" は引用符 2 個として数えるため偶奇は変わらない）。
+def getLastRecordEnd(inBytes):
+    a=np.frombuffer(inBytes,dtype=np.uint8)
+    newlines=np.flatnonzero(a==ord('\n'))
+    if len(newlines)==0: return 0
+    quotes=np.flatnonzero(a==ord('"'))
+    outside=newlines[np.searchsorted(quotes,newlines)%2==0]
+    return int(outside[-1])+1 if len(outside)>0 else 0
+
+# ファイルオブジェクト inFile の CSV を parallelParseBlockBytes 毎に読み込み、
+# 各ブロックを引用符の外にある最後の改行で区切って、スレッドで並列に解析して連結する
+# （pd.read_csv の解析処理は GIL を解放するため、スレッドでも並列に処理される）。
+# 分割した各部分には先頭行（ヘッダ）を付加して解析する。読み込んだまま解析待ちの
+# ブロックは inWorkers の 2 倍までとし、ファイル全体をメモリ上に読み込むことはしない。
+# 型の推定結果が部分ごとに異なる場合は None を返す（呼び出し側で全体をまとめて解析する）。
+def readCsvInParallel(inFile,inWorkers,fieldTypes=None,columns=None):
+    dtype=fieldTypesToDtypes(fieldTypes)
+    usecols=getUsecols(columns)
+    rest=b''
+    header=None
+    parse=lambda inBytes: pd.read_csv(BytesIO(header+inBytes),dtype=dtype,usecols=usecols)
+    parts,pending=[],[]
+    with ThreadPoolExecutor(max_workers=inWorkers) as executor:
+        while True:
+            block=inFile.read(parallelParseBlockBytes)
+            buf=rest+block
+            if header is None:
+                headerEnd=getLastRecordEnd(buf[:buf.find(b'\n')+1]) if b'\n' in buf else 0
+                if headerEnd==0:
+                    if len(block)==0: return None
+                    rest=buf
+                    continue
+                header,buf=buf[:headerEnd],buf[headerEnd:]
+            end=getLastRecordEnd(buf) if len(block)>0 else len(buf)
+            if end>0:
+                pending.append(executor.submit(parse,buf[:end]))
+            rest=buf[end:]
+            while len(pending)>=inWorkers*2 or (len(block)==0 and len(pending)>0):
+                parts.append(pending.pop(0).result())
+            if len(block)==0: break
+    if len(parts)==0: return None
+    for name in parts[0].columns:
+        typed=[ part[name].dtype for part in parts if part[name].notna().any() ]
+        kinds={ t.kind for t in typed }
+        if len(kinds)>1 and not kinds<={ 'i','u','f' }: return None
+        # 全て欠損値の部分は float と推定されるため、他の部分の型（文字列等）に揃える
+        if len(typed)>0 and typed[0].kind not in 'iuf':
+            for part in parts:
+                if part[name].dtype!=typed[0]: part[name]=part[name].astype(typed[0])
+    return pd.concat(parts,ignore_index=True)
+
+# fieldTypes より pd.read_csv の dtype 引数を作成する。
+# ID 等（'id','str'）と時刻（'time'）は文字列として読み込み、
+# '0012' のような ID が数値 12 に変換されることを防ぐ。
+def fieldTypesToDtypes(inFieldTypes):
+    if inFieldTypes==None: return None
+    return { name:str for name,t in inFieldTypes.items() if t in ('id','time','str') }
+
+def getUsecols(inColumns):
+    if inColumns==None: return None
+    columns=set(inColumns)
+    return lambda name: name in columns
+
+# zip 内の CSV ファイルを inChunkSize 行ごとの DataFrame として順に返す。
+# 型の指定は getDataFrame と同じだが、型を指定していない列も文字列として読み込む
+# （チャンクごとに型の推定結果が異なることを避けるため）。
+def iterDataFrameChunks(inZipFileObj,inFileName,inChunkSize,fieldTypes=None,columns=None):
+    if fieldTypes==None: fieldTypes={}
+    with inZipFileObj.open(inFileName) as f:
+        header=pd.read_csv(f,nrows=0).columns
+    dtypes={ name:str for name in header if fieldTypes.get(name) not in ('int','float') }
+    with inZipFileObj.open(inFileName) as f:
+        for chunk in pd.read_csv(f,chunksize=inChunkSize,dtype=dtypes,usecols=getUsecols(columns)):
+            yield chunk
+
+# inKeyFieldName の値ごとにレコードをまとめ（キーの出現順）、
+# 各まとまりの中を inSequenceFieldName の昇順に並べ替えた DataFrame を返す。
+def sortByGroup(inDataFrame,inKeyFieldName,inSequenceFieldName):
+    if inKeyFieldName not in inDataFrame.columns: return inDataFrame
+    codes,_=pd.factorize(inDataFrame[inKeyFieldName])
+    if inSequenceFieldName in inDataFrame.columns:
+        seq=pd.to_numeric(inDataFrame[inSequenceFieldName],errors='coerce').to_numpy(dtype=float)
+        order=np.lexsort((seq,codes))
+    else:
+        order=np.argsort(codes,kind='stable')
+    if np.array_equal(order,np.arange(len(order))): return inDataFrame
+    return inDataFrame.take(order).reset_index(drop=True)
 
 # idx=inHeaderIndex, name=inFieldNameStr
 def getIndex(idx,name): return idx.get_loc(name) if name in idx else -1
@@ -197,30 +317,649 @@ def addGettersForSingle(inSelf,inFieldNameList):
 
 def getitemBody(inSelf,inID):
     if inSelf.valid==False: return None
-    t=inSelf.data[inSelf.data[:,inSelf.primaryFieldNo]==inID]
+    t=inSelf.getRowsByKey(inID)
+    if t is None: return None
     n=len(t)
-    if n==0: return None
     if n==1 and inSelf.recordClass!=None: return inSelf.recordClass(t[0])
     return t
 
+# 主キーの値から、その値を持つ行の行番号を引くためのハッシュインデックス。
+# 行番号は order[offsets[k]:offsets[k+1]] にて得られる（k は keyPos[キー値]）。
+# 同じキー値を持つ行がデータ中で連続している場合は order を None とし、
+# 行の範囲をそのままスライスとして扱う（コピーの発生しないビューとなる）。
+class KeyIndex:
+    intPattern=re.compile(r'^\s*[+-]?\d+\s*$')
+
+    def __init__(self,inKeyColumn):
+        codes,uniques=pd.factorize(inKeyColumn)
+        order=np.argsort(codes,kind='stable')
+        numOfMissing=int(np.count_nonzero(codes<0))
+        counts=np.bincount(codes[codes>=0],minlength=len(uniques))
+        self.offsets=np.concatenate(([0],np.cumsum(counts)))+numOfMissing
+        self.order=None if numOfMissing==0 and np.array_equal(order,np.arange(len(order))) else order
+        self.keyPos={ key:i for i,key in enumerate(uniques) }
+
+    # 整数として解釈できる文字列のキーについて、その整数値 -> k の辞書を返す
+    # （同じ整数値となるキーが複数ある場合は先に現れたもの）。
+    def getIntKeyPos(self):
+        intKeyPos=self.__dict__.get('intKeyPos')
+        if intKeyPos is None:
+            intKeyPos={}
+            for key,k in self.keyPos.items():
+                if isinstance(key,str) and KeyIndex.intPattern.match(key):
+                    intKeyPos.setdefault(int(key),k)
+            self.intKeyPos=intKeyPos
+        return intKeyPos
+
+    # FeedCache に保存するための配列を返す
+    def toArrays(self):
+        ret={ 'offsets':self.offsets,'keys':np.asarray(list(self.keyPos),dtype=object) }
+        if self.order is not None: ret['order']=self.order
+        return ret
+
+    @classmethod
+    def fromArrays(cls,inArrays):
+        self=cls.__new__(cls)
+        self.offsets=inArrays['offsets']
+        self.order=inArrays.get('order')
+        self.keyPos={ key:i for i,key in enumerate(inArrays['keys'].tolist()) }
+        return self
+
+    # return start,end (or None,None)
+    # ID は文字列として読み込まれるため、整数で指定された場合は
+    # 整数として解釈できるキー（'0012' など）の値としても検索する。
+    def getRange(self,inID):
+        try:
+            k=self.keyPos.get(inID)
+        except TypeError:
+            return None,None
+        if k is None and isinstance(inID,(int,np.integer)) and not isinstance(inID,bool):
+            k=self.getIntKeyPos().get(int(inID))
+        if k is None: return None,None
+        return int(self.offsets[k]),int(self.offsets[k+1])
+
+    # 指定したキー値を持つ行の行番号（スライスまたは配列）を返す。
+    def getRows(self,inID):
+        start,end=self.getRange(inID)
+        if start is None: return None
+        if self.order is None: return slice(start,end)
+        return self.order[start:end]
+
+# -------------------------------------------------------------------
+#   typed columnar storage
+# -------------------------------------------------------------------
+# 列の型（fieldTypes で指定する）：
+#   'id'    : ID などの文字列。整数のコードと値の表（カテゴリ）として保持する。
+#   'str'   : 文字列。object 型の配列として保持する。
+#   'float' : float64 の配列として保持する。
+#   'int'   : int32 の配列として保持する（欠損値がある場合は float64）。
+#   'time'  : 'hh:mm:ss' 形式の時刻。0 時からの経過秒数を int32 で保持する。
+#             24:00:00 以降の時刻もそのまま秒数となる。欠損値は missingSeconds。
+missingSeconds=-1
+
+# 'hh:mm:ss' 形式の文字列の配列を 0 時からの経過秒数（int32）の配列に変換する。
+# 解釈できない値や欠損値は missingSeconds となる。
+# 時刻の種類は行数に比べて少ないため、重複を除いた値のみを解釈する。
+def timeStrArrayToSeconds(inValues):
+    codes,uniques=pd.factorize(np.asarray(inValues,dtype=object))
+    seconds=np.append(uniqueTimeStrArrayToSeconds(uniques),np.int32(missingSeconds))
+    return seconds[codes]
+
+def uniqueTimeStrArrayToSeconds(inValues):
+    values=pd.Series(np.asarray(inValues,dtype=object),dtype=object)
+    ret=np.full(len(values),missingSeconds,dtype=np.int32)
+    if len(values)==0: return ret
+
+    # 'hh:mm:ss' の 8 文字の場合は文字コードから直接計算する
+    fixed=np.array(values.str.len()==8,dtype=bool)
+    if fixed.any():
+        try:
+            b=np.array(values[fixed].tolist(),dtype='S8').view(np.uint8).reshape(-1,8).astype(np.int32)-ord('0')
+        except UnicodeEncodeError:
+            b=None
+            fixed[:]=False
+        if b is not None:
+            digits=b[:,[0,1,3,4,6,7]]
+            ok=(b[:,2]==ord(':')-ord('0')) & (b[:,5]==ord(':')-ord('0')) \
+               & ((0<=digits) & (digits<=9)).all(axis=1)
+            sec=(b[:,0]*10+b[:,1])*3600+(b[:,3]*10+b[:,4])*60+b[:,6]*10+b[:,7]
+            t=np.flatnonzero(fixed)
+            ret[t[ok]]=sec[ok]
+            fixed[t[~ok]]=False
+
+    rest=~fixed
+    if rest.any():
+        hms=values[rest].str.extract(Time.pattern.pattern).apply(pd.to_numeric)
+        sec=(hms[0]*3600+hms[1]*60+hms[2]).to_numpy(dtype=float)
+        t=np.flatnonzero(rest)
+        valid=~np.isnan(sec)
+        ret[t[valid]]=sec[valid].astype(np.int32)
+    return ret
+
+def secondsToTimeStr(inSeconds):
+    if inSeconds<0: return np.nan
+    inSeconds=int(inSeconds)
+    return '{:02d}:{:02d}:{:02d}'.format(inSeconds//3600,inSeconds//60%60,inSeconds%60)
+
+# 型の揃った 1 次元配列の列
+class ArrayColumn:
+    def __init__(self,inArray): self.array=inArray
+    def __len__(self): return len(self.array)
+    def value(self,inRowNo):
+        v=self.array[inRowNo]
+        return v.item() if isinstance(v,np.generic) else v
+    def values(self,inRows=slice(None)): return self.array[inRows]
+    def take(self,inRows): return type(self)(self.array[inRows])
+    def keyValues(self): return self.array
+
+# ID 等の列：行ごとのコード（int32）と、コードに対応する値の表
+class CategoryColumn:
+    def __init__(self,inCodes,inCategories):
+        self.codes=inCodes
+        self.categories=inCategories
+    def __len__(self): return len(self.codes)
+    def value(self,inRowNo):
+        code=self.codes[inRowNo]
+        if code<0: return np.nan
+        v=self.categories[code]
+        return v.item() if isinstance(v,np.generic) else v
+    def values(self,inRows=slice(None)):
+        codes=self.codes[inRows]
+        ret=np.asarray(self.categories,dtype=object)[codes]
+        if (codes<0).any(): ret[codes<0]=np.nan
+        return ret
+    def take(self,inRows): return CategoryColumn(self.codes[inRows],self.categories)
+    def keyValues(self): return pd.Categorical.from_codes(self.codes,self.categories)
+
+# 時刻の列：0 時からの経過秒数（int32）
+class TimeColumn(ArrayColumn):
+    def value(self,inRowNo): return secondsToTimeStr(self.array[inRowNo])
+    def values(self,inRows=slice(None)):
+        return np.array([secondsToTimeStr(t) for t in self.array[inRows]],dtype=object)
+    def keyValues(self): return self.values()
+
+def makeColumn(inSeries,inFieldType):
+    if inFieldType=='time':
+        return TimeColumn(timeStrArrayToSeconds(inSeries.to_numpy(dtype=object)))
+    if inFieldType=='id':
+        codes,categories=pd.factorize(inSeries)
+        return CategoryColumn(codes.astype(np.int32),np.asarray(categories,dtype=object))
+    if inFieldType in ('int','float'):
+        try:
+            t=pd.to_numeric(inSeries).to_numpy(dtype=float)
+        except (ValueError,TypeError):
+            return ArrayColumn(inSeries.to_numpy())
+        int32Info=np.iinfo(np.int32)
+        if inFieldType=='int' and np.isfinite(t).all() and (t==np.round(t)).all() \
+           and (len(t)==0 or (int32Info.min<=t.min() and t.max()<=int32Info.max)):
+            return ArrayColumn(t.astype(np.int32))
+        return ArrayColumn(t)
+    if inFieldType=='str':
+        return ArrayColumn(inSeries.to_numpy(dtype=object))
+    return ArrayColumn(inSeries.to_numpy())
+
+# 列ごとに型の揃った配列を持つ表。
+# np.asarray(df) で得られる object 型の 2 次元配列の代わりとして、
+#     data[n]      : n 行目のレコード（object 型の 1 次元配列）
+#     data[a:b]    : 行の部分集合（ColumnTable。スライスの場合は各列のビュー）
+#     data[:,col]  : col 列目の値（object 型または数値型の 1 次元配列）
+# といったアクセスができる。
+class ColumnTable:
+    ndim=2
+
+    def __init__(self,inColumns,inNumOfRows=None):
+        self.columns=inColumns
+        self.numOfRows=len(inColumns[0]) if inNumOfRows==None else inNumOfRows
+
+    @classmethod
+    def fromDataFrame(cls,inDataFrame,inFieldTypes):
+        columns=[makeColumn(inDataFrame[name],inFieldTypes.get(name))
+                 for name in inDataFrame.columns]
+        return cls(columns,len(inDataFrame))
+
+    @property
+    def shape(self): return (self.numOfRows,len(self.columns))
+
+    def __len__(self): return self.numOfRows
+
+    def row(self,inRowNo):
+        ret=np.empty(len(self.columns),dtype=object)
+        for i,c in enumerate(self.columns): ret[i]=c.value(inRowNo)
+        return ret
+
+    def __getitem__(self,inKey):
+        if isinstance(inKey,tuple):
+            rows,col=inKey
+            return self.columns[col].values(rows)
+        if isinstance(inKey,(int,np.integer)):
+            n=int(inKey)
+            if n<0: n+=self.numOfRows
+            if n<0 or self.numOfRows<=n: raise IndexError('index out of range')
+            return self.row(n)
+        if isinstance(inKey,slice):
+            return ColumnTable([c.take(inKey) for c in self.columns],
+                               len(range(*inKey.indices(self.numOfRows))))
+        rows=np.asarray(inKey)
+        if rows.dtype==bool: rows=np.flatnonzero(rows)
+        return ColumnTable([c.take(rows) for c in self.columns],len(rows))
+
+    def __iter__(self):
+        for i in range(self.numOfRows): yield self.row(i)
+
+    def __array__(self,dtype=None,copy=None):
+        ret=np.empty(self.shape,dtype=object)
+        for i,c in enumerate(self.columns): ret[:,i]=c.values()
+        return ret if dtype==None else ret.astype(dtype)
+
+    def keyValues(self,inColumnNo): return self.columns[inColumnNo].keyValues()
+
+# iterDataFrameChunks で読み込んだ DataFrame を順に追加し、ColumnTable を作成する。
+# 'id' の列は、チャンクをまたいで共通のコード（最初に現れた順）を割り当てながら追加するため、
+# ファイル全体の DataFrame を作成することなく、型の揃った配列のみを保持する。
+# 文字列として読み込んだ型を指定していない列は、build の際に
+# 全ての値が数値と解釈できれば、pd.read_csv と同様に数値に変換する。
+class ColumnTableBuilder:
+    def __init__(self,inFieldTypes):
+        self.fieldTypes=inFieldTypes if inFieldTypes!=None else {}
+        self.header=None
+        self.parts=None
+        self.codeTables=None
+        self.numOfRows=0
+
+    def append(self,inDataFrame):
+        if self.header is None:
+            self.header=list(inDataFrame.columns)
+            self.parts={ name:[] for name in self.header }
+            self.codeTables={ name:{} for name in self.header if self.fieldTypes.get(name)=='id' }
+        for name in self.header:
+            series=inDataFrame[name]
+            if name in self.codeTables:
+                codes,uniques=pd.factorize(series)
+                table=self.codeTables[name]
+                remap=np.array([ table.setdefault(u,len(table)) for u in uniques ]+[-1],dtype=np.int32)
+                self.parts[name].append(remap[codes])
+            else:
+                self.parts[name].append(makeColumn(series,self.fieldTypes.get(name)).array)
+        self.numOfRows+=len(inDataFrame)
+
+    def build(self):
+        columns=[]
+        for name in self.header:
+            parts=self.parts[name]
+            values=np.concatenate(parts) if len(parts)>0 else np.zeros(0,dtype=object)
+            self.parts[name]=None
+            fieldType=self.fieldTypes.get(name)
+            if name in self.codeTables:
+                categories=np.asarray(list(self.codeTables[name]),dtype=object)
+                columns.append(CategoryColumn(values,categories))
+            elif fieldType=='time':
+                columns.append(TimeColumn(values))
+            else:
+                if fieldType==None and values.dtype==object:
+                    numeric=toNumericIfPossible(values)
+                    if numeric is not None: values=numeric
+                columns.append(ArrayColumn(values))
+        return ColumnTable(columns,self.numOfRows)
+
+# 欠損値以外の全ての値が数値と解釈できる場合は数値の配列を（整数のみの場合は int64、
+# 欠損値を含む場合は float64）、そうでない場合は None を返す。
+def toNumericIfPossible(inValues):
+    if len(inValues)==0: return None
+    try:
+        t=pd.to_numeric(pd.Series(inValues,dtype=object))
+    except (ValueError,TypeError):
+        return None
+    if t.dtype==object or t.dtype==bool: return None
+    return t.to_numpy()
+
+# ColumnTable を inKeyColumnNo の列ごとにまとめ（キーの出現順）、
+# 各まとまりの中を inSequenceColumnNo の列の昇順に並べ替える（sortByGroup と同じ順となる）。
+def sortColumnTableByGroup(inTable,inKeyColumnNo,inSequenceColumnNo):
+    if inKeyColumnNo<0: return inTable
+    keyColumn=inTable.columns[inKeyColumnNo]
+    if isinstance(keyColumn,CategoryColumn):
+        codes=keyColumn.codes
+    else:
+        codes,_=pd.factorize(keyColumn.values())
+    if inSequenceColumnNo>=0:
+        seq=pd.to_numeric(pd.Series(inTable[:,inSequenceColumnNo]),errors='coerce').to_numpy(dtype=float)
+        order=np.lexsort((seq,codes))
+    else:
+        order=np.argsort(codes,kind='stable')
+    if np.array_equal(order,np.arange(len(order))): return inTable
+    return inTable[order]
+
+# self.data の列 inColumnNo を、KeyIndex 等で用いる値の配列として返す。
+def getKeyValues(inData,inColumnNo):
+    if isinstance(inData,ColumnTable): return inData.keyValues(inColumnNo)
+    return inData[:,inColumnNo]
+
+# -------------------------------------------------------------------
+#   filter conditions
+# -------------------------------------------------------------------
+# RecordSet.filterBy 等で用いる列の条件。
+# mask(inRecordSet,inFieldName) は、条件を満たす行を True とする bool 型の配列を返す。
+# 値の比較は getColumn で得られる型の揃った配列に対して一括して行う
+# （'time' の列は 0 時からの経過秒数として比較する）。
+# ID 等のカテゴリの列（storage='columnar'）では、値の表に対して判定した結果を
+# 各行のコードで引くことで、行ごとの文字列の比較を行わない。
+class Condition:
+    def mask(self,inRecordSet,inFieldName):
+        codes,categories=inRecordSet.getColumnCodes(inFieldName)
+        if codes is not None:
+            categoryMask=np.append(self.valueMask(inRecordSet,inFieldName,categories),False)
+            return categoryMask[codes]
+        return self.valueMask(inRecordSet,inFieldName,inRecordSet.getColumn(inFieldName))
+
+# 値が inValues のいずれかと等しい
+# （文字列として読み込まれる 'id' の列に整数を指定した場合は、'0012' なども 12 と等しいとする）
+class IsIn(Condition):
+    def __init__(self,inValues):
+        self.values=[inValues] if isinstance(inValues,str) or not isArray(inValues) else list(inValues)
+    def valueMask(self,inRecordSet,inFieldName,inValues):
+        targets=[ inRecordSet.toColumnValue(inFieldName,t) for t in self.values ]
+        values=pd.Series(np.asarray(inValues))
+        ret=values.isin(targets).to_numpy(dtype=bool)
+        intTargets=[ t for t in targets if isinstance(t,(int,np.integer)) and not isinstance(t,bool) ]
+        if inRecordSet.fieldTypes.get(inFieldName)=='id' and len(intTargets)>0 and values.dtype!=np.int64:
+            ret=ret | pd.to_numeric(values,errors='coerce').isin(intTargets).to_numpy(dtype=bool)
+        return ret
+
+# 値が文字列 inSubString を含む
+# （数値として読み込まれた列（route_short_name 等）の値は文字列にして判定する）
+class Contains(Condition):
+    def __init__(self,inSubString): self.subString=inSubString
+    def valueMask(self,inRecordSet,inFieldName,inValues):
+        values=pd.Series(np.asarray(inValues,dtype=object),dtype=object)
+        notNull=values.notna()
+        values[notNull]=values[notNull].astype(str)
+        return values.str.contains(self.subString,regex=False,na=False).to_numpy(dtype=bool)
+
+# 値が inLow 以上 inHigh 以下（None の場合はその側の制限なし）
+class Between(Condition):
+    def __init__(self,inLow=None,inHigh=None): self.low,self.high=inLow,inHigh
+    def valueMask(self,inRecordSet,inFieldName,inValues):
+        values=pd.to_numeric(pd.Series(np.asarray(inValues,dtype=object)),errors='coerce').to_numpy(dtype=float)
+        ret=~np.isnan(values)
+        if inRecordSet.fieldTypes.get(inFieldName)=='time': ret&=values>=0
+        if self.low !=None: ret&=values>=inRecordSet.toColumnValue(inFieldName,self.low)
+        if self.high!=None: ret&=values<=inRecordSet.toColumnValue(inFieldName,self.high)
+        return ret
+
+# 条件として Condition 以外の値が指定された場合は、その値と等しいことを条件とする
+def toCondition(inCondition):
+    return inCondition if isinstance(inCondition,Condition) else IsIn([inCondition])
+
+# -------------------------------------------------------------------
+#   binary cache
+# -------------------------------------------------------------------
+# 解析済みの表や、主キーのインデックス等の派生データを .npy 形式で保存するキャッシュ。
+# キャッシュは GTFS ファイル（zip）の内容の SHA-256 と egGTFS のバージョンごとに
+#     <cacheDir>/<sha256>-<version>-<formatVersion>/<エントリ名>/
+# に保存される。各エントリは配列ごとの .npy ファイルと meta.json から成る。
+# object 型の配列はコード（int32）と値の表に分けて保存する（欠損値のコードは -1）。
+# 読み込み時、数値の配列はメモリマップされる（読み出し専用）。
+class FeedCache:
+    # 保存する内容（各表の列や型、派生データの配列の構成）を変えた場合は必ず更新する。
+    # バージョン番号と共にキーに含めるため、構成の異なる古いキャッシュは読み込まれない。
+    formatVersion=5
+
+    def __init__(self,inCacheDir,inZipFilePath):
+        self.cacheDir=inCacheDir
+        self.key=FeedCache.makeKey(inZipFilePath)
+        self.path=os.path.join(inCacheDir,self.key)
+
+    # GTFS ファイルに依らず、ディレクトリ inPath をエントリの保存先とするキャッシュを返す
+    # （プロセス間で配列を共有するための一時的な保存先等に用いる）。
+    @classmethod
+    def fromPath(cls,inPath):
+        self=cls.__new__(cls)
+        self.cacheDir=os.path.dirname(inPath)
+        self.key=os.path.basename(inPath)
+        self.path=inPath
+        return self
+
+    @staticmethod
+    def fileHash(inFilePath):
+        h=hashlib.sha256()
+        with builtins.open(inFilePath,'rb') as f:
+            for chunk in iter(lambda: f.read(1<<20),b''): h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def makeKey(inZipFilePath):
+        return FeedCache.fileHash(inZipFilePath)+'-'+version()+'-'+str(FeedCache.formatVersion)
+
+    def getEntryPath(self,inName): return os.path.join(self.path,inName)
+
+    def has(self,inName):
+        return os.path.isfile(os.path.join(self.getEntryPath(inName),'meta.json'))
+
+    # inArrays : { 配列名:1 次元または多次元の numpy 配列 }
+    # inMeta   : json で保存できる付加情報
+    # 保存できない配列（値の表が文字列や数値とならないもの）を含む場合は False を返す。
+    def save(self,inName,inArrays,inMeta=None):
+        files={}; kinds={}
+        for name,values in inArrays.items():
+            encoded=encodeCacheArray(values)
+            if encoded is None: return False
+            kinds[name]=encoded[0]
+            for suffix,t in encoded[1].items(): files[name+suffix]=t
+        os.makedirs(self.path,exist_ok=True)
+        tmpPath=tempfile.mkdtemp(prefix='.tmp-',dir=self.path)
+        try:
+            for fileName,t in files.items(): np.save(os.path.join(tmpPath,fileName+'.npy'),t)
+            with builtins.open(os.path.join(tmpPath,'meta.json'),'w',encoding='utf-8') as f:
+                json.dump({ 'arrays':kinds,'meta':inMeta },f,ensure_ascii=False)
+            try:
+                os.replace(tmpPath,self.getEntryPath(inName))
+            except OSError:
+                # 他のプロセスが先に同じエントリを保存した場合
+                if not self.has(inName): raise
+        finally:
+            if os.path.isdir(tmpPath): shutil.rmtree(tmpPath,ignore_errors=True)
+        return True
+
+    # return arrays,meta（エントリが存在しない、または読み込めない場合は None,None）
+    # decodeObjects=False の場合、object 型の配列は復元せず、
+    # メモリマップされたコードと値の表の組 (codes,categories) として返す。
+    def load(self,inName,decodeObjects=True):
+        entryPath=self.getEntryPath(inName)
+        try:
+            with builtins.open(os.path.join(entryPath,'meta.json'),encoding='utf-8') as f:
+                info=json.load(f)
+            arrays={}
+            for name,kind in info['arrays'].items():
+                arrays[name]=decodeCacheArray(kind,
+                    lambda suffix: np.load(os.path.join(entryPath,name+suffix+'.npy'),mmap_mode='r'),
+                    decodeObjects=decodeObjects)
+        except (OSError,ValueError,KeyError):
+            return None,None
+        return arrays,info['meta']
+
+    # このキャッシュ（GTFS ファイル 1 つ分）を削除する
+    def clear(self):
+        if os.path.isdir(self.path): shutil.rmtree(self.path)
+
+# readOnly=True で open した際に cacheDir を省略した場合のキャッシュの保存先。
+# 環境変数 EGGTFS_CACHE_DIR が設定されていればそのディレクトリを用いる。
+def defaultCacheDir():
+    return os.environ.get('EGGTFS_CACHE_DIR',os.path.join(tempfile.gettempdir(),'egGTFS-cache'))
+
+# return kind,{ ファイル名の接尾辞:配列 }（保存できない場合は None）
+def encodeCacheArray(inValues):
+    values=np.asarray(inValues)
+    if values.dtype!=object: return 'array',{ '':values }
+    codes,uniques=pd.factorize(values.ravel())
+    uniques=list(uniques)
+    if all(isinstance(u,str) for u in uniques):
+        categories=np.array(uniques,dtype=str)
+    else:
+        categories=np.array(uniques)
+        if categories.dtype==object: return None
+    return 'object',{ '.codes':codes.astype(np.int32).reshape(values.shape),
+                      '.categories':categories }
+
+def decodeCacheArray(inKind,inLoad,decodeObjects=True):
+    if inKind=='array': return inLoad('')
+    if inKind!='object': raise ValueError('unknown cache array kind: '+str(inKind))
+    if decodeObjects==False: return inLoad('.codes'),inLoad('.categories')
+    codes=np.asarray(inLoad('.codes'))
+    categories=np.append(np.asarray(inLoad('.categories')).astype(object),np.nan)
+    return categories[codes]
+
+# RecordSet の表（DataFrame または ColumnTable）と FeedCache の配列との相互変換。
+# 列 i の配列は 'column.<i>' という名前で保存する。
+def dataFrameToCacheArrays(inDataFrame,inHeader):
+    arrays={ 'column.'+str(i):inDataFrame[name].to_numpy() for i,name in enumerate(inHeader) }
+    return arrays,{ 'columns':list(inHeader) }
+
+def cacheArraysToDataFrame(inArrays,inMeta):
+    header=inMeta['columns']
+    return pd.DataFrame({ name:inArrays['column.'+str(i)] for i,name in enumerate(header) },
+                        columns=header)
+
+def columnTableToCacheArrays(inTable,inHeader):
+    arrays={}; kinds=[]
+    for i,column in enumerate(inTable.columns):
+        name='column.'+str(i)
+        if isinstance(column,CategoryColumn):
+            arrays[name]=column.codes
+            arrays[name+'.categories']=np.asarray(column.categories,dtype=object)
+            kinds.append('category')
+        else:
+            arrays[name]=column.array
+            kinds.append('time' if isinstance(column,TimeColumn) else 'array')
+    return arrays,{ 'columns':list(inHeader),'columnKinds':kinds,'numOfRows':len(inTable) }
+
+# FeedCache.load(...,decodeObjects=False) で読み込んだ配列にも対応する。
+# この場合、文字列の列はメモリマップされたコードと値の表を持つ CategoryColumn となる。
+def cacheArraysToColumnTable(inArrays,inMeta):
+    columns=[]
+    for i,kind in enumerate(inMeta['columnKinds']):
+        name='column.'+str(i)
+        values=inArrays[name]
+        if kind=='category':
+            categories=inArrays[name+'.categories']
+            if isinstance(categories,tuple):
+                codes,categories=categories
+                if not np.array_equal(codes,np.arange(len(codes))): categories=categories[codes]
+            columns.append(CategoryColumn(values,categories))
+        elif isinstance(values,tuple):
+            columns.append(CategoryColumn(*values))
+        elif kind=='time':
+            columns.append(TimeColumn(values))
+        else:
+            columns.append(ArrayColumn(values))
+    return ColumnTable(columns,inMeta['numOfRows'])
+
 # -------------------------------------------------------------------
 #   base classes
 # -------------------------------------------------------------------
 class RecordSet:
+    # inSequenceFieldName を指定すると、読み込み時にレコードを主キーごとにまとめ、
+    # さらに各まとまりの中を inSequenceFieldName の昇順に並べ替えて保持する。
+    # これにより、同一の主キーを持つレコード群は self.data 上で連続した範囲となる。
+    #
+    # storage='columnar' とすると、self.data は object 型の 2 次元配列ではなく、
+    # fieldTypes に従い列ごとに型の揃った配列を持つ ColumnTable となる。
+    # この場合、メモリ節約のため self.df は保持しない（None となる）。
+    #
+    # cache に FeedCache を指定すると、解析済みの表と主キーのインデックス等を
+    # キャッシュから読み込む（キャッシュに無い場合は解析した結果を保存する）。
+    # readOnly=True の場合（storage='columnar' と cache の指定が必要）、
+    # 文字列の列も含め、self.data の全ての配列をキャッシュのメモリマップとして保持する。
+    # 同じキャッシュを用いる複数のプロセスの間で、これらの配列の物理メモリは共有される。
+    #
+    # chunkSize を指定すると、ファイルを chunkSize 行ごとに読み込みながら ColumnTable を作成する
+    # （ファイル全体の DataFrame は作成しない）。storage='columnar' 以外の場合は ValueError となる。
+    #
+    # columns にフィールド名のリストを指定すると、それらの列（と主キー、sequenceFieldName の列）
+    # のみを読み込む。読み込まなかったフィールドの値は None となる。
+    # fieldTypes にて 'id','time','str' とした列は、常に文字列として読み込む。
+    #
+    # workers を指定すると、大きなファイルは行の境界で分割し、workers 個のスレッドで
+    # 並列に解析する（chunkSize を指定した場合は用いない）。
     def __init__(self,inZipFileObj,inFileName,inFieldNameList,
                  inPrimaryFieldName,inRecordClass,
-                 optional=False):
+                 optional=False,sequenceFieldName=None,
+                 fieldTypes=None,storage='object',cache=None,readOnly=False,
+                 chunkSize=None,columns=None,workers=None):
         self.valid=False
         self.hasRecord=False
         self._index=-1
+        self._keyIndex=None
+        self._keyIndexSource=None
+        self._columnCache={}
+        self._columnCacheSource=None
+        self._cacheSource=None
         self.fileName=inFileName
-        self.df,df_result=getDataFrame(inZipFileObj,inFileName,optional=optional)
+        self.fieldTypes=fieldTypes if fieldTypes!=None else {}
+        if storage not in ('object','columnar'): raise ValueError('invalid storage: '+str(storage))
+        self.storage=storage
+        if readOnly and (storage!='columnar' or cache==None):
+            raise ValueError('readOnly requires columnar storage and a cache.')
+        if chunkSize!=None and storage!='columnar':
+            raise ValueError('chunkSize requires columnar storage.')
+        self.readOnly=readOnly
+        self.cache=cache
         self.optional=optional
-        if optional and df_result==False: return
-
+        self.zipFileObj=inZipFileObj
+        self.df=None
+        if columns!=None:
+            columns=sorted(set(columns)|{ t for t in (inPrimaryFieldName,sequenceFieldName) if t!=None })
+        self.columns=columns
+        cacheEntryName=self.getCacheEntryName(storage)
+        if columns!=None:
+            cacheEntryName+='.'+hashlib.sha1(','.join(columns).encode()).hexdigest()[:12]
+        loadCache=lambda: cache.load(cacheEntryName,decodeObjects=readOnly==False)
+        cachedArrays,cachedMeta=loadCache() if cache!=None else (None,None)
+        if cachedMeta!=None:
+            if cachedMeta.get('missing'): return
+            header=cachedMeta['columns']
+            if storage=='columnar':
+                self.data=cacheArraysToColumnTable(cachedArrays,cachedMeta)
+            else:
+                self.df=cacheArraysToDataFrame(cachedArrays,cachedMeta)
+                self.data=np.asarray(self.df)
+        else:
+            if inFileName not in inZipFileObj.namelist():
+                if optional==False: print('ERROR: no '+inFileName+'.'); sys.exit()
+                if cache!=None: cache.save(cacheEntryName,{},{ 'missing':True })
+                return
+            if storage=='columnar' and chunkSize!=None:
+                builder=ColumnTableBuilder(fieldTypes)
+                for chunk in iterDataFrameChunks(inZipFileObj,inFileName,chunkSize,
+                                                 fieldTypes=fieldTypes,columns=columns):
+                    builder.append(chunk)
+                if builder.header is None:
+                    builder.append(getDataFrame(inZipFileObj,inFileName,
+                                                fieldTypes=fieldTypes,columns=columns)[0])
+                header=builder.header
+                self.data=builder.build()
+                if sequenceFieldName!=None:
+                    self.data=sortColumnTableByGroup(self.data,getIndex(pd.Index(header),inPrimaryFieldName),
+                                                     getIndex(pd.Index(header),sequenceFieldName))
+            else:
+                self.df,_=getDataFrame(inZipFileObj,inFileName,fieldTypes=fieldTypes,columns=columns,
+                                       workers=workers)
+                if sequenceFieldName!=None:
+                    self.df=sortByGroup(self.df,inPrimaryFieldName,sequenceFieldName)
+                header=list(self.df.columns)
+            if storage=='columnar':
+                if self.df is not None:
+                    self.data=ColumnTable.fromDataFrame(self.df,fieldTypes)
+                    self.df=None
+                if cache!=None:
+                    cache.save(cacheEntryName,*columnTableToCacheArrays(self.data,header))
+                    if readOnly:
+                        # 保存したキャッシュのメモリマップに置き換える
+                        arrays,meta=loadCache()
+                        if meta!=None: self.data=cacheArraysToColumnTable(arrays,meta)
+            else:
+                self.data=np.asarray(self.df)
         self.fieldNameList=inFieldNameList
-        self.index=indexSet(self.df.columns,self.fieldNameList)
-        self.data=np.asarray(self.df)
+        self.index=indexSet(pd.Index(header),self.fieldNameList)
         if len(self.data)>0: self.hasRecord=True
         addGetters(self,self.fieldNameList)
         self.primaryFieldName=inPrimaryFieldName
@@ -228,6 +967,23 @@ class RecordSet:
         self.recordClass=inRecordClass
         self.valid=True
 
+        # 時刻の列は読み込み時に 0 時からの経過秒数の配列に変換しておく
+        timeFieldNameList=[ name for name,fieldType in self.fieldTypes.items() if fieldType=='time' ]
+        if cachedMeta!=None and storage=='object':
+            self._columnCacheSource=self.data
+            for fieldName in timeFieldNameList:
+                if fieldName in cachedArrays: self._columnCache[fieldName]=cachedArrays[fieldName]
+        for fieldName in timeFieldNameList: self.getColumn(fieldName)
+
+        if cache!=None:
+            self._cacheSource=self.data
+            if cachedMeta==None and storage=='object':
+                arrays,meta=dataFrameToCacheArrays(self.df,header)
+                for fieldName in timeFieldNameList:
+                    column=self.getColumn(fieldName)
+                    if column is not None: arrays[fieldName]=column
+                cache.save(cacheEntryName,arrays,meta)
+
         if inRecordClass!=None:
             inRecordClass.fieldNameList=inFieldNameList
             inRecordClass.index=self.index
@@ -241,6 +997,77 @@ class RecordSet:
 
     def __getitem__(self,inID): return getitemBody(self,inID)
 
+    # 主キーのインデックスは最初の検索時に作成される（キャッシュがあればそこから読み込む）。
+    # filter 等により self.data が置き換えられた場合は自動的に作り直される。
+    def getKeyIndex(self):
+        if self.valid==False or self.primaryFieldNo<0: return None
+        if self._keyIndex is None or self._keyIndexSource is not self.data:
+            build=lambda: KeyIndex(getKeyValues(self.data,self.primaryFieldNo))
+            if self.isCacheSource():
+                self._keyIndex=KeyIndex.fromArrays(
+                    self.getCachedArrays('keyIndex',lambda: build().toArrays()))
+            else:
+                self._keyIndex=build()
+            self._keyIndexSource=self.data
+        return self._keyIndex
+
+    # キャッシュのエントリ名（'stop_times.keyIndex' など）
+    def getCacheEntryName(self,inName):
+        return os.path.splitext(self.fileName)[0]+'.'+inName
+
+    # self.data がキャッシュと対応している（filter 等により置き換えられていない）か否か
+    def isCacheSource(self):
+        return self.cache!=None and self._cacheSource is not None and self._cacheSource is self.data
+
+    # 派生データの配列をキャッシュから読み込む。
+    # キャッシュに無い場合は inBuilder() で作成し、キャッシュに保存する。
+    def getCachedArrays(self,inName,inBuilder):
+        entryName=self.getCacheEntryName(inName)
+        arrays,_=self.cache.load(entryName)
+        if arrays is None:
+            arrays=inBuilder()
+            self.cache.save(entryName,arrays)
+        return arrays
+
+    # 主キーが inID である行の範囲 start,end を返す（存在しない場合は None,None）。
+    # sequenceFieldName を指定して生成された RecordSet では
+    # self.data[start:end] がそのキーを持つ全レコードとなる。
+    def getRowRangeByKey(self,inID):
+        keyIndex=self.getKeyIndex()
+        if keyIndex is None or keyIndex.order is not None: return None,None
+        return keyIndex.getRange(inID)
+
+    # 主キーが inID である行を 2 次元配列で返す（存在しない場合は None）。
+    def getRowsByKey(self,inID):
+        keyIndex=self.getKeyIndex()
+        if keyIndex is None: return None
+        rows=keyIndex.getRows(inID)
+        if rows is None: return None
+        return self.data[rows]
+
+    # 説明：
+    #     指定したフィールドの全レコード分の値を、fieldTypes に従った型の
+    #     1 次元配列で返します（'float' は float64、'int' は int32、
+    #     'time' は 0 時からの経過秒数の int32 など）。
+    #     columnar 形式では保持している配列そのものを返し、object 形式では
+    #     変換した結果をキャッシュして返します。返された配列は書き換えないで下さい。
+    def getColumn(self,inFieldName):
+        columnNo=getattr(self.index,inFieldName,-1) if self.valid else -1
+        if columnNo<0: return None
+        if self._columnCacheSource is not self.data:
+            self._columnCache={}
+            self._columnCacheSource=self.data
+        if inFieldName in self._columnCache: return self._columnCache[inFieldName]
+        fieldType=self.fieldTypes.get(inFieldName)
+        if isinstance(self.data,ColumnTable):
+            column=self.data.columns[columnNo]
+            ret=column.values() if isinstance(column,CategoryColumn) else column.array
+        else:
+            ret=makeColumn(pd.Series(self.data[:,columnNo]),fieldType)
+            ret=ret.values() if isinstance(ret,CategoryColumn) else ret.array
+        self._columnCache[inFieldName]=ret
+        return ret
+
     def __iter__(self):
         self._index=0
         return self
@@ -251,15 +1078,68 @@ class RecordSet:
         self._index+=1
         return ret
 
+    # 距離の計算方法（egGTFS.open の distanceMode 引数を参照）
+    def getDistanceMode(self):
+        return self.gtfs.distanceMode if hasattr(self,'gtfs') else 'geodesic'
+
+    # storage='columnar' のカテゴリの列の場合は、行ごとのコードと値の表 codes,categories を、
+    # それ以外の場合は None,None を返す。
+    def getColumnCodes(self,inFieldName):
+        columnNo=getattr(self.index,inFieldName,-1) if self.valid else -1
+        if columnNo<0 or not isinstance(self.data,ColumnTable): return None,None
+        column=self.data.columns[columnNo]
+        if not isinstance(column,CategoryColumn): return None,None
+        return column.codes,column.categories
+
+    # 条件に指定された値を getColumn の配列と比較できる値に変換する
+    # （'time' の列の場合は 'hh:mm:ss' 形式の文字列や Time を経過秒数にする）。
+    def toColumnValue(self,inFieldName,inValue):
+        if self.fieldTypes.get(inFieldName)=='time' and isinstance(inValue,(str,Time)):
+            return toSeconds(inValue)
+        return inValue
+
+    # 説明：
+    #     フィールド名=条件 の形式で指定した全ての条件を満たす行を True とする
+    #     bool 型の配列を返します。条件には IsIn, Contains, Between または値
+    #     （その値と等しい）を指定します。存在しないフィールドを指定すると ValueError となります。
+    #     ex: getMask(stop_name=Contains('美術'),location_type=0)
+    def getMask(self,**inConditions):
+        if self.valid==False: return np.zeros(0,dtype=bool)
+        ret=np.ones(len(self.data),dtype=bool)
+        for fieldName,condition in inConditions.items():
+            if getattr(self.index,fieldName,-1)<0: raise ValueError('no such a field: '+str(fieldName))
+            ret&=toCondition(condition).mask(self,fieldName)
+        return ret
+
+    # 説明：
+    #     filter と同様にレコードを絞り込みますが、Python の関数の代わりに
+    #     getMask と同じ形式の条件を指定し、全ての行について一括して判定します。
+    #     条件を満たす行を self.data と同じ形式（2 次元配列または ColumnTable）で返します。
+    #     ex: gtfs.stop_times.filterBy(stop_id=IsIn(targetStopIDs))
+    def filterBy(self,update=True,**inConditions):
+        return self.filterByMask(self.getMask(**inConditions),update=update)
+
+    # bool 型の配列 inMask が True の行に絞り込む
+    def filterByMask(self,inMask,update=True):
+        if self.valid==False: return None
+        filtered=self.data[np.flatnonzero(inMask)]
+        if update:
+            self.gtfs.replaceFiltered_agency()
+            self.data=filtered
+        return filtered
+
     # ex: filter(lambda inGTFS,inRecord: inRecord.id=='0001')
     def filter(self,inPredicate,update=True):
         self.gtfs.replaceFiltered_agency()
         filtered=[]
+        filteredRowNo=[]
         n=len(self.data)
         for i in range(n):
             record=self.recordClass(self.data[i])
-            if inPredicate(self.gtfs,record): filtered.append(self.data[i])
-        if update: self.data=np.array(filtered)
+            if inPredicate(self.gtfs,record):
+                filtered.append(self.data[i])
+                filteredRowNo.append(i)
+        if update: self.data=self.data[np.array(filteredRowNo,dtype=np.intp)]
         return filtered
 
     def dump(self):
@@ -269,31 +1149,49 @@ class RecordSet:
         else:
             print('NO '+self.fileName)
 
-    def save(self,inZipFileObj):
+    # 説明：
+    #     構成ファイルを zip から展開しながら inChunkSize 行ごとに読み込み、
+    #     DataFrame として順に返します。読み込み済みの self.data とは独立に、
+    #     ファイル全体をメモリ上に保持することなく一度だけ走査する集計に用います。
+    #     columns にフィールド名のリストを指定すると、それらの列のみを読み込みます。
+    #     'time' の列は 0 時からの経過秒数（int32、欠損値は missingSeconds）に変換されます。
+    #     ex: for chunk in gtfs.stop_times.iterChunks(columns=['trip_id','departure_time']): ...
+    def iterChunks(self,inChunkSize=100000,columns=None):
+        if self.valid==False: return
+        for chunk in iterDataFrameChunks(self.zipFileObj,self.fileName,inChunkSize,
+                                         fieldTypes=self.fieldTypes,columns=columns):
+            for name in chunk.columns:
+                if self.fieldTypes.get(name)=='time':
+                    chunk[name]=timeStrArrayToSeconds(chunk[name].to_numpy(dtype=object))
+            yield chunk
+
+    # inCsvChunks には iterCsvChunks で得られる値を指定できる（egGTFS.save を参照）
+    def save(self,inZipFileObj,inCsvChunks=None):
         if self.optional and self.valid==False: return # do nothing
         if self.valid:
             with inZipFileObj.open(self.fileName,"w") as destFile:
-                fieldInfoStr=",".join(self.fieldNameList)
-                destFile.write((fieldInfoStr+"\r\n").encode())
-
-                for record in self.data:
-                    n=len(self.fieldNameList)
-                    s=[0]*n
-                    for i in range(n):
-                        fieldName=self.fieldNameList[i]
-                        t=getattr(self.index,fieldName)
-                        if t<0:
-                            s[i]=""
-                        else:
-                            v=record[t]
-                            if v==None or (isinstance(v,float) and math.isnan(v)):
-                                s[i]=""
-                            else:
-                                s[i]=str(v)
-                    fieldValueStr=",".join(s)
-                    destFile.write((fieldValueStr+"\r\n").encode())
+                for chunk in inCsvChunks if inCsvChunks!=None else self.iterCsvChunks():
+                    destFile.write(chunk)
         else:
             raise RuntimeError("no valid "+self.fileName+" data.")
+
+    # 保存する CSV の内容を、エンコード済みのバイト列として saveChunkSize 行ごとに返す。
+    # 各フィールドの値は列ごとに一括して文字列に変換し、カンマ等を含む値は引用符で囲む。
+    # fieldNameList のうちファイルに存在しないフィールドは空欄となる。
+    saveChunkSize=1<<16
+    def iterCsvChunks(self):
+        yield (",".join(self.fieldNameList)+"\r\n").encode()
+        n=len(self.data)
+        for start in range(0,n,RecordSet.saveChunkSize):
+            rows=self.data[start:start+RecordSet.saveChunkSize]
+            m=len(rows)
+            columns={}
+            for i,fieldName in enumerate(self.fieldNameList):
+                t=getattr(self.index,fieldName)
+                columns[i]=rows[:,t] if t>=0 else np.full(m,"",dtype=object)
+            chunk=pd.DataFrame(columns).to_csv(None,header=False,index=False,na_rep="",
+                                               lineterminator="\r\n",quoting=csv.QUOTE_MINIMAL)
+            yield chunk.encode()
     
 class Record:
     def __setattr__(self,inName,inValue):
@@ -332,27 +1230,28 @@ class SingleRecord:
         else:
             print('NO '+self.fileName)
 
-    def save(self,inZipFileObj):
+    def save(self,inZipFileObj,inCsvChunks=None):
         if self.optional and self.valid!=True: return # do nothing
         if self.valid:
-            fieldInfoStr=",".join(self.fieldNameList)
-
-            valueList=[]
-            for fieldName in self.fieldNameList:
-                v=getattr(self,fieldName)
-                if v==None or (isinstance(v,float) and math.isnan(v)):
-                    valueStr=""
-                else:
-                    valueStr=str(v)
-                valueList.append(valueStr)
-            fieldValueStr=",".join(valueList)
-            
             with inZipFileObj.open(self.fileName,"w") as destFile:
-                destFile.write((fieldInfoStr+"\r\n").encode())
-                destFile.write((fieldValueStr+"\r\n").encode())
+                for chunk in inCsvChunks if inCsvChunks!=None else self.iterCsvChunks():
+                    destFile.write(chunk)
         else:
             raise RuntimeError("no valid agency data.")
 
+    def iterCsvChunks(self):
+        valueList=[]
+        for fieldName in self.fieldNameList:
+            v=getattr(self,fieldName)
+            if v==None or (isinstance(v,float) and math.isnan(v)):
+                valueStr=""
+            else:
+                valueStr=str(v)
+            valueList.append(valueStr)
+        buf=StringIO()
+        csv.writer(buf,lineterminator="\r\n").writerow(valueList)
+        yield (",".join(self.fieldNameList)+"\r\n"+buf.getvalue()).encode()
+
 # -------------------------------------------------------------------
 
 # 点 (x1,y1) と (x2,y2) を通る直線と点 (x,y) との距離を返す
@@ -391,6 +1290,456 @@ def sqrDistPos(inPos1,inPos2):
     dy=inPos1[1]-inPos2[1]
     return dx*dx+dy*dy
 
+# 点列 (inLat[i],inLon[i]) に対し、点 (inPointLat[j],inPointLon[j]) それぞれについて、
+# getNearestPosOnSegment による垂線の足が求まる線分のうち最も近い線分と、
+# 最も近い点列の点を inSearchFrom 番目以降から探す（getNearestPos と
+# getNearestShapePointIndex をまとめて計算するもの）。
+# segmentIndex に点列 (inLat,inLon) の SegmentGridIndex を指定した場合は、
+# 各点の周囲の格子に登録された線分とその端点のみを候補とする（結果は指定しない場合と同じ）。
+# ただし、点の数 × 線分の数が nearestSegmentsDenseMaxSize 以下の場合は全ての組を計算する。
+# return segmentIndex(-1: なし),segmentDist,footLat,footLon,nearestPointIndex
+def getNearestSegmentsAndPoints(inLat,inLon,inPointLat,inPointLon,inSearchFrom=0,segmentIndex=None):
+    if segmentIndex is not None and len(inLat)-inSearchFrom>=2 and \
+       len(inPointLat)*(len(inLat)-inSearchFrom-1)>nearestSegmentsDenseMaxSize and \
+       not np.isnan(np.asarray(inLat,dtype=float)).any() and \
+       not np.isnan(np.asarray(inLon,dtype=float)).any() and \
+       not np.isnan(np.asarray(inPointLat,dtype=float)).any() and \
+       not np.isnan(np.asarray(inPointLon,dtype=float)).any():
+        return getNearestSegmentsAndPointsInCells(inLat,inLon,inPointLat,inPointLon,inSearchFrom,segmentIndex)
+    lat=np.asarray(inLat,dtype=float)[inSearchFrom:]
+    lon=np.asarray(inLon,dtype=float)[inSearchFrom:]
+    pointLat=np.asarray(inPointLat,dtype=float)[:,None]
+    pointLon=np.asarray(inPointLon,dtype=float)[:,None]
+    numOfPoints=len(pointLat)
+
+    d2=(lat-pointLat)**2+(lon-pointLon)**2
+    nearestPointIndex=np.argmin(d2,axis=1)+inSearchFrom if len(lat)>0 \
+                      else np.full(numOfPoints,inSearchFrom)
+
+    segmentIndex=np.full(numOfPoints,-1)
+    segmentDist=np.full(numOfPoints,np.inf)
+    footLat=np.full(numOfPoints,np.nan); footLon=np.full(numOfPoints,np.nan)
+    if len(lat)<2: return segmentIndex,segmentDist,footLat,footLon,nearestPointIndex
+    x1=lat[:-1]; y1=lon[:-1]
+    p=lat[1:]-x1; q=lon[1:]-y1
+    norm=np.sqrt(p*p+q*q)
+    valid=norm>0
+    norm=np.where(valid,norm,1)
+    tx=pointLat-x1; ty=pointLon-y1
+    d1=tx*p+ty*q
+    d2=(pointLat-lat[1:])*(-p)+(pointLon-lon[1:])*(-q)
+    onSegment=valid & (0<d1) & (0<d2)
+    dist=np.where(onSegment,np.abs(q*tx-p*ty)/norm,np.inf)
+    best=np.argmin(dist,axis=1)
+    bestDist=dist[np.arange(numOfPoints),best]
+    found=np.isfinite(bestDist)
+    t=d1[np.arange(numOfPoints),best]/norm[best]
+    segmentIndex[found]=best[found]+inSearchFrom
+    segmentDist[found]=bestDist[found]
+    footLat[found]=(p[best]*t+x1[best])[found]
+    footLon[found]=(q[best]*t+y1[best])[found]
+    return segmentIndex,segmentDist,footLat,footLon,nearestPointIndex
+
+# getNearestSegmentsAndPoints で、全ての組（点 × 線分）を計算する大きさの上限
+nearestSegmentsDenseMaxSize=1<<16
+
+# getNearestSegmentsAndPoints と同じ結果を、inSegmentIndex（SegmentGridIndex）の格子を用いて求める。
+# 緯度経度上の探索半径 r を格子の大きさから倍々に広げ、r の範囲を囲む格子に登録された線分と
+# その端点のみについて同じ式で距離を計算する。最も近い点と線分がともに r 以内にある問い合わせ点
+# （範囲外の点や線分の方が近いことはない）と、範囲が全ての点を囲む問い合わせ点から確定する。
+# 距離が等しい場合は番号の小さいものとする。
+def getNearestSegmentsAndPointsInCells(inLat,inLon,inPointLat,inPointLon,inSearchFrom,inSegmentIndex):
+    index=inSegmentIndex
+    lat=np.asarray(inLat,dtype=float); lon=np.asarray(inLon,dtype=float)
+    pointLat=np.asarray(inPointLat,dtype=float).reshape(-1)
+    pointLon=np.asarray(inPointLon,dtype=float).reshape(-1)
+    numOfPoints=len(pointLat)
+    segmentIndex=np.full(numOfPoints,-1)
+    segmentDist=np.full(numOfPoints,np.inf)
+    footLat=np.full(numOfPoints,np.nan); footLon=np.full(numOfPoints,np.nan)
+    nearestPointIndex=np.full(numOfPoints,inSearchFrom)
+    # 問い合わせ点 q ごとに最小の値 inValue をとる候補（同じ値の場合は番号 inNo の小さいもの）の位置を返す
+    def getFirst(inQ,inValue,inNo):
+        order=np.lexsort((inNo,inValue,inQ))
+        return order[np.r_[True,inQ[order][1:]!=inQ[order][:-1]]] if len(order)>0 else order
+    qx,qy=index.project(pointLat,pointLon)
+    xMin,xMax,yMin,yMax=index.x.min(),index.x.max(),index.y.min(),index.y.max()
+    # 緯度経度と投影面との変換の丸め誤差を吸収するため、候補の範囲をわずかに広げる
+    margin=1+1e-6
+    radius=index.cellSize/index.metersPerDegree
+    pending=np.arange(numOfPoints)
+    while len(pending)>0:
+        rx=radius*index.scale*index.metersPerDegree*margin
+        ry=radius*index.metersPerDegree*margin
+        px,py=qx[pending],qy[pending]
+        x0,y0=index.getCell(px-rx,py-ry)
+        x1,y1=index.getCell(px+rx,py+ry)
+        q,segs=index.getCandidatesInCells(x0,y0,x1,y1)
+        covers=(px-rx<=xMin) & (xMax<=px+rx) & (py-ry<=yMin) & (yMax<=py+ry)
+
+        # 最も近い点（候補の線分の端点）
+        qp=np.concatenate((q,q)); j=np.concatenate((segs,segs+1))
+        keep=j>=inSearchFrom
+        qp,j=qp[keep],j[keep]
+        d2=(lat[j]-pointLat[pending[qp]])**2+(lon[j]-pointLon[pending[qp]])**2
+        first=getFirst(qp,d2,j)
+        bestPoint=np.full(len(pending),-1); bestPointDist2=np.full(len(pending),np.inf)
+        bestPoint[qp[first]]=j[first]; bestPointDist2[qp[first]]=d2[first]
+
+        # 垂線の足が求まる最も近い線分（getNearestSegmentsAndPoints と同じ式）
+        keep=segs>=inSearchFrom
+        qs,s=q[keep],segs[keep]
+        x1=lat[s]; y1=lon[s]
+        p=lat[s+1]-x1; q_=lon[s+1]-y1
+        norm=np.sqrt(p*p+q_*q_)
+        valid=norm>0
+        norm=np.where(valid,norm,1)
+        targetLat=pointLat[pending[qs]]; targetLon=pointLon[pending[qs]]
+        tx=targetLat-x1; ty=targetLon-y1
+        d1=tx*p+ty*q_
+        d2=(targetLat-lat[s+1])*(-p)+(targetLon-lon[s+1])*(-q_)
+        onSegment=valid & (0<d1) & (0<d2)
+        dist=np.abs(q_*tx-p*ty)/norm
+        k=np.flatnonzero(onSegment)
+        k=k[getFirst(qs[k],dist[k],s[k])]
+        bestSeg=np.full(len(pending),-1); bestSegDist=np.full(len(pending),np.inf)
+        bestSeg[qs[k]]=s[k]; bestSegDist[qs[k]]=dist[k]
+        t=np.full(len(pending),np.nan); t[qs[k]]=d1[k]/norm[k]
+
+        done=covers | ((bestPointDist2<=radius*radius) & (bestSegDist<=radius))
+        target=pending[done]
+        nearestPointIndex[target]=bestPoint[done]
+        found=done & (bestSeg>=0)
+        target=pending[found]
+        best=bestSeg[found]
+        segmentIndex[target]=best
+        segmentDist[target]=bestSegDist[found]
+        footLat[target]=(lat[best+1]-lat[best])*t[found]+lat[best]
+        footLon[target]=(lon[best+1]-lon[best])*t[found]+lon[best]
+        pending=pending[~done]
+        radius*=2
+    return segmentIndex,segmentDist,footLat,footLon,nearestPointIndex
+
+# 地球の平均半径 [m]
+earthRadius=6371008.8
+
+# 2 点間（配列可）の大円距離をメートル単位で返す（haversine 公式）
+def haversineDistance(inLat1,inLon1,inLat2,inLon2):
+    lat1=np.radians(inLat1); lat2=np.radians(inLat2)
+    dLat=lat2-lat1
+    dLon=np.radians(np.asarray(inLon2,dtype=float)-np.asarray(inLon1,dtype=float))
+    a=np.sin(dLat/2)**2+np.cos(lat1)*np.cos(lat2)*np.sin(dLon/2)**2
+    return 2*earthRadius*np.arcsin(np.sqrt(np.minimum(a,1.0)))
+
+# WGS-84 楕円体
+wgs84A=6378137.0
+wgs84F=1/298.257223563
+wgs84B=wgs84A*(1-wgs84F)
+
+# 2 点間（配列可）の楕円体上の距離をメートル単位で返す（Vincenty の逆解法）。
+# 収束しない点の組（ほぼ対蹠点となる場合）は geopy の geodesic にて計算する。
+def vincentyDistance(inLat1,inLon1,inLat2,inLon2,maxIteration=100,tolerance=1e-12):
+    lat1,lon1,lat2,lon2=np.broadcast_arrays(*[np.asarray(t,dtype=float) for t in (inLat1,inLon1,inLat2,inLon2)])
+    f=wgs84F
+    L=np.radians(lon2-lon1)
+    U1=np.arctan((1-f)*np.tan(np.radians(lat1)))
+    U2=np.arctan((1-f)*np.tan(np.radians(lat2)))
+    sinU1,cosU1=np.sin(U1),np.cos(U1)
+    sinU2,cosU2=np.sin(U2),np.cos(U2)
+    lam=L
+    for _ in range(maxIteration):
+        sinLam,cosLam=np.sin(lam),np.cos(lam)
+        sinSigma=np.sqrt((cosU2*sinLam)**2+(cosU1*sinU2-sinU1*cosU2*cosLam)**2)
+        cosSigma=sinU1*sinU2+cosU1*cosU2*cosLam
+        sigma=np.arctan2(sinSigma,cosSigma)
+        sinAlpha=np.where(sinSigma>0,cosU1*cosU2*sinLam/np.where(sinSigma>0,sinSigma,1),0.0)
+        cos2Alpha=1-sinAlpha**2
+        cos2SigmaM=np.where(cos2Alpha>0,cosSigma-2*sinU1*sinU2/np.where(cos2Alpha>0,cos2Alpha,1),0.0)
+        C=f/16*cos2Alpha*(4+f*(4-3*cos2Alpha))
+        prevLam=lam
+        lam=L+(1-C)*f*sinAlpha*(sigma+C*sinSigma*(cos2SigmaM+C*cosSigma*(-1+2*cos2SigmaM**2)))
+        notConverged=np.abs(lam-prevLam)>tolerance
+        if not notConverged.any(): break
+    uSq=cos2Alpha*(wgs84A**2-wgs84B**2)/wgs84B**2
+    A=1+uSq/16384*(4096+uSq*(-768+uSq*(320-175*uSq)))
+    B=uSq/1024*(256+uSq*(-128+uSq*(74-47*uSq)))
+    deltaSigma=B*sinSigma*(cos2SigmaM+B/4*(cosSigma*(-1+2*cos2SigmaM**2)
+               -B/6*cos2SigmaM*(-3+4*sinSigma**2)*(-3+4*cos2SigmaM**2)))
+    ret=np.asarray(wgs84B*A*(sigma-deltaSigma),dtype=float)
+    fallback=notConverged | (np.abs(lam)>math.pi)
+    if fallback.any():
+        ret=ret.copy()
+        for i in ([()] if ret.ndim==0 else map(tuple,np.argwhere(fallback))):
+            ret[i]=geodesic((lat1[i],lon1[i]),(lat2[i],lon2[i])).m
+    return ret
+
+# 距離の計算方法：
+#   'geodesic'  : WGS-84 楕円体上の距離（geopy の geodesic とほぼ同じ値）
+#   'haversine' : 球面上の大円距離（高速だが 0.5% 程度の誤差がある）
+distanceModeList=('geodesic','haversine')
+
+# 2 点間（配列可）の距離をメートル単位で返す。
+def segmentDistances(inLat1,inLon1,inLat2,inLon2,distanceMode='geodesic'):
+    if distanceMode=='haversine': return haversineDistance(inLat1,inLon1,inLat2,inLon2)
+    if distanceMode=='geodesic':  return vincentyDistance(inLat1,inLon1,inLat2,inLon2)
+    raise ValueError('invalid distanceMode: '+str(distanceMode))
+
+# [[lat1,lon1],[lat2,lon2],...] なる点列の、各点の先頭からの累積距離 [m] を返す。
+def polylineCumulativeDistances(inPosList,distanceMode='geodesic'):
+    pos=np.asarray(inPosList,dtype=float).reshape(-1,2)
+    ret=np.zeros(len(pos))
+    if len(pos)>1:
+        ret[1:]=np.cumsum(segmentDistances(pos[:-1,0],pos[:-1,1],pos[1:,0],pos[1:,1],
+                                           distanceMode=distanceMode))
+    return ret
+
+# inOffsets で区切られた複数の点列（CSR 形式）それぞれについて、
+# 各点の、その点列の始点からの累積距離 [m] を返す。
+def cumulativeDistances(inLat,inLon,inOffsets,distanceMode='geodesic'):
+    n=len(inLat)
+    d=np.zeros(n)
+    if n>1: d[1:]=segmentDistances(inLat[:-1],inLon[:-1],inLat[1:],inLon[1:],distanceMode=distanceMode)
+    counts=np.diff(inOffsets)
+    starts=np.asarray(inOffsets[:-1])[counts>0]
+    d[starts]=0
+    cum=np.cumsum(d)
+    return cum-np.repeat(cum[starts],counts[counts>0])
+
+# 緯度経度の点列（inCumDist はその累積距離）に対し、点 (inPointLat[i],inPointLon[i])
+# を順に投影し、点列の始点から投影位置までの距離 [m] の配列を返す。
+# 各点は、ひとつ前の点の投影位置よりも後ろ（点列の進行方向）に投影される。
+def projectPointsOnPolyline(inLat,inLon,inCumDist,inPointLat,inPointLon):
+    numOfPoints=len(inPointLat)
+    if len(inLat)==0: return np.full(numOfPoints,np.nan)
+    if len(inLat)==1: return np.zeros(numOfPoints)
+    scale=math.cos(math.radians(float(np.mean(inLat))))
+    x=np.asarray(inLon,dtype=float)*scale; y=np.asarray(inLat,dtype=float)
+    x1=x[:-1]; y1=y[:-1]
+    dx=x[1:]-x1; dy=y[1:]-y1
+    segLen2=dx*dx+dy*dy
+    tx=np.asarray(inPointLon,dtype=float)[:,None]*scale-x1
+    ty=np.asarray(inPointLat,dtype=float)[:,None]-y1
+    t=np.clip((tx*dx+ty*dy)/np.where(segLen2>0,segLen2,1),0,1)
+    ex=tx-t*dx; ey=ty-t*dy
+    dist2=ex*ex+ey*ey
+    along=inCumDist[:-1]+t*np.diff(inCumDist)
+    ret=np.empty(numOfPoints)
+    prevSeg=0; prevAlong=0.0
+    for i in range(numOfPoints):
+        k=prevSeg+int(np.argmin(dist2[i,prevSeg:]))
+        prevAlong=max(float(along[i,k]),prevAlong)
+        ret[i]=prevAlong; prevSeg=k
+    return ret
+
+# 格子状の空間インデックスの基底クラス。
+# 格子の番号 (x,y) をキーとし、空でない格子のみについて、その格子に登録された
+# 要素の番号を self.rows[self.starts[i]:self.ends[i]] として連続して保持する。
+class GridIndex:
+    keyOffset=1<<31
+
+    def getCellKey(self,inX,inY):
+        return ((inY+GridIndex.keyOffset)<<32)+(inX+GridIndex.keyOffset)
+
+    # 要素の番号の配列 inRows と、それぞれが登録される格子の番号から索引を作成する。
+    def setCells(self,inRows,inX,inY):
+        keys=self.getCellKey(inX,inY)
+        order=np.argsort(keys,kind='stable')
+        self.rows=inRows[order]
+        self.keys,self.starts=np.unique(keys[order],return_index=True)
+        self.ends=np.append(self.starts[1:],len(self.rows))
+        self.allRows=np.unique(inRows)
+
+    # 問い合わせ q ごとに格子の範囲 [inX0[q],inX1[q]]×[inY0[q],inY1[q]] に登録された
+    # 要素の組 (q,要素の番号) を返す（同じ要素が複数の格子に登録されている場合は重複する）。
+    # 格子の数が空でない格子の数より多い場合は、全ての要素を候補とする。
+    def getCandidatesInCells(self,inX0,inY0,inX1,inY1):
+        numOfQueries=len(inX0)
+        nx=inX1-inX0+1; ny=inY1-inY0+1
+        numOfCells=nx*ny
+        whole=numOfCells>len(self.keys)
+        numOfCells[whole]=0
+        q=np.repeat(np.arange(numOfQueries),numOfCells)
+        local=np.arange(len(q))-np.repeat(np.cumsum(numOfCells)-numOfCells,numOfCells)
+        keys=self.getCellKey(inX0[q]+local%nx[q],inY0[q]+local//nx[q])
+        pos=np.minimum(np.searchsorted(self.keys,keys),max(len(self.keys)-1,0))
+        hit=self.keys[pos]==keys if len(self.keys)>0 else np.zeros(len(keys),dtype=bool)
+        q,pos=q[hit],pos[hit]
+        counts=self.ends[pos]-self.starts[pos]
+        local=np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)
+        rows=self.rows[np.repeat(self.starts[pos],counts)+local]
+        q=np.repeat(q,counts)
+        wholeQ=np.flatnonzero(whole)
+        if len(wholeQ)>0:
+            q=np.concatenate((q,np.repeat(wholeQ,len(self.allRows))))
+            rows=np.concatenate((rows,np.tile(self.allRows,len(wholeQ))))
+        return q,rows
+
+# 緯度経度の点の集合に対する格子状の空間インデックス。
+# 点を緯度・経度方向に一定の間隔（cellSize [m] 以上）の格子に分け、格子ごとに
+# 点の番号を連続して保持する（空でない格子のみを保持するため、広域の点群にも対応する）。
+# 検索は、指定した半径を囲む格子の点のみを候補として距離を計算することで行う。
+# 問い合わせ点は配列で与えることができ、全ての問い合わせを一括して処理する。
+class PointGridIndex(GridIndex):
+    # 楕円体上の距離と球面上の距離との差を吸収するため、候補の範囲を広げる割合
+    searchMargin=1.01
+
+    def __init__(self,inLat,inLon,cellSize=None):
+        self.lat=np.asarray(inLat,dtype=float)
+        self.lon=np.asarray(inLon,dtype=float)
+        valid=np.flatnonzero(~(np.isnan(self.lat) | np.isnan(self.lon)))
+        self.numOfPoints=len(valid)
+        lat,lon=self.lat[valid],self.lon[valid]
+        metersPerDegree=math.radians(earthRadius)
+        if cellSize==None:
+            cellSize=1000.0
+            if len(valid)>0:
+                h=(lat.max()-lat.min())*metersPerDegree
+                w=(lon.max()-lon.min())*metersPerDegree*math.cos(math.radians(float(lat.mean())))
+                cellSize=max(100.0,2*math.sqrt(max(h*w,1.0)/len(valid)))
+        self.cellSize=cellSize
+        maxAbsLat=min(float(np.abs(lat).max()),89.0) if len(valid)>0 else 0.0
+        self.cellLat=cellSize/metersPerDegree
+        self.cellLon=cellSize/(metersPerDegree*math.cos(math.radians(maxAbsLat)))
+        self.setCells(valid,*self.getCell(lat,lon))
+
+    def getCell(self,inLat,inLon):
+        return np.floor(inLon/self.cellLon).astype(np.int64),np.floor(inLat/self.cellLat).astype(np.int64)
+
+    # 問い合わせ点 q から半径 inRadius[q] の範囲にある可能性のある点の組 (q,点の番号) を返す
+    def getCandidates(self,inLat,inLon,inRadius):
+        rLat=inRadius*PointGridIndex.searchMargin/math.radians(earthRadius)
+        cosLat=np.cos(np.radians(np.minimum(np.abs(inLat)+rLat,89.0)))
+        rLon=rLat/cosLat
+        x0,y0=self.getCell(inLat-rLat,inLon-rLon)
+        x1,y1=self.getCell(inLat+rLat,inLon+rLon)
+        return self.getCandidatesInCells(x0,y0,x1,y1)
+
+    # 説明：
+    #     問い合わせ点（配列）のそれぞれから半径 inRadius [m] 以内にある点を求め、
+    #     (問い合わせ点の番号,点の番号,距離 [m]) の配列の組を
+    #     問い合わせ点の番号、距離の昇順で返す。
+    def within(self,inLat,inLon,inRadius,distanceMode='geodesic'):
+        lat=np.atleast_1d(np.asarray(inLat,dtype=float))
+        lon=np.atleast_1d(np.asarray(inLon,dtype=float))
+        radius=np.broadcast_to(np.asarray(inRadius,dtype=float),lat.shape)
+        q,rows=self.getCandidates(lat,lon,radius)
+        d=np.asarray(segmentDistances(lat[q],lon[q],self.lat[rows],self.lon[rows],
+                                      distanceMode=distanceMode),dtype=float).reshape(-1)
+        keep=d<=radius[q]
+        q,rows,d=q[keep],rows[keep],d[keep]
+        order=np.lexsort((rows,d,q))
+        return q[order],rows[order],d[order]
+
+    # 説明：
+    #     問い合わせ点（配列）のそれぞれについて、近い順に inK 個の点を求め、
+    #     点の番号と距離 [m] を (問い合わせ点の数,inK) の配列で返す。
+    #     点の数が inK に満たない場合、残りの番号は -1、距離は inf となる。
+    #     探索半径を cellSize から倍々に広げ、inK 個の点が見つかった問い合わせから確定する。
+    def nearest(self,inLat,inLon,inK=1,distanceMode='geodesic'):
+        lat=np.atleast_1d(np.asarray(inLat,dtype=float))
+        lon=np.atleast_1d(np.asarray(inLon,dtype=float))
+        numOfQueries=len(lat)
+        retRows=np.full((numOfQueries,inK),-1,dtype=np.int64)
+        retDist=np.full((numOfQueries,inK),np.inf)
+        k=min(inK,self.numOfPoints)
+        pending=np.flatnonzero(~(np.isnan(lat) | np.isnan(lon))) if k>0 else np.zeros(0,dtype=np.int64)
+        radius=self.cellSize
+        while len(pending)>0:
+            q,rows,d=self.within(lat[pending],lon[pending],radius,distanceMode=distanceMode)
+            counts=np.bincount(q,minlength=len(pending))
+            done=counts>=k
+            rank=np.arange(len(q))-np.repeat(np.cumsum(counts)-counts,counts)
+            take=done[q] & (rank<k)
+            retRows[pending[q[take]],rank[take]]=rows[take]
+            retDist[pending[q[take]],rank[take]]=d[take]
+            pending=pending[~done]
+            radius*=2
+        return retRows,retDist
+
+# 折れ線（shape の点列）の線分に対する格子状の空間インデックス。
+# 点列の重心を原点とする局所的な正距円筒図法で平面 [m] に投影し、
+# 各線分をその外接矩形と重なる全ての格子に登録する。
+# 最近傍の線分の検索は、探索範囲を cellSize から倍々に広げながら、
+# 範囲内の格子に登録された線分のみについて距離を計算することで行う。
+class SegmentGridIndex(GridIndex):
+    def __init__(self,inLat,inLon,cellSize=None):
+        lat=np.asarray(inLat,dtype=float)
+        lon=np.asarray(inLon,dtype=float)
+        self.numOfPoints=len(lat)
+        valid=~(np.isnan(lat) | np.isnan(lon))
+        self.metersPerDegree=math.radians(earthRadius)
+        self.originLat=float(lat[valid].mean()) if valid.any() else 0.0
+        self.originLon=float(lon[valid].mean()) if valid.any() else 0.0
+        self.scale=math.cos(math.radians(min(abs(self.originLat),89.0)))
+        self.x,self.y=self.project(lat,lon)
+
+        segs=np.flatnonzero(valid[:-1] & valid[1:])
+        self.numOfSegments=len(segs)
+        x1,y1=self.x[segs],self.y[segs]
+        x2,y2=self.x[segs+1],self.y[segs+1]
+        if cellSize==None:
+            cellSize=100.0
+            if len(segs)>0: cellSize=max(20.0,2*float(np.median(np.hypot(x2-x1,y2-y1))))
+        self.cellSize=cellSize
+
+        cx0,cy0=self.getCell(np.minimum(x1,x2),np.minimum(y1,y2))
+        cx1,cy1=self.getCell(np.maximum(x1,x2),np.maximum(y1,y2))
+        nx=cx1-cx0+1
+        counts=nx*(cy1-cy0+1)
+        i=np.repeat(np.arange(len(segs)),counts)
+        local=np.arange(len(i))-np.repeat(np.cumsum(counts)-counts,counts)
+        self.setCells(segs[i],cx0[i]+local%nx[i],cy0[i]+local//nx[i])
+
+    def project(self,inLat,inLon):
+        return (np.asarray(inLon,dtype=float)-self.originLon)*self.scale*self.metersPerDegree, \
+               (np.asarray(inLat,dtype=float)-self.originLat)*self.metersPerDegree
+
+    def getCell(self,inX,inY):
+        return np.floor(inX/self.cellSize).astype(np.int64),np.floor(inY/self.cellSize).astype(np.int64)
+
+    # 投影後の点 (inX,inY) から線分 inSeg（点 inSeg と点 inSeg+1 を結ぶ線分）への
+    # 垂線の足の位置（線分上の比率 t in [0,1]）と距離の二乗を返す。
+    def footOnSegments(self,inX,inY,inSeg):
+        x1,y1=self.x[inSeg],self.y[inSeg]
+        dx=self.x[inSeg+1]-x1; dy=self.y[inSeg+1]-y1
+        len2=dx*dx+dy*dy
+        t=np.clip(((inX-x1)*dx+(inY-y1)*dy)/np.where(len2>0,len2,1),0,1)
+        ex=inX-x1-t*dx; ey=inY-y1-t*dy
+        return t,ex*ex+ey*ey
+
+    # 説明：
+    #     問い合わせ点（配列）のそれぞれについて最も近い線分を求め、
+    #     (線分の番号,線分上の比率 t,投影面上の距離 [m]) の配列の組を返す。
+    #     距離が等しい線分が複数ある場合は番号の小さい線分を返す。
+    #     線分が無い場合や問い合わせ点が NaN の場合、番号は -1、t は NaN、距離は inf となる。
+    def nearest(self,inLat,inLon):
+        qx,qy=self.project(np.atleast_1d(inLat),np.atleast_1d(inLon))
+        numOfQueries=len(qx)
+        retSeg=np.full(numOfQueries,-1,dtype=np.int64)
+        retT=np.full(numOfQueries,np.nan)
+        retDist=np.full(numOfQueries,np.inf)
+        pending=np.flatnonzero(~(np.isnan(qx) | np.isnan(qy))) if self.numOfSegments>0 \
+                else np.zeros(0,dtype=np.int64)
+        radius=self.cellSize
+        while len(pending)>0:
+            px,py=qx[pending],qy[pending]
+            x0,y0=self.getCell(px-radius,py-radius)
+            x1,y1=self.getCell(px+radius,py+radius)
+            q,segs=self.getCandidatesInCells(x0,y0,x1,y1)
+            t,d2=self.footOnSegments(px[q],py[q],segs)
+            order=np.lexsort((segs,d2,q))
+            q,segs,t,d2=q[order],segs[order],t[order],d2[order]
+            first=np.flatnonzero(np.r_[True,q[1:]!=q[:-1]]) if len(q)>0 else np.zeros(0,dtype=np.int64)
+            q,segs,t,d=q[first],segs[first],t[first],np.sqrt(d2[first])
+            # 探索範囲内で見つかった線分は、範囲外のどの線分よりも近い
+            take=d<=radius
+            target=pending[q[take]]
+            retSeg[target],retT[target],retDist[target]=segs[take],t[take],d[take]
+            done=np.zeros(len(pending),dtype=bool)
+            done[q[take]]=True
+            pending=pending[~done]
+            radius*=2
+        return retSeg,retT,retDist
 
 #--------------------------------------------------------------------
 # for agency.txt
@@ -416,13 +1765,20 @@ class agency_jp(SingleRecord):
 # for stops.txt
 #--------------------------------------------------------------------
 class stops(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'stops.txt',
                          ['stop_id','stop_code','stop_name','stop_desc',
                           'stop_lat','stop_lon','zone_id','stop_url',
                           'location_type','parent_station','stop_timezone',
                           'wheelchair_boarding','platform_code'],
-                         'stop_id',stops_record)
+                         'stop_id',stops_record,
+                         fieldTypes={'stop_id':'id','stop_code':'id','stop_name':'str',
+                                     'stop_lat':'float','stop_lon':'float','zone_id':'id',
+                                     'location_type':'int','parent_station':'id',
+                                     'wheelchair_boarding':'int'},
+                         **inOptions)
+        self._gridIndex=None
+        self._gridIndexSource=None
 
     # [ latitude,longitude ]
     def pos(self,inStop): return [inStop[self.index.stop_lat],
@@ -434,7 +1790,9 @@ class stops(RecordSet):
     def name(self,inRecordOrNo): return self.stop_name(inRecordOrNo)
 
     def getByStopID(self,inStopID):
-        return self.data[self.data[:,self.index.stop_id]==inStopID][0]
+        records=self.getRowsByKey(inStopID)
+        if records is None: raise IndexError('no such a stop ID: '+str(inStopID))
+        return records[0]
 
     def getPosByStopID(self,inStopID):
         stop=self.getByStopID(inStopID)
@@ -444,6 +1802,43 @@ class stops(RecordSet):
         stop=self.getByStopID(inStopID)
         return self.stop_name(stop)
 
+    # 停留所の位置の空間インデックス（PointGridIndex）を返す（最初の呼び出し時に作成する）。
+    def getGridIndex(self):
+        if self.valid==False: return None
+        if self._gridIndex is None or self._gridIndexSource is not self.data:
+            self._gridIndex=PointGridIndex(self.getColumn('stop_lat').astype(float),
+                                           self.getColumn('stop_lon').astype(float))
+            self._gridIndexSource=self.data
+        return self._gridIndex
+
+    # 行番号の配列（-1 は該当なし）を stop_id の配列に変換する（該当なしは None）
+    def rowNosToStopIDs(self,inRowNos):
+        stopIDs=np.append(np.asarray(self.getColumn('stop_id'),dtype=object),None)
+        return stopIDs[inRowNos]
+
+    # 説明：
+    #     指定した位置から近い順に k 個の停留所を求め、stop_id と距離 [m] の配列の組を返します。
+    #     緯度・経度に配列を指定した場合は、それぞれ (問い合わせ点の数,k) の配列となります。
+    #     停留所の数が k に満たない場合、残りの stop_id は None、距離は inf となります。
+    #     ex: stopIDs,dists=gtfs.stops.nearest(39.7167,140.1167,k=3)
+    def nearest(self,inLat,inLon,k=1):
+        rows,dist=self.getGridIndex().nearest(inLat,inLon,k,distanceMode=self.getDistanceMode())
+        stopIDs=self.rowNosToStopIDs(rows)
+        if np.ndim(inLat)==0: return stopIDs[0],dist[0]
+        return stopIDs,dist
+
+    # 説明：
+    #     指定した位置から半径 inRadius [m] 以内の停留所を求め、
+    #     stop_id と距離 [m] の配列の組を距離の昇順で返します。
+    #     緯度・経度に配列を指定した場合は、(問い合わせ点の番号,stop_id,距離) の配列の組を
+    #     問い合わせ点の番号、距離の昇順で返します。
+    #     ex: stopIDs,dists=gtfs.stops.within(39.7167,140.1167,300)
+    def within(self,inLat,inLon,inRadius):
+        q,rows,dist=self.getGridIndex().within(inLat,inLon,inRadius,distanceMode=self.getDistanceMode())
+        stopIDs=self.rowNosToStopIDs(rows)
+        if np.ndim(inLat)==0: return stopIDs,dist
+        return q,stopIDs,dist
+
 class stops_record(Record): pass
 
 
@@ -451,13 +1846,16 @@ class stops_record(Record): pass
 # for routes.txt
 #--------------------------------------------------------------------
 class routes(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'routes.txt',
                          ['route_id','agency_id',
                           'route_short_name','route_long_name',
                           'route_desc','route_type','route_url','route_color',
                           'route_text_color','jp_parent_route_id'],
-                          'route_id',routes_record)
+                          'route_id',routes_record,
+                         fieldTypes={'route_id':'id','agency_id':'id','route_type':'int',
+                                     'jp_parent_route_id':'id'},
+                         **inOptions)
 
 class routes_record(Record): pass
 
@@ -466,12 +1864,14 @@ class routes_record(Record): pass
 # for routes_jp.txt
 #--------------------------------------------------------------------
 class routes_jp(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'routes_jp.txt',
                          ['route_id','route_update_date',
                           'origin_stop','via_stop','destination_stop'],
                           'route_id',routes_jp_record,
-                          optional=True)
+                          optional=True,
+                         fieldTypes={'route_id':'id'},
+                         **inOptions)
 
 class routes_jp_record(Record): pass
 
@@ -480,13 +1880,18 @@ class routes_jp_record(Record): pass
 # for trips.txt
 #--------------------------------------------------------------------
 class trips(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'trips.txt',
                          ['route_id','service_id','trip_id','trip_headsign',
                           'trip_short_name','direction_id','block_id',
                           'shape_id','wheelchair_accessible','bikes_allowed',
                           'jp_trip_desc','jp_trip_desc_symbol','jp_office_id'],
-                         'trip_id',trips_record)
+                         'trip_id',trips_record,
+                         fieldTypes={'route_id':'id','service_id':'id','trip_id':'id',
+                                     'trip_headsign':'id','direction_id':'int','block_id':'id',
+                                     'shape_id':'id','wheelchair_accessible':'int',
+                                     'bikes_allowed':'int','jp_office_id':'id'},
+                         **inOptions)
 
 class trips_record(Record): pass
 
@@ -495,11 +1900,13 @@ class trips_record(Record): pass
 # for office_jp.txt
 #--------------------------------------------------------------------
 class office_jp(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'office_jp.txt',
                          ['office_id','office_name','office_url','office_phone'],
                          'office_id',office_jp_record,
-                         optional=True)
+                         optional=True,
+                         fieldTypes={'office_id':'id'},
+                         **inOptions)
 
 class office_jp_record(Record): pass
 
@@ -508,20 +1915,25 @@ class office_jp_record(Record): pass
 # for stop_times.txt
 #--------------------------------------------------------------------
 class stop_times(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'stop_times.txt',
                          ['trip_id','arrival_time','departure_time',
                           'stop_id','stop_sequence','stop_headsign',
-                          'pickup_type','dtop_off_type','shape_dist_traveled',
+                          'pickup_type','drop_off_type','shape_dist_traveled',
                           'timepoint'],
-                         'trip_id',stop_times_record)
+                         'trip_id',stop_times_record,
+                         sequenceFieldName='stop_sequence',
+                         fieldTypes={'trip_id':'id','arrival_time':'time','departure_time':'time',
+                                     'stop_id':'id','stop_sequence':'int','stop_headsign':'id',
+                                     'pickup_type':'int','drop_off_type':'int',
+                                     'shape_dist_traveled':'float','timepoint':'int'},
+                         **inOptions)
 
     def __getitem__(self,inID):
-        records=getitemBody(self,inID)
+        records=self.getRowsByKey(inID)
         if records is None: return None
-        sortedSeq=records[np.argsort(records[:,self.index.stop_sequence])]
         ret=[]
-        for t in sortedSeq: ret.append(stop_times_record(t))
+        for t in records: ret.append(stop_times_record(t))
         return ret
 
     def arrivalTimeAndDepartureTime(self,inRecord):
@@ -534,34 +1946,44 @@ class stop_times(RecordSet):
     #     返します。なお、返されるリストの行は stop_sequence にて昇順に並び替えら
     #     れています。
     def getSeqByTripID(self,inTripID):
-        if self.valid==False: return []
-        if self.index.trip_id<0: return []
-        extracted=self.data[self.data[:,self.index.trip_id]==inTripID]
-        records=extracted[np.argsort(extracted[:,self.index.stop_sequence])]
+        records=self.getSeqArrayByTripID(inTripID)
         ret=[]
         n=len(records)
         for i in range(n): ret.append(stop_times_record(records[i]))
         return ret
 
+    # 説明：
+    #     getSeqByTripID と同じ並びの stop_times 情報を 2 次元配列で返します。
+    #     stop_times は読み込み時に (trip_id,stop_sequence) で並べ替えられているため、
+    #     返される配列は self.data のビューです（書き換えないで下さい）。
+    def getSeqArrayByTripID(self,inTripID):
+        if self.valid==False: return []
+        if self.index.trip_id<0: return self.data[0:0]
+        records=self.getRowsByKey(inTripID)
+        if records is None: return self.data[0:0]
+        return records
+
+    # 説明：
+    #     指定した trip_id の到着時刻と出発時刻を、0 時からの経過秒数（int32）の
+    #     配列の組として返します（並びは getSeqByTripID と同じ）。
+    #     時刻は読み込み時に変換済みのため、Time オブジェクトは生成しません。
+    #     欠損している時刻は missingSeconds となります。
+    def getSecondsByTripID(self,inTripID):
+        start,end=self.getRowRangeByKey(inTripID)
+        if start is None: return np.zeros(0,dtype=np.int32),np.zeros(0,dtype=np.int32)
+        return self.getColumn('arrival_time')[start:end],self.getColumn('departure_time')[start:end]
+
     def getStartEndRecordsByTime(self,inTripID,inTime):
         tripSeq=self.getSeqByTripID(inTripID)
         n=len(tripSeq)
-        targetTime = inTime if isinstance(inTime,Time) else Time(inTime)
-        segmentStartRecord=None; segmentEndRecord=None
-        found=False
-        for i in range(n-1):
-            r1=tripSeq[i]   # start segment record
-            r2=tripSeq[i+1] # end segment record
-            at1,dt1=self.arrivalTimeAndDepartureTime(r1)
-            at2,dt2=self.arrivalTimeAndDepartureTime(r2)
-            if targetTime<at1 or dt2<targetTime: continue
-            segmentStartRecord=r1; segmentEndRecord=r2
-            found=True
-            break
-        if found: return segmentStartRecord,segmentEndRecord
+        arrival,departure=self.getSecondsByTripID(inTripID)
+        targetSecond=toSeconds(inTime)
+        # 出発時刻は stop_sequence に対して単調増加であるため二分探索で区間を求める
+        i=int(np.searchsorted(departure[1:],targetSecond,side='left'))
+        if i<n-1 and arrival[i]<=targetSecond:
+            return tripSeq[i],tripSeq[i+1]
         lastSegmentRecord=tripSeq[n-1]
-        lastAt,lastDt=self.arrivalTimeAndDepartureTime(lastSegmentRecord)
-        if lastAt<=targetTime and targetTime<=lastDt:
+        if arrival[n-1]<=targetSecond and targetSecond<=departure[n-1]:
             return lastSegmentRecord,lastSegmentRecord
         return None,None
 
@@ -572,11 +1994,16 @@ class stop_times_record(Record): pass
 # for calendar.txt
 #--------------------------------------------------------------------
 class calendar(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'calendar.txt',
                          ['service_id','monday','tuesday','wednesday','thursday',
                           'friday','saturday','sunday','start_date','end_date'],
-                         'service_id',calendar_record)
+                         'service_id',calendar_record,
+                         fieldTypes={'service_id':'id','monday':'int','tuesday':'int',
+                                     'wednesday':'int','thursday':'int','friday':'int',
+                                     'saturday':'int','sunday':'int',
+                                     'start_date':'int','end_date':'int'},
+                         **inOptions)
 
 class calendar_record(Record): pass
 
@@ -585,13 +2012,15 @@ class calendar_record(Record): pass
 # for calendar_dates.txt
 #--------------------------------------------------------------------
 class calendar_dates(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'calendar_dates.txt',
                          ['service_id','date','exception_type'],
-                         'service_id',calendar_dates_record)
+                         'service_id',calendar_dates_record,
+                         fieldTypes={'service_id':'id','date':'int','exception_type':'int'},
+                         **inOptions)
 
     def __getitem__(self,inID):
-        records=getitemBody(self,inID)
+        records=self.getRowsByKey(inID)
         if records is None: return None
         ret=[]
         for t in records: ret.append(calendar_dates_record(t))
@@ -604,11 +2033,14 @@ class calendar_dates_record(Record): pass
 # for fare_attributes.txt
 #--------------------------------------------------------------------
 class fare_attributes(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'fare_attributes.txt',
                          ['fare_id','price','currency_type',
                           'payment_method','transfers','transfer_duration'],
-                         'fare_id',fare_attributes_record)
+                         'fare_id',fare_attributes_record,
+                         fieldTypes={'fare_id':'id','price':'float','payment_method':'int',
+                                     'transfers':'int','transfer_duration':'int'},
+                         **inOptions)
 
 class fare_attributes_record(Record): pass
 
@@ -616,14 +2048,17 @@ class fare_attributes_record(Record): pass
 # for fare_rules.txt
 #--------------------------------------------------------------------
 class fare_rules(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'fare_rules.txt',
                          ['fare_id','route_id','origin_id',
                           'destination_id','contains_id'],
-                         'route_id',fare_rules_record)
+                         'route_id',fare_rules_record,
+                         fieldTypes={'fare_id':'id','route_id':'id','origin_id':'id',
+                                     'destination_id':'id','contains_id':'id'},
+                         **inOptions)
 
     def __getitem__(self,inID):
-        records=getitemBody(self,inID)
+        records=self.getRowsByKey(inID)
         if records is None: return None
         ret=[]
         for t in records: ret.append(fare_rules_record(t))
@@ -635,26 +2070,118 @@ class fare_rules_record(Record): pass
 # for shapes.txt
 #--------------------------------------------------------------------
 class shapes(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'shapes.txt',
                          ['shape_id','shape_pt_lat','shape_pt_lon',
-                          'shape_pt_sequence','shape_dist_traveleded'],
+                          'shape_pt_sequence','shape_dist_traveled'],
                          'shape_id',shapes_record,
-                         optional=True)
+                         optional=True,sequenceFieldName='shape_pt_sequence',
+                         fieldTypes={'shape_id':'id','shape_pt_lat':'float','shape_pt_lon':'float',
+                                     'shape_pt_sequence':'int','shape_dist_traveled':'float'},
+                         **inOptions)
+        self._distanceTable=None
+        self._distanceTableSource=None
+        self._distanceTableMode=None
+        self._segmentIndexes={}
+        self._segmentIndexSource=None
 
     def __getitem__(self,inID):
-        records=getitemBody(self,inID)
+        records=self.getRowsByKey(inID)
         if records is None: return None
-        records[np.argsort(records[:,self.index.shape_pt_sequence])]
         ret=[]
         for t in records: ret.append(shapes_record(t))
         return ret
 
+    # shapes は読み込み時に (shape_id,shape_pt_sequence) で並べ替えられているため、
+    # 返される配列は self.data のビューです（書き換えないで下さい）。
     def getShapeArray(self,inShapeID):
         if self.valid==False: return []
         if self.index.shape_id<0: return []
-        extracted=self.data[self.data[:,self.index.shape_id]==inShapeID]
-        return extracted[np.argsort(extracted[:,self.index.shape_pt_sequence])]
+        extracted=self.getRowsByKey(inShapeID)
+        if extracted is None: return []
+        return extracted
+
+    # 指定した shape ID の点列の緯度と経度を、それぞれ float64 の配列として返す。
+    # 存在しない shape ID の場合は None,None を返す。
+    def getLatLonArray(self,inShapeID):
+        if self.valid==False: return None,None
+        start,end=self.getRowRangeByKey(inShapeID)
+        if start is None: return None,None
+        return self.getColumn('shape_pt_lat')[start:end].astype(float), \
+               self.getColumn('shape_pt_lon')[start:end].astype(float)
+
+    # 全ての shape について、各点の、その shape の始点からの累積距離 [m] を
+    # self.data の行と同じ並びの配列として返す（最初の呼び出し時に一括して計算する）。
+    def getDistanceTable(self):
+        if self.valid==False: return None
+        keyIndex=self.getKeyIndex()
+        if keyIndex is None or keyIndex.order is not None: return None
+        mode=self.getDistanceMode()
+        if self._distanceTable is None or self._distanceTableSource is not self.data \
+           or self._distanceTableMode!=mode:
+            build=lambda: cumulativeDistances(self.getColumn('shape_pt_lat').astype(float),
+                                              self.getColumn('shape_pt_lon').astype(float),
+                                              keyIndex.offsets,distanceMode=mode)
+            if self.isCacheSource():
+                self._distanceTable=self.getCachedArrays('distance.'+mode,
+                                                         lambda: { 'distance':build() })['distance']
+            else:
+                self._distanceTable=build()
+            self._distanceTableSource=self.data
+            self._distanceTableMode=mode
+        return self._distanceTable
+
+    # 指定した shape ID の各点の、始点からの累積距離 [m] を返す。
+    def getCumulativeDistances(self,inShapeID):
+        start,end=self.getRowRangeByKey(inShapeID)
+        if start is None: return None
+        return self.getDistanceTable()[start:end]
+
+    # 指定した shape ID の線分の空間インデックス（SegmentGridIndex）を返す。
+    # shape ごとに最初の呼び出し時に作成する。存在しない shape ID の場合は None を返す。
+    def getSegmentIndex(self,inShapeID):
+        if self._segmentIndexSource is not self.data:
+            self._segmentIndexes={}
+            self._segmentIndexSource=self.data
+        if inShapeID in self._segmentIndexes: return self._segmentIndexes[inShapeID]
+        lat,lon=self.getLatLonArray(inShapeID)
+        if lat is None: return None
+        ret=SegmentGridIndex(lat,lon)
+        self._segmentIndexes[inShapeID]=ret
+        return ret
+
+    # 説明：
+    #     点（[lat,lon] または (N,2) の配列）を指定した shape の上に射影し、
+    #     (線分の番号,射影した点,始点からの距離 [m],点から shape までの距離 [m]) を返します。
+    #     線分の番号 i は shape の i 番目と i+1 番目の点を結ぶ線分を表します。
+    #     射影した点は点の指定と同じ形の [lat,lon] の配列です。
+    #     射影できない点（shape の点が 2 点未満、点が NaN）の番号は -1、その他は NaN となります。
+    #     存在しない shape ID の場合は None を返します。
+    #     ex: seg,pos,dist,offset=gtfs.shapes.snap(shapeID,[[39.71,140.10],[39.72,140.11]])
+    def snap(self,inShapeID,inPoints):
+        index=self.getSegmentIndex(inShapeID)
+        if index is None: return None
+        lat,lon=self.getLatLonArray(inShapeID)
+        cum=self.getCumulativeDistances(inShapeID)
+        points=np.asarray(inPoints,dtype=float)
+        isScalar=points.ndim==1
+        points=points.reshape(-1,2)
+        seg,t,_=index.nearest(points[:,0],points[:,1])
+        found=seg>=0
+        s=np.where(found,seg,0)
+        e=np.minimum(s+1,len(lat)-1)
+        snapped=np.empty(points.shape)
+        snapped[:,0]=lat[s]+t*(lat[e]-lat[s])
+        snapped[:,1]=lon[s]+t*(lon[e]-lon[s])
+        along=cum[s]+t*(cum[e]-cum[s])
+        offset=np.full(len(points),np.nan)
+        if found.any():
+            offset[found]=np.asarray(segmentDistances(points[found,0],points[found,1],
+                                                      snapped[found,0],snapped[found,1],
+                                                      distanceMode=self.getDistanceMode()),
+                                     dtype=float).reshape(-1)
+        if isScalar: return int(seg[0]),snapped[0],float(along[0]),float(offset[0])
+        return seg,snapped,along,offset
 
     # [ latitude,longitude ]
     def pos(self,inShape): return [inShape[self.index.shape_pt_lat],
@@ -670,12 +2197,15 @@ class shapes_record(Record):
 # for frequencies.txt
 #--------------------------------------------------------------------
 class frequencies(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'frequencies.txt',
                          ['trip_id','start_time','end_time',
                           'headway_secs','exact_times'],
                          'trip_id',frequencies_record,
-                         optional=True)
+                         optional=True,
+                         fieldTypes={'trip_id':'id','start_time':'time','end_time':'time',
+                                     'headway_secs':'int','exact_times':'int'},
+                         **inOptions)
 
 class frequencies_record(Record): pass
 
@@ -684,12 +2214,15 @@ class frequencies_record(Record): pass
 # for transfers.txt
 #--------------------------------------------------------------------
 class transfers(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'transfers.txt',
                          ['from_stop_id','to_stop_id',
-                          'transfer_type','min_transfer_type'],
+                          'transfer_type','min_transfer_time'],
                           'from_stop_id',transfers_record,
-                          optional=True)
+                          optional=True,
+                         fieldTypes={'from_stop_id':'id','to_stop_id':'id','transfer_type':'int',
+                                     'min_transfer_time':'int'},
+                         **inOptions)
 
 class transfers_record(Record): pass
 
@@ -708,43 +2241,1205 @@ class feed_info(SingleRecord):
 # for translations.txt
 #--------------------------------------------------------------------
 class translations(RecordSet):
-    def __init__(self,inZipFileObj):
+    def __init__(self,inZipFileObj,**inOptions):
         super().__init__(inZipFileObj,'translations.txt',
                          ['trans_id','lang','translation'],
                           'trans_id',translations_record,
-                          optional=True)
+                          optional=True,
+                         fieldTypes={'trans_id':'id'},
+                         **inOptions)
 
 class translations_record(Record): pass
 
 
+#====================================================================
+# vectorized bus position engine
+#====================================================================
+# 全 trip の運行情報を、まとめて位置計算を行うための numpy 配列として保持する。
+#   tripKeyPos             : trip_id -> trip 番号 g
+#   stopOffsets            : trip 番号 g の停車情報は [stopOffsets[g],stopOffsets[g+1])
+#   arrival,departure      : 各停車の到着・出発時刻（0 時からの経過秒数）
+#   departureKey           : g*timeKeyScale+departure（全体で昇順）
+#   stopLat,stopLon        : 各停車のバス停の位置
+#   stopDist               : 各停車のバス停を shape に投影した位置の、shape 始点からの距離 [m]
+#   tripShape              : trip 番号 g の shape 番号（shape が無い場合は -1）
+#   shapeOffsets           : shape 番号 k の点列は [shapeOffsets[k],shapeOffsets[k+1])
+#   shapeLat,shapeLon      : shape の点列
+#   shapeKey               : 累積距離に shape 毎のオフセット shapeBase を加えたもの（全体で昇順）
+class BusPositionModel:
+    timeKeyScale=1<<22
+
+    arrayNameList=['stopOffsets','arrival','departure','departureKey',
+                   'stopLat','stopLon','stopDist','tripShape',
+                   'shapeOffsets','shapeLat','shapeLon','shapeKey','shapeBase']
+
+    def __init__(self,inTripKeyPos,inArrays):
+        self.tripKeyPos=inTripKeyPos
+        for name in BusPositionModel.arrayNameList: setattr(self,name,inArrays[name])
+
+    def getArrays(self):
+        return { name:getattr(self,name) for name in BusPositionModel.arrayNameList }
+
+    @classmethod
+    def build(cls,inGtfs):
+        stopTimes=inGtfs.stop_times
+        keyIndex=stopTimes.getKeyIndex()
+        if keyIndex is None or keyIndex.order is not None:
+            raise ValueError('stop_times must be grouped by trip_id.')
+        numOfTrips=len(keyIndex.offsets)-1
+        counts=np.diff(keyIndex.offsets)
+        tripNo=np.repeat(np.arange(numOfTrips),counts)
+
+        arrival  =stopTimes.getColumn('arrival_time').astype(np.int64)
+        departure=stopTimes.getColumn('departure_time').astype(np.int64)
+        arrival  =np.where(arrival<0,departure,arrival)
+        departure=np.where(departure<0,arrival,departure)
+        stopRowNo=getRowNos(inGtfs.stops,stopTimes.getColumn('stop_id'))
+        keep=(arrival>=0) & (stopRowNo>=0)
+        if not keep.all():
+            arrival,departure,stopRowNo,tripNo=arrival[keep],departure[keep],stopRowNo[keep],tripNo[keep]
+            counts=np.bincount(tripNo,minlength=numOfTrips)
+        stopOffsets=np.concatenate(([0],np.cumsum(counts)))
+        stopLat=inGtfs.stops.getColumn('stop_lat').astype(float)[stopRowNo]
+        stopLon=inGtfs.stops.getColumn('stop_lon').astype(float)[stopRowNo]
+
+        # shapes
+        shapeIndex=inGtfs.shapes.getKeyIndex() if inGtfs.shapes.valid else None
+        if shapeIndex is not None and shapeIndex.order is None:
+            shapeOffsets=shapeIndex.offsets
+            shapeLat=inGtfs.shapes.getColumn('shape_pt_lat').astype(float)
+            shapeLon=inGtfs.shapes.getColumn('shape_pt_lon').astype(float)
+            shapeKeyPos=shapeIndex.keyPos
+        else:
+            shapeOffsets=np.zeros(1,dtype=np.int64)
+            shapeLat=shapeLon=np.zeros(0)
+            shapeKeyPos={}
+        distanceMode=inGtfs.distanceMode
+        shapeCum=inGtfs.shapes.getDistanceTable() if len(shapeKeyPos)>0 else np.zeros(0)
+        shapeLength=np.zeros(len(shapeOffsets)-1)
+        nonEmpty=np.diff(shapeOffsets)>0
+        shapeLength[nonEmpty]=shapeCum[shapeOffsets[1:][nonEmpty]-1]
+        shapeBase=np.concatenate(([0],np.cumsum(shapeLength+1.0)))[:-1]
+        shapeKey=shapeCum+np.repeat(shapeBase,np.diff(shapeOffsets))
+
+        # trip -> shape
+        tripShape=np.full(numOfTrips,-1,dtype=np.int64)
+        tripKeyPos=keyIndex.keyPos
+        if inGtfs.trips.valid and len(shapeKeyPos)>0:
+            shapeIDs=inGtfs.trips.getColumn('shape_id')
+            tripIDs =inGtfs.trips.getColumn('trip_id')
+            if shapeIDs is not None and tripIDs is not None:
+                g=pd.Index(list(tripKeyPos)).get_indexer(np.asarray(tripIDs,dtype=object))
+                k=pd.Index(list(shapeKeyPos)).get_indexer(np.asarray(shapeIDs,dtype=object))
+                tripShape[g[g>=0]]=k[g>=0]
+        tripShape[tripShape>=0]=np.where(nonEmpty[tripShape[tripShape>=0]],
+                                         tripShape[tripShape>=0],-1)
+
+        # バス停の shape への投影（shape とバス停の並びが同じ trip の間で共有する）
+        tripNo=np.repeat(np.arange(numOfTrips),counts)
+        stopDist=np.zeros(len(arrival))
+        # shape の無い trip は、バス停間の距離の累積とする
+        rows=np.flatnonzero(tripShape[tripNo]<0)
+        if len(rows)>0:
+            offsets=np.concatenate(([0],np.cumsum(counts[tripShape<0])))
+            stopDist[rows]=cumulativeDistances(stopLat[rows],stopLon[rows],offsets,distanceMode=distanceMode)
+        # shape のある trip は (shape,バス停の並び) の組ごとに最初の trip のみ投影し、
+        # その結果を CSR 形式で連結して、各停車の位置に割り当てる
+        shaped=np.flatnonzero(tripShape>=0)
+        if len(shaped)>0:
+            sequenceNo=groupByStopSequence(stopRowNo,stopOffsets[shaped],stopOffsets[shaped+1])
+            patternNo=pd.factorize(sequenceNo*len(shapeLength)+tripShape[shaped])[0]
+            _,first=np.unique(patternNo,return_index=True)
+            projected=[]
+            for g in shaped[first]:
+                start,end=stopOffsets[g],stopOffsets[g+1]
+                a,b=shapeOffsets[tripShape[g]],shapeOffsets[tripShape[g]+1]
+                projected.append(projectPointsOnPolyline(shapeLat[a:b],shapeLon[a:b],shapeCum[a:b],
+                                                         stopLat[start:end],stopLon[start:end]))
+            patternOffsets=np.concatenate(([0],np.cumsum(counts[shaped[first]])))
+            tripPattern=np.full(numOfTrips,-1,dtype=np.int64)
+            tripPattern[shaped]=patternNo
+            rows=np.flatnonzero(tripPattern[tripNo]>=0)
+            g=tripNo[rows]
+            stopDist[rows]=np.concatenate(projected)[patternOffsets[tripPattern[g]]+rows-stopOffsets[g]]
+
+        departureKey=tripNo*cls.timeKeyScale+departure
+        return cls(tripKeyPos,{ 'stopOffsets':stopOffsets,
+                                'arrival':arrival,'departure':departure,
+                                'departureKey':departureKey,
+                                'stopLat':stopLat,'stopLon':stopLon,'stopDist':stopDist,
+                                'tripShape':tripShape,'shapeOffsets':shapeOffsets,
+                                'shapeLat':shapeLat,'shapeLon':shapeLon,
+                                'shapeKey':shapeKey,'shapeBase':shapeBase })
+
+    # trip_id の配列を trip 番号の配列に変換する（存在しない trip_id は -1）。
+    def getTripNos(self,inTripIDs):
+        codes,uniques=pd.factorize(np.asarray(inTripIDs,dtype=object).ravel())
+        tripNos=np.array([self.tripKeyPos.get(t,-1) for t in uniques]+[-1],dtype=np.int64)
+        return tripNos[codes]
+
+    # trip 番号 inTripNos の時刻 inSeconds（0 時からの経過秒数）における位置を
+    # (N,2) の配列 [[lat,lon],...] で返す。運行していない場合は NaN となる。
+    def getPositions(self,inTripNos,inSeconds):
+        g=np.asarray(inTripNos,dtype=np.int64)
+        t=np.asarray(inSeconds,dtype=np.int64)
+        ret=np.full((len(g),2),np.nan)
+        gg=np.where(g>=0,g,0)
+        start=self.stopOffsets[gg]; end=self.stopOffsets[gg+1]
+        valid=(g>=0) & (end>start)
+        valid[valid]&=(self.arrival[start[valid]]<=t[valid]) & (t[valid]<=self.departure[end[valid]-1])
+        if not valid.any(): return ret
+        g,t=g[valid],t[valid]
+        j=np.searchsorted(self.departureKey,g*BusPositionModel.timeKeyScale+t,side='left')
+        atStop=self.arrival[j]<=t
+        i=np.where(atStop,j,j-1)
+        span=self.arrival[j]-self.departure[i]
+        ratio=np.where(atStop,0.0,(t-self.departure[i])/np.where(span>0,span,1))
+
+        lat=self.stopLat[i]+ratio*(self.stopLat[j]-self.stopLat[i])
+        lon=self.stopLon[i]+ratio*(self.stopLon[j]-self.stopLon[i])
+
+        k=self.tripShape[g]
+        onShape=(~atStop) & (k>=0)
+        if onShape.any():
+            k=k[onShape]
+            d=self.stopDist[i[onShape]]+ratio[onShape]*(self.stopDist[j[onShape]]-self.stopDist[i[onShape]])
+            q=self.shapeBase[k]+d
+            lo=self.shapeOffsets[k]; hi=self.shapeOffsets[k+1]
+            p=np.searchsorted(self.shapeKey,q,side='right')-1
+            p=np.clip(p,lo,np.maximum(hi-2,lo))
+            pn=np.minimum(p+1,hi-1)
+            segLen=self.shapeKey[pn]-self.shapeKey[p]
+            u=np.clip(np.where(segLen>0,(q-self.shapeKey[p])/np.where(segLen>0,segLen,1),0),0,1)
+            lat[onShape]=self.shapeLat[p]+u*(self.shapeLat[pn]-self.shapeLat[p])
+            lon[onShape]=self.shapeLon[p]+u*(self.shapeLon[pn]-self.shapeLon[p])
+
+        ret[valid,0]=lat
+        ret[valid,1]=lon
+        return ret
+
+#====================================================================
+# service calendar
+#====================================================================
+# 日付（datetime.date/datetime.datetime、'YYYYMMDD' や 'YYYY-MM-DD' 形式の文字列、
+# 20230401 のような整数）を 1970-01-01 からの日数に変換する。
+def toDayNumber(inDate):
+    if isinstance(inDate,datetime.datetime): inDate=inDate.date()
+    if isinstance(inDate,datetime.date): return (inDate-datetime.date(1970,1,1)).days
+    if isinstance(inDate,np.datetime64): return int(inDate.astype('datetime64[D]').astype(np.int64))
+    if isinstance(inDate,str): inDate=int(re.sub(r'[-/]','',inDate.strip()))
+    return int(dateIntArrayToDayNumbers(np.array([inDate]))[0])
+
+# YYYYMMDD 形式の整数の配列を 1970-01-01 からの日数の配列に変換する。
+def dateIntArrayToDayNumbers(inDates):
+    d=np.asarray(inDates,dtype=np.int64)
+    month=((d//10000-1970)*12+d//100%100-1).astype('datetime64[M]')
+    return month.astype('datetime64[D]').astype(np.int64)+d%100-1
+
+# calendar の曜日毎の運行と期間、calendar_dates の例外を合成し、
+# サービス × 日付の運行の有無を保持する。
+#   serviceKeyPos : service_id -> サービス番号
+#   serviceIDs    : サービス番号 -> service_id
+#   firstDay      : bitmap の最初の列の日付（1970-01-01 からの日数）
+#   bitmap        : bitmap[サービス番号,日付-firstDay] が True の場合、その日に運行する
+class ServiceCalendar:
+    def __init__(self,inServiceIDs,inFirstDay,inBitmap):
+        self.serviceIDs=inServiceIDs
+        self.serviceKeyPos={ id:i for i,id in enumerate(inServiceIDs) }
+        self.firstDay=inFirstDay
+        self.bitmap=inBitmap
+
+    @classmethod
+    def build(cls,inGtfs):
+        cal=inGtfs.calendar
+        calDates=inGtfs.calendar_dates
+        calIDs=np.asarray(cal.getColumn('service_id'),dtype=object) if cal.valid \
+               else np.zeros(0,dtype=object)
+        exIDs=np.asarray(calDates.getColumn('service_id'),dtype=object) if calDates.valid \
+              else np.zeros(0,dtype=object)
+        codes,serviceIDs=pd.factorize(np.concatenate((calIDs,exIDs)))
+        calNo,exNo=codes[:len(calIDs)],codes[len(calIDs):]
+
+        if len(calIDs)>0:
+            start=dateIntArrayToDayNumbers(cal.getColumn('start_date'))
+            end  =dateIntArrayToDayNumbers(cal.getColumn('end_date'))
+            weekMask=np.stack([np.asarray(cal.getColumn(name),dtype=np.int64)==1
+                               for name in ('monday','tuesday','wednesday','thursday',
+                                            'friday','saturday','sunday')],axis=1)
+        else:
+            start=end=np.zeros(0,dtype=np.int64)
+            weekMask=np.zeros((0,7),dtype=bool)
+        if len(exIDs)>0:
+            exDay=dateIntArrayToDayNumbers(calDates.getColumn('date'))
+            exType=np.asarray(calDates.getColumn('exception_type'),dtype=np.int64)
+        else:
+            exDay=exType=np.zeros(0,dtype=np.int64)
+
+        allDays=np.concatenate((start,end,exDay))
+        if len(allDays)==0:
+            return cls(np.asarray(serviceIDs,dtype=object),0,np.zeros((len(serviceIDs),0),dtype=bool))
+        firstDay=int(allDays.min())
+        days=np.arange(firstDay,int(allDays.max())+1)
+        # 1970-01-01 は木曜日（月曜日を 0 とする曜日番号で 3）
+        weekday=(days+3)%7
+        bitmap=np.zeros((len(serviceIDs),len(days)),dtype=bool)
+        if len(calNo)>0:
+            running=(start[:,None]<=days) & (days<=end[:,None]) & weekMask[:,weekday]
+            np.logical_or.at(bitmap,calNo,running)
+        # exception_type 1:追加、2:削除
+        added=exType==1; removed=exType==2
+        bitmap[exNo[added],exDay[added]-firstDay]=True
+        bitmap[exNo[removed],exDay[removed]-firstDay]=False
+        return cls(np.asarray(serviceIDs,dtype=object),firstDay,bitmap)
+
+    # 指定した日付（1970-01-01 からの日数）に運行するサービスのマスクを返す。
+    # 有効期間外の日付の場合は全て False となる。
+    def getServiceMask(self,inDayNumber):
+        i=inDayNumber-self.firstDay
+        if 0<=i<self.bitmap.shape[1]: return self.bitmap[:,i]
+        return np.zeros(len(self.serviceIDs),dtype=bool)
+
+    # service_id の配列をサービス番号の配列に変換する（存在しない service_id は -1）。
+    def getServiceNos(self,inServiceIDs):
+        codes,uniques=pd.factorize(np.asarray(inServiceIDs,dtype=object).ravel())
+        serviceNos=np.array([self.serviceKeyPos.get(s,-1) for s in uniques]+[-1],dtype=np.int64)
+        return serviceNos[codes]
+
+#====================================================================
+# frequency-based trip instances
+#====================================================================
+# frequencies の各行を、運行間隔毎の具体的な便（インスタンス）に展開して保持する。
+# インスタンスの停車時刻は、元の trip の stop_times の時刻に offset を加えたものとなる。
+#   instanceIDs : インスタンスの trip ID（'元の trip_id@hh:mm:ss'、時刻は始発の出発時刻）
+#   tripIDs     : 元の trip_id
+#   start       : 始発の出発時刻（0 時からの経過秒数）
+#   offsets     : 元の trip の stop_times の時刻に加える秒数
+#   exactTimes  : frequencies の exact_times
+class TripInstanceTable:
+    separator='@'
+
+    def __init__(self,inInstanceIDs,inTripIDs,inStart,inOffsets,inExactTimes):
+        self.instanceIDs=np.asarray(inInstanceIDs,dtype=object)
+        self.tripIDs=np.asarray(inTripIDs,dtype=object)
+        self.start=np.asarray(inStart,dtype=np.int64)
+        self.offsets=np.asarray(inOffsets,dtype=np.int64)
+        self.exactTimes=np.asarray(inExactTimes,dtype=np.int64)
+        self.instanceKeyPos={ id:i for i,id in enumerate(self.instanceIDs) }
+
+    def __len__(self): return len(self.instanceIDs)
+
+    @classmethod
+    def build(cls,inGtfs):
+        freq=inGtfs.frequencies
+        empty=cls([],[],[],[],[])
+        if freq.valid==False or freq.getColumn('trip_id') is None: return empty
+        tripIDs=np.asarray(freq.getColumn('trip_id'),dtype=object)
+        start=freq.getColumn('start_time').astype(np.int64)
+        end  =freq.getColumn('end_time').astype(np.int64)
+        headway=np.nan_to_num(np.asarray(freq.getColumn('headway_secs'),dtype=float)).astype(np.int64)
+        exactTimes=freq.getColumn('exact_times')
+        exactTimes=np.zeros(len(tripIDs),dtype=np.int64) if exactTimes is None \
+                   else np.nan_to_num(np.asarray(exactTimes,dtype=float)).astype(np.int64)
+
+        # 元の trip の始発の出発時刻（stop_times の KeyIndex の各 trip の先頭行）
+        base=np.full(len(tripIDs),-1,dtype=np.int64)
+        keyIndex=inGtfs.stop_times.getKeyIndex()
+        if keyIndex is not None and keyIndex.order is None:
+            arrival  =inGtfs.stop_times.getColumn('arrival_time').astype(np.int64)
+            departure=inGtfs.stop_times.getColumn('departure_time').astype(np.int64)
+            k=pd.Index(list(keyIndex.keyPos)).get_indexer(tripIDs)
+            found=np.flatnonzero(k>=0)
+            first=keyIndex.offsets[k[found]]
+            hasRows=first<keyIndex.offsets[k[found]+1]
+            found,first=found[hasRows],first[hasRows]
+            times=np.where(departure[first]>=0,departure[first],arrival[first])
+            base[found]=np.where(times>=0,times,-1)
+
+        # 始発の出発時刻が [start_time,end_time) の範囲で headway_secs 毎のインスタンス
+        valid=(base>=0) & (headway>0) & (start>=0) & (end>start)
+        counts=np.where(valid,-((start-end)//np.where(headway>0,headway,1)),0)
+        r=np.repeat(np.arange(len(tripIDs)),counts)
+        k=np.arange(len(r))-np.repeat(np.cumsum(counts)-counts,counts)
+        instanceStart=start[r]+k*headway[r]
+        # 数値として読み込まれた trip_id もあるため、文字列に変換して時刻を付加する
+        instanceIDs=[str(t)+TripInstanceTable.separator+secondsToTimeStr(s)
+                     for t,s in zip(tripIDs[r],instanceStart)]
+        return cls(instanceIDs,tripIDs[r],instanceStart,instanceStart-base[r],exactTimes[r])
+
+    # trip ID の配列を (元の trip_id の配列,時刻の offset の配列) に変換する。
+    # インスタンスでない trip ID はそのまま（offset は 0）となる。
+    def resolve(self,inTripIDs):
+        codes,uniques=pd.factorize(np.asarray(inTripIDs,dtype=object).ravel())
+        k=np.array([self.instanceKeyPos.get(t,-1) for t in uniques]+[-1],dtype=np.int64)[codes]
+        tripIDs=np.append(uniques.astype(object),None)[codes]
+        isInstance=k>=0
+        tripIDs[isInstance]=self.tripIDs[k[isInstance]]
+        offsets=np.zeros(len(k),dtype=np.int64)
+        offsets[isInstance]=self.offsets[k[isInstance]]
+        return tripIDs,offsets
+
+#====================================================================
+# trip time index
+#====================================================================
+# trip 毎の運行時間帯 [start,end]（0 時からの経過秒数）を始発時刻の昇順に保持し、
+# 指定した時間帯と重なる trip を二分探索で求める。
+# 始発時刻が t1-maxDuration 以上 t2 以下の trip のみを候補とすることで、
+# 候補の数を時間帯の前後で運行を開始した trip の数に抑える。
+#   tripIDs     : trip_id（始発時刻の昇順、frequencies の trip は展開したインスタンスの ID）
+#   start,end   : 運行開始・終了時刻
+#   tripRowNos  : trips の行番号（trips に無い trip は -1）
+class TripTimeIndex:
+    def __init__(self,inTripIDs,inStart,inEnd,inTripRowNos):
+        order=np.argsort(inStart,kind='stable')
+        self.tripIDs=np.asarray(inTripIDs,dtype=object)[order]
+        self.start=np.asarray(inStart,dtype=np.int64)[order]
+        self.end=np.asarray(inEnd,dtype=np.int64)[order]
+        self.tripRowNos=np.asarray(inTripRowNos,dtype=np.int64)[order]
+        self.maxDuration=int((self.end-self.start).max()) if len(self.start)>0 else 0
+
+    @classmethod
+    def build(cls,inGtfs):
+        stopTimes=inGtfs.stop_times
+        keyIndex=stopTimes.getKeyIndex()
+        if stopTimes.valid==False or keyIndex is None:
+            return cls([],np.zeros(0),np.zeros(0),np.zeros(0))
+        arrival  =stopTimes.getColumn('arrival_time').astype(np.int64)
+        departure=stopTimes.getColumn('departure_time').astype(np.int64)
+        if keyIndex.order is not None: arrival,departure=arrival[keyIndex.order],departure[keyIndex.order]
+        first=np.where(arrival>=0,arrival,departure)
+        last =np.where(departure>=0,departure,arrival)
+        offsets=keyIndex.offsets[:-1]
+        if len(offsets)==0: return cls([],np.zeros(0),np.zeros(0),np.zeros(0))
+        start=np.minimum.reduceat(np.where(first>=0,first,np.iinfo(np.int64).max),offsets)
+        end  =np.maximum.reduceat(last,offsets)
+        tripIDs=np.asarray(list(keyIndex.keyPos),dtype=object)
+        valid=end>=0
+        tripIDs,start,end=tripIDs[valid],start[valid],end[valid]
+        # frequencies で運行される trip は、元の trip に代えて展開したインスタンスとする
+        instances=inGtfs.getTripInstanceTable()
+        if len(instances)>0:
+            pos={ t:i for i,t in enumerate(tripIDs) }
+            k=np.array([pos.get(t,-1) for t in instances.tripIDs],dtype=np.int64)
+            hasTimes=k>=0
+            k,offsets=k[hasTimes],instances.offsets[hasTimes]
+            keep=~np.isin(tripIDs,np.asarray(list(set(instances.tripIDs)),dtype=object))
+            baseTripIDs=np.concatenate((tripIDs[keep],tripIDs[k]))
+            tripIDs=np.concatenate((tripIDs[keep],instances.instanceIDs[hasTimes]))
+            start=np.concatenate((start[keep],start[k]+offsets))
+            end  =np.concatenate((end[keep],end[k]+offsets))
+        else:
+            baseTripIDs=tripIDs
+        tripRowNos=getRowNos(inGtfs.trips,baseTripIDs) if inGtfs.trips.valid \
+                   else np.full(len(tripIDs),-1,dtype=np.int64)
+        return cls(tripIDs,start,end,tripRowNos)
+
+    # 運行時間帯が [inStart,inEnd] と重なる trip の番号（始発時刻の昇順）を返す。
+    def getOverlapping(self,inStart,inEnd):
+        lo=np.searchsorted(self.start,inStart-self.maxDuration,side='left')
+        hi=np.searchsorted(self.start,inEnd,side='right')
+        return lo+np.flatnonzero(self.end[lo:hi]>=inStart)
+
+# stop_times の行番号を trip 毎にまとめて stop_sequence の順に並べ、
+# frequencies で運行される trip の行は、元の trip に代えて展開したインスタンス毎に複製して返す。
+# return rows         : stop_times の行番号
+#        tripNo       : stop_times の KeyIndex における trip の番号
+#        tripIDs      : trip ID（インスタンスはその ID）
+#        offsets      : 時刻に加える秒数（インスタンス以外は 0）
+#        runNo        : 便（trip またはインスタンス）毎に異なる番号（同じ便の行は連続する）
+#        groupTripIDs : trip の番号 -> trip_id
+def expandStopTimeRows(inGtfs):
+    keyIndex=inGtfs.stop_times.getKeyIndex()
+    rows=keyIndex.order if keyIndex.order is not None else np.arange(keyIndex.offsets[-1])
+    rows=rows[keyIndex.offsets[0]:]
+    offsets=keyIndex.offsets-keyIndex.offsets[0]
+    counts=np.diff(offsets)
+    tripNo=np.repeat(np.arange(len(counts)),counts)
+    groupTripIDs=np.asarray(list(keyIndex.keyPos),dtype=object)
+    tripIDs=groupTripIDs[tripNo]
+    offsetSeconds=np.zeros(len(rows),dtype=np.int64)
+    runNo=tripNo
+    instances=inGtfs.getTripInstanceTable()
+    if len(instances)>0:
+        g=np.array([keyIndex.keyPos.get(t,-1) for t in instances.tripIDs],dtype=np.int64)
+        hasTimes=g>=0
+        g,instanceIDs,instanceOffsets=g[hasTimes],instances.instanceIDs[hasTimes],instances.offsets[hasTimes]
+        n=counts[g]
+        local=np.arange(n.sum())-np.repeat(np.cumsum(n)-n,n)
+        src=np.repeat(offsets[g],n)+local
+        isTemplate=np.isin(tripNo,g)
+        sel=np.concatenate((np.flatnonzero(~isTemplate),src))
+        tripIDs=np.concatenate((tripIDs[~isTemplate],np.repeat(instanceIDs,n)))
+        offsetSeconds=np.concatenate((offsetSeconds[~isTemplate],np.repeat(instanceOffsets,n)))
+        runNo=np.concatenate((tripNo[~isTemplate],len(counts)+np.repeat(np.arange(len(g)),n)))
+        rows,tripNo=rows[sel],tripNo[sel]
+    return rows,tripNo,tripIDs,offsetSeconds,runNo,groupTripIDs
+
+#====================================================================
+# stop departure index
+#====================================================================
+# stop_times の出発を (stop_id,出発時刻) の順に並べて保持し、
+# 指定したバス停の指定した時刻以降の出発を二分探索で求める。
+# 終着のバス停での停車と、pickup_type が 1（乗車不可）の停車は含まない。
+# frequencies で運行される trip は、展開したインスタンス毎の出発とする。
+#   stopIndex   : stop_id をキーとする KeyIndex（各バス停の出発は [offsets[k],offsets[k+1])）
+#   departure   : 出発時刻（0 時からの経過秒数、バス停毎に昇順）
+#   tripIDs     : trip ID（frequencies の trip はインスタンスの ID）
+#   tripRowNos  : 元の trip の trips の行番号（trips に無い trip は -1）
+#   routeIDs    : route_id
+#   headsigns   : 行先（stop_headsign があればそれを、無ければ trip_headsign）
+class StopDepartureIndex:
+    arrayNameList=['departure','tripIDs','tripRowNos','routeIDs','headsigns']
+
+    def __init__(self,inStopIDs,inArrays):
+        order=np.lexsort((inArrays['departure'],pd.factorize(np.asarray(inStopIDs,dtype=object))[0]))
+        self.stopIndex=KeyIndex(np.asarray(inStopIDs,dtype=object)[order])
+        for name in StopDepartureIndex.arrayNameList: setattr(self,name,inArrays[name][order])
+
+    @classmethod
+    def build(cls,inGtfs):
+        stopTimes=inGtfs.stop_times
+        keyIndex=stopTimes.getKeyIndex() if stopTimes.valid else None
+        if keyIndex is None:
+            return cls(np.zeros(0,dtype=object),{ 'departure':np.zeros(0,dtype=np.int64),
+                                                  'tripIDs':np.zeros(0,dtype=object),
+                                                  'tripRowNos':np.zeros(0,dtype=np.int64),
+                                                  'routeIDs':np.zeros(0,dtype=object),
+                                                  'headsigns':np.zeros(0,dtype=object) })
+        rows,tripNo,rowTripIDs,offsetSeconds,runNo,groupTripIDs=expandStopTimeRows(inGtfs)
+        arrival  =stopTimes.getColumn('arrival_time').astype(np.int64)[rows]
+        departure=stopTimes.getColumn('departure_time').astype(np.int64)[rows]
+        departure=np.where(departure>=0,departure,arrival)
+        keep=(departure>=0) & np.append(runNo[:-1]==runNo[1:],False)
+        pickupType=stopTimes.getColumn('pickup_type')
+        if pickupType is not None: keep&=np.asarray(pickupType,dtype=float)[rows]!=1
+        stopHeadsign=stopTimes.getColumn('stop_headsign')
+        stopHeadsign=np.asarray(stopHeadsign,dtype=object)[rows] if stopHeadsign is not None \
+                     else np.full(len(rows),None,dtype=object)
+        stopIDs=np.asarray(stopTimes.getColumn('stop_id'),dtype=object)[rows]
+
+        tripNo,rowTripIDs,offsetSeconds=tripNo[keep],rowTripIDs[keep],offsetSeconds[keep]
+        departure,stopHeadsign,stopIDs=departure[keep]+offsetSeconds,stopHeadsign[keep],stopIDs[keep]
+
+        trips=inGtfs.trips
+        tripRowNos=getRowNos(trips,groupTripIDs) if trips.valid else np.full(len(groupTripIDs),-1,dtype=np.int64)
+        tripRowNos=tripRowNos[tripNo]
+        def tripColumn(inFieldName):
+            column=trips.getColumn(inFieldName) if trips.valid else None
+            if column is None: return np.full(len(tripRowNos),None,dtype=object)
+            return np.append(np.asarray(column,dtype=object),None)[tripRowNos]
+        headsigns=np.where(pd.isna(stopHeadsign) | (stopHeadsign==''),tripColumn('trip_headsign'),stopHeadsign)
+        return cls(stopIDs,{ 'departure':departure,'tripIDs':rowTripIDs,'tripRowNos':tripRowNos,
+                             'routeIDs':tripColumn('route_id'),'headsigns':headsigns })
+
+    # バス停 inStopID の、時刻 inAfter 以降の出発の番号を出発時刻の昇順で最大 inLimit 個返す。
+    # inTripMask を指定した場合は、trips の行について inTripMask が True の trip のみとする。
+    def getDepartures(self,inStopID,inAfter,inLimit,inTripMask=None):
+        start,end=self.stopIndex.getRange(inStopID)
+        if start is None: return np.zeros(0,dtype=np.int64)
+        i=start+int(np.searchsorted(self.departure[start:end],inAfter,side='left'))
+        if inTripMask is None: return np.arange(i,min(i+inLimit,end))
+        mask=np.append(inTripMask,False)[self.tripRowNos[i:end]]
+        return i+np.flatnonzero(mask)[:inLimit]
+
+# StopDepartureIndex.getDepartures により得られる出発の情報
+class departure_record:
+    def __init__(self,inDepartureTime,inTripID,inRouteID,inHeadsign):
+        self.departure_time=inDepartureTime
+        self.trip_id=inTripID
+        self.route_id=inRouteID
+        self.headsign=inHeadsign
+
+    def __repr__(self):
+        return 'departure_record('+', '.join(str(v) for v in
+                                             (self.departure_time,self.trip_id,
+                                              self.route_id,self.headsign))+')'
+
+#====================================================================
+# trip patterns
+#====================================================================
+# 便毎の行の範囲 [inStart[i],inEnd[i]) の停車するバス停の番号の並び inStopNo を比べ、
+# 並びが同じ便に同じ番号（最初に現れた順）を付けて返す。
+# 停車の j 番目ごとに、それまでの並びの番号と j 番目のバス停の組に番号を付け直す
+# （便毎の処理は行わない。並びの番号は停車数が同じ便の間でのみ比べる）。
+def groupByStopSequence(inStopNo,inStart,inEnd):
+    stopNo=np.asarray(inStopNo,dtype=np.int64)
+    start=np.asarray(inStart,dtype=np.int64)
+    length=np.asarray(inEnd,dtype=np.int64)-start
+    base=int(stopNo.max(initial=-1))+2
+    order=np.argsort(-length,kind='stable')
+    numOfRunning=np.searchsorted(-length[order],-np.arange(int(length.max(initial=0))),side='left')
+    code=np.zeros(len(start),dtype=np.int64)
+    for j,n in enumerate(numOfRunning):
+        i=order[:n]
+        code[i]=pd.factorize(code[i]*base+stopNo[start[i]+j]+1)[0]
+    return pd.factorize(length*(int(code.max(initial=0))+1)+code)[0].astype(np.int64)
+
+# stop_times の trip を停車するバス停の並び（stop_id の列）が同じもの毎にまとめたパターンの表。
+# パターン p の便は始発の時刻の昇順に並べ、便 × バス停の時刻を int32 の行列（行優先）として保持する。
+# 時刻の無い停車は -1 とする。
+#   stopOffsets : パターン p のバス停は stopIDs[stopOffsets[p]:stopOffsets[p+1]]
+#   tripOffsets : パターン p の便は tripIDs[tripOffsets[p]:tripOffsets[p+1]]
+#   timeOffsets : パターン p の時刻は arrival,departure の [timeOffsets[p],timeOffsets[p+1])
+#   tripPattern : 便 -> パターンの番号
+class TripPatternTable:
+    arrayNameList=['stopOffsets','stopIDs','tripOffsets','tripIDs','tripPattern',
+                   'timeOffsets','arrival','departure']
+
+    def __init__(self,inArrays):
+        for name in TripPatternTable.arrayNameList: setattr(self,name,inArrays[name])
+        self.tripPos={ t:i for i,t in enumerate(self.tripIDs) }
+
+    def __len__(self): return len(self.stopOffsets)-1
+
+    @classmethod
+    def build(cls,inGtfs):
+        stopTimes=inGtfs.stop_times
+        keyIndex=stopTimes.getKeyIndex() if stopTimes.valid else None
+        if keyIndex is None:
+            empty=lambda inDtype: np.zeros(0,dtype=inDtype)
+            return cls({ 'stopOffsets':np.zeros(1,dtype=np.int64),'stopIDs':empty(object),
+                         'tripOffsets':np.zeros(1,dtype=np.int64),'tripIDs':empty(object),
+                         'tripPattern':empty(np.int64),'timeOffsets':np.zeros(1,dtype=np.int64),
+                         'arrival':empty(np.int32),'departure':empty(np.int32) })
+        rows=keyIndex.order if keyIndex.order is not None else np.arange(keyIndex.offsets[-1])
+        rows=rows[keyIndex.offsets[0]:]
+        offsets=keyIndex.offsets-keyIndex.offsets[0]
+        counts=np.diff(offsets)
+        stopNo,stopIDs=pd.factorize(np.asarray(stopTimes.getColumn('stop_id'),dtype=object)[rows])
+        arrival  =stopTimes.getColumn('arrival_time').astype(np.int64)[rows]
+        departure=stopTimes.getColumn('departure_time').astype(np.int64)[rows]
+        arrival  =np.where(arrival>=0,arrival,-1).astype(np.int32)
+        departure=np.where(departure>=0,departure,-1).astype(np.int32)
+        tripIDs=np.asarray(list(keyIndex.keyPos),dtype=object)
+
+        patternOfTrip=groupByStopSequence(stopNo,offsets[:-1],offsets[1:])
+        firstDeparture=np.where(departure>=0,departure,arrival)[offsets[:-1][counts>0]] if len(rows)>0 \
+                       else np.zeros(0,dtype=np.int32)
+        first=np.zeros(len(counts),dtype=np.int64)
+        first[counts>0]=firstDeparture
+        order=np.lexsort((first,patternOfTrip))
+        numOfPatterns=int(patternOfTrip.max())+1 if len(patternOfTrip)>0 else 0
+        numOfTrips=np.bincount(patternOfTrip,minlength=numOfPatterns)
+        representative=order[np.concatenate(([0],np.cumsum(numOfTrips)[:-1]))] if numOfPatterns>0 \
+                       else np.zeros(0,dtype=np.int64)
+        numOfStops=counts[representative]
+        # 便の行を、パターン毎に並べた便の順に連結する（各パターンの行列は行優先）
+        n=counts[order]
+        sel=np.repeat(offsets[:-1][order],n)+np.arange(n.sum())-np.repeat(np.cumsum(n)-n,n)
+        n=numOfStops
+        stopSel=np.repeat(offsets[representative],n)+np.arange(n.sum())-np.repeat(np.cumsum(n)-n,n)
+        return cls({ 'stopOffsets':np.concatenate(([0],np.cumsum(numOfStops))).astype(np.int64),
+                     'stopIDs':np.asarray(stopIDs,dtype=object)[stopNo[stopSel]],
+                     'tripOffsets':np.concatenate(([0],np.cumsum(numOfTrips))).astype(np.int64),
+                     'tripIDs':tripIDs[order],
+                     'tripPattern':patternOfTrip[order],
+                     'timeOffsets':np.concatenate(([0],np.cumsum(numOfTrips*numOfStops))).astype(np.int64),
+                     'arrival':arrival[sel],'departure':departure[sel] })
+
+    # パターン inPattern の停車するバス停の stop_id の配列を返す。
+    def getStopIDs(self,inPattern):
+        return self.stopIDs[self.stopOffsets[inPattern]:self.stopOffsets[inPattern+1]]
+
+    # パターン inPattern の便の trip ID の配列を返す（始発の時刻の昇順）。
+    def getTripIDs(self,inPattern):
+        return self.tripIDs[self.tripOffsets[inPattern]:self.tripOffsets[inPattern+1]]
+
+    # パターン inPattern の時刻（inArray は arrival または departure）を (便の数,バス停の数) の行列として返す。
+    def getTimeMatrix(self,inPattern,inArray):
+        numOfStops=self.stopOffsets[inPattern+1]-self.stopOffsets[inPattern]
+        return inArray[self.timeOffsets[inPattern]:self.timeOffsets[inPattern+1]].reshape(-1,numOfStops)
+
+    def getArrival(self,inPattern):   return self.getTimeMatrix(inPattern,self.arrival)
+    def getDeparture(self,inPattern): return self.getTimeMatrix(inPattern,self.departure)
+
+    # trip ID の便のパターンの番号と、パターン内の便の番号の組を返す（存在しない場合は (None,None)）。
+    def getPatternOfTrip(self,inTripID):
+        i=self.tripPos.get(inTripID)
+        if i is None: return None,None
+        p=int(self.tripPattern[i])
+        return p,i-int(self.tripOffsets[p])
+
+#====================================================================
+# journey planner (RAPTOR)
+#====================================================================
+# 乗換案内（RAPTOR: Round-bAsed Public Transit Optimized Router）のためのネットワーク。
+# 停車するバス停の並びが同じ便をまとめたものをパターンとし、パターン毎に
+# 便 × バス停の時刻表を出発時刻の昇順（追い越しがある場合はパターンを分割する）で保持する。
+# バス停はいずれも stops の行番号で表す。
+#   patternStopOffsets : パターン p の停車は [patternStopOffsets[p],patternStopOffsets[p+1])
+#   patternStops       : 停車（パターン内のバス停）-> バス停の番号
+#   psPattern          : 停車 -> パターンの番号
+#   patternTripOffsets : パターン p の便は [patternTripOffsets[p],patternTripOffsets[p+1])
+#   tripIDs,tripRowNos : 便 -> trip ID（frequencies の便はインスタンスの ID）、trips の行番号
+#   routeIDs           : 便 -> route_id
+#   colStart           : 停車 ps の時刻は colDep,colArr の [colStart[ps],colStart[ps]+便の数)
+#   colKey             : 停車の番号 * timeKeyScale + 出発時刻（全体で昇順、乗車する便の二分探索用）
+#   stopPsOffsets      : バス停 s に停車する停車は stopPs[stopPsOffsets[s]:stopPsOffsets[s+1]]
+#   footOffsets        : バス停 s からの徒歩の乗換は footTo,footTime の [footOffsets[s],footOffsets[s+1])
+class RaptorNetwork:
+    walkDistance=400.0  # 徒歩で乗り換えるバス停間の最大距離 [m]
+    walkSpeed=1.2       # 歩く速さ [m/s]
+    timeKeyScale=1<<32
+    infinity=np.iinfo(np.int64).max//4
+
+    @classmethod
+    def build(cls,inGtfs,inTripMask=None,walkDistance=None,walkSpeed=None):
+        self=cls()
+        self.walkDistance=walkDistance if walkDistance!=None else cls.walkDistance
+        self.walkSpeed=walkSpeed if walkSpeed!=None else cls.walkSpeed
+        stops=inGtfs.stops
+        self.stopIDs=np.asarray(stops.getColumn('stop_id'),dtype=object) if stops.valid \
+                     else np.zeros(0,dtype=object)
+        numOfStops=len(self.stopIDs)
+
+        stopTimes=inGtfs.stop_times
+        patternStops,depList,arrList,tripIDList,tripRowNoList=[],[],[],[],[]
+        if stopTimes.valid and stopTimes.getKeyIndex() is not None and numOfStops>0:
+            rows,tripNo,tripIDs,offsets,runNo,groupTripIDs=expandStopTimeRows(inGtfs)
+            arrival  =stopTimes.getColumn('arrival_time').astype(np.int64)[rows]
+            departure=stopTimes.getColumn('departure_time').astype(np.int64)[rows]
+            departure=np.where(departure>=0,departure,arrival)
+            arrival  =np.where(arrival>=0,arrival,departure)
+            stopNo=getRowNos(stops,np.asarray(stopTimes.getColumn('stop_id'),dtype=object)[rows])
+            tripRowNos=getRowNos(inGtfs.trips,groupTripIDs) if inGtfs.trips.valid \
+                       else np.full(len(groupTripIDs),-1,dtype=np.int64)
+            tripRowNos=tripRowNos[tripNo]
+            # 時刻の無い停車（timepoint でない停車等）と stops に無いバス停は除く
+            keep=(departure>=0) & (stopNo>=0)
+            if inTripMask is not None: keep&=np.append(inTripMask,False)[tripRowNos]
+            arrival,departure=arrival[keep]+offsets[keep],departure[keep]+offsets[keep]
+            stopNo,runNo,tripIDs,tripRowNos=stopNo[keep],runNo[keep],tripIDs[keep],tripRowNos[keep]
+
+            runStart=np.flatnonzero(np.append(True,runNo[1:]!=runNo[:-1])) if len(runNo)>0 \
+                     else np.zeros(0,dtype=np.int64)
+            runEnd=np.append(runStart[1:],len(runNo)).astype(np.int64)
+            multi=runEnd-runStart>=2
+            runStart,runEnd=runStart[multi],runEnd[multi]
+            patternOfRun=groupByStopSequence(stopNo,runStart,runEnd)
+            order=np.lexsort((departure[runStart],patternOfRun))
+            bounds=np.flatnonzero(np.diff(patternOfRun[order],prepend=-1,append=-2))
+            for a,b in zip(bounds[:-1],bounds[1:]):
+                runs=order[a:b]
+                n=runEnd[runs[0]]-runStart[runs[0]]
+                idx=runStart[runs][:,None]+np.arange(n)
+                dep,arr=departure[idx],arrival[idx]
+                if np.all(np.diff(dep,axis=0)>=0) and np.all(np.diff(arr,axis=0)>=0):
+                    lanes=[np.arange(len(runs))]
+                else:
+                    # 追い越しのある便は、追い越しの無い便の組（レーン）に貪欲に振り分ける
+                    lanes=[]
+                    for r in range(len(runs)):
+                        for lane in lanes:
+                            if np.all(dep[r]>=dep[lane[-1]]) and np.all(arr[r]>=arr[lane[-1]]):
+                                lane.append(r)
+                                break
+                        else:
+                            lanes.append([r])
+                    lanes=[np.array(lane) for lane in lanes]
+                for lane in lanes:
+                    patternStops.append(stopNo[runStart[runs[0]]:runEnd[runs[0]]])
+                    depList.append(dep[lane].T.ravel())
+                    arrList.append(arr[lane].T.ravel())
+                    tripIDList.append(tripIDs[runStart[runs[lane]]])
+                    tripRowNoList.append(tripRowNos[runStart[runs[lane]]])
+
+        concat=lambda inList,inDtype: np.concatenate(inList).astype(inDtype) if len(inList)>0 \
+                                      else np.zeros(0,dtype=inDtype)
+        numOfPatternStops=np.array([len(s) for s in patternStops],dtype=np.int64)
+        self.numOfTrips=np.array([len(t) for t in tripIDList],dtype=np.int64)
+        self.patternStopOffsets=np.concatenate(([0],np.cumsum(numOfPatternStops))).astype(np.int64)
+        self.patternTripOffsets=np.concatenate(([0],np.cumsum(self.numOfTrips))).astype(np.int64)
+        self.patternStops=concat(patternStops,np.int64)
+        self.psPattern=np.repeat(np.arange(len(patternStops)),numOfPatternStops)
+        self.tripIDs=concat(tripIDList,object)
+        self.tripRowNos=concat(tripRowNoList,np.int64)
+        routeIDs=inGtfs.trips.getColumn('route_id') if inGtfs.trips.valid else None
+        routeIDs=np.asarray(routeIDs,dtype=object) if routeIDs is not None else np.zeros(0,dtype=object)
+        self.routeIDs=np.append(routeIDs,None)[self.tripRowNos]
+        self.tripPattern=np.repeat(np.arange(len(patternStops)),self.numOfTrips)
+        self.colDep=concat(depList,np.int64)
+        self.colArr=concat(arrList,np.int64)
+        psTrips=self.numOfTrips[self.psPattern]
+        self.colStart=(np.cumsum(psTrips)-psTrips).astype(np.int64)
+        self.colKey=np.repeat(np.arange(len(self.patternStops)),psTrips)*RaptorNetwork.timeKeyScale+self.colDep
+        self.maxTrips=int(self.numOfTrips.max()) if len(self.numOfTrips)>0 else 0
+        self.stopPs=np.argsort(self.patternStops,kind='stable')
+        self.stopPsOffsets=np.concatenate(([0],np.cumsum(np.bincount(self.patternStops,
+                                                                      minlength=numOfStops)))).astype(np.int64)
+        self.buildFootpaths(inGtfs)
+        return self
+
+    # 近くのバス停への徒歩の乗換（walkDistance 以内、所要時間は距離 / walkSpeed）を作成し、
+    # transfers.txt の乗換で置き換える。transfer_type が 3（乗換不可）の乗換は除き、
+    # min_transfer_time の無い乗換の所要時間はバス停間の距離から求める。
+    def buildFootpaths(self,inGtfs):
+        stops=inGtfs.stops
+        numOfStops=len(self.stopIDs)
+        fromStop,toStop,walkTime=(np.zeros(0,dtype=np.int64),)*3
+        if numOfStops>0 and self.walkDistance>0:
+            lat,lon=stops.getColumn('stop_lat').astype(float),stops.getColumn('stop_lon').astype(float)
+            q,rows,d=stops.getGridIndex().within(lat,lon,self.walkDistance,distanceMode=stops.getDistanceMode())
+            other=q!=rows
+            fromStop,toStop=q[other].astype(np.int64),rows[other].astype(np.int64)
+            walkTime=np.ceil(d[other]/self.walkSpeed).astype(np.int64)
+        transfers=inGtfs.transfers
+        if transfers.valid and numOfStops>0:
+            f=getRowNos(stops,np.asarray(transfers.getColumn('from_stop_id'),dtype=object))
+            t=getRowNos(stops,np.asarray(transfers.getColumn('to_stop_id'),dtype=object))
+            transferType=np.asarray(transfers.getColumn('transfer_type'),dtype=float)
+            minTime=transfers.getColumn('min_transfer_time')
+            minTime=np.asarray(minTime,dtype=float) if minTime is not None else np.full(len(f),np.nan)
+            ok=(f>=0) & (t>=0) & (f!=t)
+            f,t,transferType,minTime=f[ok],t[ok],transferType[ok],minTime[ok]
+            overridden=np.isin(fromStop*numOfStops+toStop,f*numOfStops+t)
+            fromStop,toStop,walkTime=fromStop[~overridden],toStop[~overridden],walkTime[~overridden]
+            add=transferType!=3
+            f,t,minTime=f[add],t[add],minTime[add]
+            lat,lon=stops.getColumn('stop_lat').astype(float),stops.getColumn('stop_lon').astype(float)
+            if len(f)>0:
+                d=np.asarray(segmentDistances(lat[f],lon[f],lat[t],lon[t],
+                                              distanceMode=stops.getDistanceMode()),dtype=float).reshape(-1)
+                minTime=np.where(np.isnan(minTime),np.ceil(d/self.walkSpeed),minTime)
+            fromStop=np.concatenate((fromStop,f))
+            toStop=np.concatenate((toStop,t))
+            walkTime=np.concatenate((walkTime,minTime.astype(np.int64)))
+        order=np.lexsort((walkTime,toStop,fromStop))
+        self.footTo,self.footTime=toStop[order],walkTime[order]
+        self.footOffsets=np.concatenate(([0],np.cumsum(np.bincount(fromStop,minlength=numOfStops)))).astype(np.int64)
+
+    # CSR 形式の配列から、inKeys のそれぞれの範囲の要素の位置をまとめて返す（元の番号と共に）。
+    @staticmethod
+    def gatherRanges(inOffsets,inKeys):
+        start,end=inOffsets[inKeys],inOffsets[inKeys+1]
+        counts=end-start
+        pos=np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)+np.repeat(start,counts)
+        return pos,np.repeat(np.arange(len(inKeys)),counts)
+
+    # 到着時刻 inTimes の組 (inStops,inTimes) を、バス停毎に最も早いものだけにする。
+    @staticmethod
+    def minByStop(inStops,inTimes,*inOthers):
+        order=np.lexsort((inTimes,inStops))
+        first=order[np.append(True,inStops[order][1:]!=inStops[order][:-1])] if len(order)>0 else order
+        return (inStops[first],inTimes[first])+tuple(v[first] for v in inOthers)
+
+    # バス停 inStops（到着時刻 inTimes）から徒歩で乗り換えて、inTau より早く着くバス停を求め、
+    # (バス停,到着時刻,乗換元のバス停) を返す。
+    def relaxFootpaths(self,inStops,inTimes,inTau,inBound):
+        pos,k=RaptorNetwork.gatherRanges(self.footOffsets,inStops)
+        to,t=self.footTo[pos],inTimes[k]+self.footTime[pos]
+        ok=(t<inTau[to]) & (t<inBound)
+        return RaptorNetwork.minByStop(to[ok],t[ok],inStops[k][ok])
+
+    # 説明：
+    #     バス停 inSourceStops を時刻 inSourceTimes に出発した場合の、各バス停への最も早い到着時刻を
+    #     乗車回数（ラウンド）毎に求め、RaptorResult として返す。inTarget（バス停の番号）を指定すると、
+    #     inTarget への到着より遅い到着は探索しない。
+    #     徒歩の乗換は便を降りたバス停（と出発地）から 1 回のみとする。便で着いた時刻が
+    #     それまでに便で着いた時刻より早ければ、徒歩で先に着いていたバス停からも徒歩の乗換を行う。
+    def run(self,inSourceStops,inSourceTimes,inMaxTransfers=4,inTarget=-1):
+        INF=RaptorNetwork.infinity
+        numOfStops=len(self.stopIDs)
+        tau=np.full(numOfStops,INF,dtype=np.int64)
+        bestVehicle=tau.copy()
+        src=np.asarray(inSourceStops,dtype=np.int64)
+        srcTimes=np.broadcast_to(np.asarray(inSourceTimes,dtype=np.int64),src.shape)
+        src,srcTimes=RaptorNetwork.minByStop(src,srcTimes)
+        kind=np.zeros(numOfStops,dtype=np.int8)
+        walkFrom=np.full(numOfStops,-1,dtype=np.int64)
+        tau[src]=srcTimes
+        kind[src]=RaptorResult.origin
+        to,t,fr=self.relaxFootpaths(src,srcTimes,tau,INF)
+        tau[to]=t
+        kind[to],walkFrom[to]=RaptorResult.walk,fr
+        rounds=[RaptorRound(tau,kind,walkFrom)]
+        marked=np.union1d(src,to)
+
+        M=self.maxTrips+1
+        for k in range(inMaxTransfers+1):
+            if len(marked)==0: break
+            bound=tau[inTarget] if inTarget>=0 else INF
+            # 印の付いたバス停に停車するパターンを、最初に印の付いた停車から終点まで辿る
+            pos,_=RaptorNetwork.gatherRanges(self.stopPsOffsets,marked)
+            ps=self.stopPs[pos]
+            p=self.psPattern[ps]
+            pattern,firstPs=RaptorNetwork.minByStop(p,ps)
+            counts=self.patternStopOffsets[pattern+1]-firstPs
+            psQ=np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)+np.repeat(firstPs,counts)
+            pQ=np.repeat(pattern,counts)
+            L=len(psQ)
+            # 各停車で前のラウンドの到着時刻以降に出発する最初の便
+            boardTime=tau[self.patternStops[psQ]]
+            tripNo=np.full(L,M-1,dtype=np.int64)
+            can=np.flatnonzero(boardTime<INF)
+            i=np.searchsorted(self.colKey,psQ[can]*RaptorNetwork.timeKeyScale+boardTime[can],side='left') \
+              -self.colStart[psQ[can]]
+            ok=i<self.numOfTrips[pQ[can]]
+            tripNo[can[ok]]=i[ok]
+            # パターン毎にそれまでの停車で乗れる最も早い便（と乗車した停車）を累積で求める
+            enc=(pQ*M+(M-1-tripNo))*L+(L-1-np.arange(L))
+            acc=np.maximum.accumulate(enc) if L>0 else enc
+            accBoard=L-1-acc%L
+            accTrip=M-1-(acc//L-pQ*M)
+            j=np.flatnonzero(pQ[1:]==pQ[:-1])+1
+            tj,board=accTrip[j-1],psQ[accBoard[j-1]]
+            ok=tj<M-1
+            j,tj,board=j[ok],tj[ok],board[ok]
+            arr=self.colArr[self.colStart[psQ[j]]+tj]
+            st=self.patternStops[psQ[j]]
+            ok=(arr<bestVehicle[st]) & (arr<bound)
+            st,arr,trip,board=RaptorNetwork.minByStop(st[ok],arr[ok],self.patternTripOffsets[pQ[j[ok]]]+tj[ok],
+                                                      board[ok])
+            tau=tau.copy()
+            kind=np.zeros(numOfStops,dtype=np.int8)
+            walkFrom=np.full(numOfStops,-1,dtype=np.int64)
+            vehicleTrip=np.full(numOfStops,-1,dtype=np.int64)
+            vehicleBoard=np.full(numOfStops,-1,dtype=np.int64)
+            vehicleArrival=np.full(numOfStops,INF,dtype=np.int64)
+            bestVehicle[st]=vehicleArrival[st]=arr
+            vehicleTrip[st],vehicleBoard[st]=trip,board
+            improved=arr<tau[st]
+            tau[st[improved]]=arr[improved]
+            kind[st[improved]]=RaptorResult.vehicle
+            to,t,fr=self.relaxFootpaths(st,arr,tau,bound)
+            tau[to]=t
+            kind[to],walkFrom[to]=RaptorResult.walk,fr
+            rounds.append(RaptorRound(tau,kind,walkFrom,vehicleTrip,vehicleBoard,vehicleArrival))
+            marked=np.union1d(st[improved],to)
+        return RaptorResult(self,rounds)
+
+# RaptorNetwork.run の 1 ラウンドの結果
+#   tau          : 各バス停への到着時刻（このラウンドまでの乗車回数で最も早いもの、未到達は infinity）
+#   kind         : このラウンドで到着時刻を更新した方法（RaptorResult.vehicle,walk 等、0 は更新無し）
+#   walkFrom     : 徒歩で到着した場合の乗換元のバス停
+#   vehicleTrip  : 便で到着した場合の便の番号、vehicleBoard は乗車した停車、vehicleArrival は到着時刻
+class RaptorRound:
+    def __init__(self,inTau,inKind,inWalkFrom,inVehicleTrip=None,inVehicleBoard=None,inVehicleArrival=None):
+        self.tau=inTau
+        self.kind=inKind
+        self.walkFrom=inWalkFrom
+        self.vehicleTrip=inVehicleTrip
+        self.vehicleBoard=inVehicleBoard
+        self.vehicleArrival=inVehicleArrival
+
+# RaptorNetwork.run の結果（ラウンド毎の到着時刻と、経路を復元するための情報）
+class RaptorResult:
+    origin,vehicle,walk=1,2,3
+
+    def __init__(self,inNetwork,inRounds):
+        self.network=inNetwork
+        self.rounds=inRounds
+
+    # 各バス停への最も早い到着時刻と、その時刻に着く最小のラウンド（乗車回数）を返す。
+    def getArrivals(self):
+        tau=self.rounds[-1].tau
+        roundNo=np.full(len(tau),-1,dtype=np.int64)
+        for k in range(len(self.rounds)-1,-1,-1): roundNo[self.rounds[k].tau==tau]=k
+        return tau,roundNo
+
+    # バス停 inStop（番号）に最も早く（同じ時刻なら乗車回数の少なく）着く経路を、
+    # journey_leg のリストとして返す（到達できない場合は None）。
+    def getLegs(self,inStop):
+        tau,roundNo=self.getArrivals()
+        k=int(roundNo[inStop])
+        if tau[inStop]>=RaptorNetwork.infinity: return None
+        net=self.network
+        stopIDs=net.stopIDs
+        legs=[]
+        s=inStop
+        while True:
+            r=self.rounds[k]
+            kind=r.kind[s]
+            if kind==0:
+                k-=1
+                continue
+            if kind==RaptorResult.origin: break
+            if kind==RaptorResult.walk:
+                f=int(r.walkFrom[s])
+                arrival=int(r.tau[s])
+                departure=int(r.vehicleArrival[f]) if k>0 else int(r.tau[f])
+                legs.append(journey_leg('walk',stopIDs[f],stopIDs[s],
+                                        secondsToTimeStr(departure),secondsToTimeStr(arrival)))
+                s=f
+                if k==0: break
+            trip=int(r.vehicleTrip[s])
+            board=int(r.vehicleBoard[s])
+            b=int(net.patternStops[board])
+            p=int(net.tripPattern[trip])
+            t=trip-int(net.patternTripOffsets[p])
+            departure=int(net.colDep[net.colStart[board]+t])
+            legs.append(journey_leg('transit',stopIDs[b],stopIDs[s],
+                                    secondsToTimeStr(departure),secondsToTimeStr(int(r.vehicleArrival[s])),
+                                    net.tripIDs[trip],net.routeIDs[trip]))
+            s=b
+            k-=1
+        legs.reverse()
+        return legs
+
+# 経路の区間（egGTFS.plan を参照）
+#   mode : 'transit'（便に乗車）または 'walk'（徒歩で乗換）
+class journey_leg:
+    def __init__(self,inMode,inFromStopID,inToStopID,inDepartureTime,inArrivalTime,
+                 inTripID=None,inRouteID=None):
+        self.mode=inMode
+        self.from_stop_id=inFromStopID
+        self.to_stop_id=inToStopID
+        self.departure_time=inDepartureTime
+        self.arrival_time=inArrivalTime
+        self.trip_id=inTripID
+        self.route_id=inRouteID
+
+    def __repr__(self):
+        return 'journey_leg('+', '.join(str(v) for v in
+                                        (self.mode,self.from_stop_id,self.to_stop_id,
+                                         self.departure_time,self.arrival_time,
+                                         self.trip_id,self.route_id))+')'
+
+# 出発地から目的地までの経路（区間 journey_leg のリスト）
+#   transfers : 乗換の回数（乗車した便の数 - 1）
+class journey:
+    def __init__(self,inLegs):
+        self.legs=inLegs
+        self.departure_time=inLegs[0].departure_time if len(inLegs)>0 else None
+        self.arrival_time=inLegs[-1].arrival_time if len(inLegs)>0 else None
+        self.transfers=max(sum(1 for leg in inLegs if leg.mode=='transit')-1,0)
+
+    def __repr__(self):
+        return 'journey('+', '.join(str(v) for v in
+                                    (self.departure_time,self.arrival_time,self.transfers))+', '+ \
+               str(self.legs)+')'
+
+#====================================================================
+# fleet simulation
+#====================================================================
+# 便 inTripNos[i]（BusPositionModel の trip 番号）の運行時間帯 [inStart[i],inEnd[i]] のうち、
+# inStep 秒の倍数の時刻の位置を求め、(便の番号 i,時刻,緯度,経度) の配列の組を返す。
+# inOffsets[i] は frequencies を展開したインスタンスの時刻の offset（その他の便は 0）。
+# 位置が求まらない時刻は含まない。
+def simulateFleetBatch(inModel,inTripNos,inOffsets,inStart,inEnd,inStep):
+    first=-(-np.asarray(inStart,dtype=np.int64)//inStep)*inStep
+    counts=np.maximum((np.asarray(inEnd,dtype=np.int64)-first)//inStep+1,0)
+    i=np.repeat(np.arange(len(counts)),counts)
+    seconds=first[i]+(np.arange(len(i))-np.repeat(np.cumsum(counts)-counts,counts))*inStep
+    pos=inModel.getPositions(np.asarray(inTripNos,dtype=np.int64)[i],seconds-np.asarray(inOffsets)[i])
+    found=~np.isnan(pos[:,0])
+    return i[found],seconds[found],pos[found,0],pos[found,1]
+
+# simulateFleet のプロセスプールで、各プロセスがメモリマップした BusPositionModel
+_fleetModels={}
+
+# プロセスプールで実行される simulateFleetBatch。
+# BusPositionModel の配列は inStorePath に保存されたものをメモリマップして用いるため、
+# 各プロセスの間で物理メモリが共有され、配列をプロセス間で受け渡す必要はない。
+def simulateFleetBatchInProcess(inStorePath,inTripNos,inOffsets,inStart,inEnd,inStep):
+    model=_fleetModels.get(inStorePath)
+    if model is None:
+        arrays,_=FeedCache.fromPath(inStorePath).load('busPositionModel')
+        if arrays is None: raise ValueError('no bus position model: '+str(inStorePath))
+        model=_fleetModels[inStorePath]=BusPositionModel({},arrays)
+    return simulateFleetBatch(model,inTripNos,inOffsets,inStart,inEnd,inStep)
+
+# inRecordSet の主キーの値が inKeys である行の行番号の配列を返す（存在しない場合は -1）。
+# 同じキー値を持つ行が複数ある場合は、先頭の行の行番号を返す。
+def getRowNos(inRecordSet,inKeys):
+    keyIndex=inRecordSet.getKeyIndex()
+    codes,uniques=pd.factorize(np.asarray(inKeys,dtype=object))
+    rowNos=[]
+    for key in uniques:
+        start,end=keyIndex.getRange(key) if keyIndex is not None else (None,None)
+        if start is None: rowNos.append(-1)
+        elif keyIndex.order is None: rowNos.append(start)
+        else: rowNos.append(int(keyIndex.order[start]))
+    rowNos.append(-1)
+    return np.array(rowNos,dtype=np.int64)[codes]
+
+# 時刻（'hh:mm:ss' 形式の文字列、Time オブジェクト、または 0 時からの経過秒数）を
+# 0 時からの経過秒数に変換する。
+def toSeconds(inTime):
+    if isinstance(inTime,Time): return inTime.totalSecond
+    if isinstance(inTime,str):  return Time(inTime).totalSecond
+    return int(inTime)
+
+# 到着時刻 inArrival[i] から次のバス停の出発時刻 inDeparture[i+1] までの間に
+# inSecond が含まれる区間の番号 i を返す（見つからない場合は None）。
+# 時刻は stop_sequence に対して単調増加であるため二分探索で求める。
+def getStopSegmentIndexBySeconds(inArrival,inDeparture,inSecond):
+    n=len(inArrival)
+    i=int(np.searchsorted(inDeparture[1:],inSecond,side='left'))
+    if i<n-1 and inArrival[i]<=inSecond: return i
+    return None
+
+# 時刻の配列（'hh:mm:ss' 形式の文字列、Time オブジェクト、または 0 時からの経過秒数）を
+# 0 時からの経過秒数の配列に変換する。
+def toSecondsArray(inTimes):
+    t=np.asarray(inTimes)
+    if t.dtype.kind in 'iuf': return t.astype(np.int64).ravel()
+    t=t.astype(object).ravel()
+    if all(isinstance(v,str) for v in t): return timeStrArrayToSeconds(t).astype(np.int64)
+    return np.array([v.totalSecond if isinstance(v,Time) else
+                     (Time(v).totalSecond if isinstance(v,str) else int(v)) for v in t],
+                    dtype=np.int64)
+
+# バス停の shape への投影情報（egGTFS.getStopProjection を参照）
+class stop_projection:
+    def __init__(self,inShapeLat,inShapeLon,inShapeCumDist,
+                 inSegmentIndex,inSegmentDist,inFootLat,inFootLon,inNearestPointIndex,
+                 distanceMode='geodesic'):
+        self.segmentIndex=int(inSegmentIndex)
+        self.segmentDist=float(inSegmentDist)
+        self.footPos=[float(inFootLat),float(inFootLon)]
+        self.nearestPointIndex=int(inNearestPointIndex)
+        if self.segmentIndex>=0:
+            i=self.segmentIndex
+            self.alongDist=float(inShapeCumDist[i]+segmentDistances(inShapeLat[i],inShapeLon[i],
+                                                                    inFootLat,inFootLon,
+                                                                    distanceMode=distanceMode))
+        else:
+            self.alongDist=float(inShapeCumDist[self.nearestPointIndex])
+
+    def __str__(self):
+        return str([self.segmentIndex,self.segmentDist,self.footPos,
+                    self.nearestPointIndex,self.alongDist])
+
+# getPosOnPosList と同様に、点列 inPosList 上で先頭から inTargetDistance [m] の位置を返す。
+# inCumDist は inPosList の各点の、先頭の点からの累積距離。
+def getPosOnPosListByCumDist(inPosList,inCumDist,inTargetDistance):
+    if inCumDist[-1]<inTargetDistance:
+        raise ValueError('inPosList is shorter than inTargetDistance.')
+    i=max(int(np.searchsorted(inCumDist,inTargetDistance,side='left'))-1,0)
+    d=float(inCumDist[i+1]-inCumDist[i])
+    rest=float(inTargetDistance-inCumDist[i])
+    if d==rest: return inPosList[i+1]
+    t=rest/d
+    dLat=inPosList[i+1][0]-inPosList[i][0]
+    dLon=inPosList[i+1][1]-inPosList[i][1]
+    return [t*dLat+inPosList[i][0],t*dLon+inPosList[i][1]]
+
+# 点列 (inLat,inLon)（inCumDist はその累積距離）上で、始点から inDistance [m] の位置を
+# [lat,lon] で返す（範囲外の距離は始点または終点とする）。
+def getPosOnShapeByDist(inLat,inLon,inCumDist,inDistance):
+    n=len(inLat)
+    if n<2: return [float(inLat[0]),float(inLon[0])]
+    p=min(max(int(np.searchsorted(inCumDist,inDistance,side='right'))-1,0),n-2)
+    segLen=float(inCumDist[p+1]-inCumDist[p])
+    u=min(max((inDistance-float(inCumDist[p]))/segLen,0.0),1.0) if segLen>0 else 0.0
+    return [float(inLat[p]+u*(inLat[p+1]-inLat[p])),float(inLon[p]+u*(inLon[p+1]-inLon[p]))]
+
 #====================================================================
 # egGTFS 
 #====================================================================
 class egGTFS:
-    def __init__(self,inGtfsZipFilePath):
+    # storage      : 'object'   - 各ファイルの情報を object 型の 2 次元配列で保持する（従来通り）
+    #                'columnar' - 列ごとに型の揃った配列で保持する（ColumnTable を参照）
+    # distanceMode : 'geodesic' または 'haversine'（distanceModeList を参照）
+    # lazy         : True の場合、各構成ファイルは最初にアクセスされた時点で読み込む
+    # cacheDir     : 解析済みの表等を保存するディレクトリ（FeedCache を参照）
+    # readOnly     : True の場合、各構成ファイルの情報をキャッシュのメモリマップとして保持する。
+    #                storage は 'columnar' となり、cacheDir を省略した場合は
+    #                defaultCacheDir() を用いる。
+    # chunkSize    : 各構成ファイルをこの行数ごとに読み込みながら配列を作成する（大きな
+    #                stop_times.txt 等を読み込む際のメモリ使用量を抑える）。storage='columnar'
+    #                （または readOnly=True）の場合のみ指定でき、その他の場合は ValueError となる
+    # columns      : 構成ファイル名をキー、読み込むフィールド名のリストを値とする辞書
+    #                ex: { 'stop_times':['trip_id','arrival_time','departure_time','stop_id'] }
+    # workers      : 2 以上の場合、各構成ファイルをこの数のスレッドで並列に読み込む。
+    #                大きなファイル（stop_times.txt 等）は行の境界で分割して並列に解析する
+    def __init__(self,inGtfsZipFilePath,storage='object',distanceMode='geodesic',lazy=False,
+                 cacheDir=None,readOnly=False,chunkSize=None,columns=None,workers=None):
+        if distanceMode not in distanceModeList:
+            raise ValueError('invalid distanceMode: '+str(distanceMode))
+        self.distanceMode=distanceMode
         self.gtfsZipFilePath=inGtfsZipFilePath
         try:
             zf=self.gtfsZipFileObj =zipfile.ZipFile(inGtfsZipFilePath,'r')
         except:
             print("ERROR: can not open "+inGtfsZipFilePath)
             sys.exit()
-        self.agency         =agency(zf);            self.agency.gtfs            =self
-        self.agency_jp      =agency_jp(zf);         self.agency_jp.gtfs         =self
-        self.stops          =stops(zf);             self.stops.gtfs             =self
-        self.routes         =routes(zf);            self.routes.gtfs            =self
-        self.routes_jp      =routes_jp(zf);         self.routes_jp.gtfs         =self
-        self.trips          =trips(zf);             self.trips.gtfs             =self
-        self.office_jp      =office_jp(zf);         self.office_jp.gtfs         =self
-        self.stop_times     =stop_times(zf);        self.stop_times.gtfs        =self
-        self.calendar       =calendar(zf);          self.calendar.gtfs          =self
-        self.calendar_dates =calendar_dates(zf);    self.calendar_dates.gtfs    =self
-        self.fare_attributes=fare_attributes(zf);   self.fare_attributes.gtfs   =self
-        self.fare_rules     =fare_rules(zf);        self.fare_rules.gtfs        =self
-        self.shapes         =shapes(zf);            self.shapes.gtfs            =self
-        self.frequencies    =frequencies(zf);       self.frequencies.gtfs       =self
-        self.transfers      =transfers(zf);         self.transfers.gtfs         =self
-        self.feed_info      =feed_info(zf);         self.feed_info.gtfs         =self
-        self.translations   =translations(zf);      self.translations.gtfs      =self
+        self._busPositionModel=None
+        self._busPositionModelSource=()
+        self._serviceCalendar=None
+        self._serviceCalendarSource=()
+        self._tripServiceNos=None
+        self._activeTripMask={}
+        self._tripTimeIndex=None
+        self._tripTimeIndexSource=()
+        self._tripInstanceTable=None
+        self._tripInstanceTableSource=()
+        self._stopDepartureIndex=None
+        self._stopDepartureIndexSource=()
+        self._stopProjection={}
+        self._stopProjectionSource=()
+        self._tripPatternTable=None
+        self._tripPatternTableSource=()
+        self._raptorNetworks={}
+        self._raptorNetworkSource=()
+        if readOnly:
+            storage='columnar'
+            if cacheDir==None: cacheDir=defaultCacheDir()
+        if chunkSize!=None and storage!='columnar':
+            raise ValueError('chunkSize requires columnar storage.')
+        self.readOnly=readOnly
+        self.cache=FeedCache(cacheDir,inGtfsZipFilePath) if cacheDir!=None else None
+        self._tableOptions={ 'storage':storage,'cache':self.cache,'readOnly':readOnly,
+                             'chunkSize':chunkSize,'workers':workers }
+        self.columns=columns if columns!=None else {}
+        for tableName in self.columns:
+            if tableName not in egGTFS.tableInfoDict or egGTFS.tableInfoDict[tableName][1]==False:
+                raise ValueError('columns can not be specified for: '+str(tableName))
+        self.lazy=lazy
+        self.workers=workers
+        if lazy==False:
+            tableNames=[ tableName for tableName,_,_ in egGTFS.tableInfoList ]
+            if workers!=None and workers>1:
+                # 各構成ファイルの展開と解析をスレッドで並列に行う
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(self.loadTable,tableNames))
+            else:
+                for tableName in tableNames: self.loadTable(tableName)
+
+    # 構成ファイルマップオブジェクトの名前、クラス、storage 等の引数を渡すか否か
+    tableInfoList=(
+        ('agency',         agency,         False),
+        ('agency_jp',      agency_jp,      False),
+        ('stops',          stops,          True ),
+        ('routes',         routes,         True ),
+        ('routes_jp',      routes_jp,      True ),
+        ('trips',          trips,          True ),
+        ('office_jp',      office_jp,      True ),
+        ('stop_times',     stop_times,     True ),
+        ('calendar',       calendar,       True ),
+        ('calendar_dates', calendar_dates, True ),
+        ('fare_attributes',fare_attributes,True ),
+        ('fare_rules',     fare_rules,     True ),
+        ('shapes',         shapes,         True ),
+        ('frequencies',    frequencies,    True ),
+        ('transfers',      transfers,      True ),
+        ('feed_info',      feed_info,      False),
+        ('translations',   translations,   True ))
+    tableInfoDict={ name:(cls,useOptions) for name,cls,useOptions in tableInfoList }
+
+    # 説明：
+    #     構成ファイルを読み込み、構成ファイルマップオブジェクトを生成する。
+    #     lazy=True で open した場合、各構成ファイルは最初にアクセスされた時点で
+    #     このメソッドにより読み込まれる。
+    def loadTable(self,inTableName):
+        if inTableName not in egGTFS.tableInfoDict:
+            raise ValueError('no such a GTFS file: '+str(inTableName))
+        cls,useOptions=egGTFS.tableInfoDict[inTableName]
+        zf=self.gtfsZipFileObj
+        table=cls(zf,columns=self.columns.get(inTableName),**self._tableOptions) if useOptions else cls(zf)
+        table.gtfs=self
+        self.__dict__[inTableName]=table
+        return table
+
+    # 指定した構成ファイルが読み込み済みか否かを返す
+    def isLoaded(self,inTableName): return inTableName in self.__dict__
+
+    # lazy=True の場合、未読み込みの構成ファイルマップオブジェクトは
+    # 通常の属性として見つからないため、ここで読み込む。
+    def __getattr__(self,inName):
+        if inName in egGTFS.tableInfoDict and 'gtfsZipFileObj' in self.__dict__:
+            return self.loadTable(inName)
+        raise AttributeError("'egGTFS' object has no attribute '"+inName+"'")
 
     def __getitem__(self,fieldName): return getattr(self,fieldName)
 
@@ -798,12 +3493,11 @@ class egGTFS:
         return m
 
     def getStopPosSeqByTripID(self,inTripID):
-        stopTimeSeq=self.stop_times.getSeqByTripID(inTripID)
+        stopTimeSeq=self.stop_times.getSeqArrayByTripID(inTripID)
         if len(stopTimeSeq)==0: return []
         result=[]
         for t in stopTimeSeq:
-            stop=self.stops.getByStopID(t[self.stop_times.index.stop_id])
-            result.append(stop)
+            result.append(self.stops.getPosByStopID(t[self.stop_times.index.stop_id]))
         return result
 
     def getShapeIdByTripID(self,inTripID):
@@ -826,9 +3520,9 @@ class egGTFS:
         c=color
         folium.PolyLine(points,weight=w,color=c).add_to(m)
 
-        stopArray=self.stop_times.getSeqByTripID(inTripID)
+        stopArray=self.stop_times.getSeqArrayByTripID(inTripID)
         for s in stopArray:
-            stopID=s.stop_id
+            stopID=s[self.stop_times.index.stop_id]
             latLon=self.stops.getPosByStopID(stopID)
             folium.Marker(location=latLon,popup=self.makeName(self.stops.getNameByStopID(stopID))).add_to(m)
             latMin,latMax=min(latMin,latLon[0]),max(latMax,latLon[0])
@@ -857,6 +3551,7 @@ class egGTFS:
         area.maxLon=lonMax
         return area
 
+    # epsilon は互換性のために残している（投影情報を用いるため、現在は用いない）。
     def getBusPos(self,inTripID,inHour_or_TimeStr,inMinute=None,inSecond=None,
                   epsilon=0.00003):
         if self.shapes.valid==False or self.shapes.hasRecord==False: return None
@@ -864,55 +3559,635 @@ class egGTFS:
             targetTime=Time(inHour_or_TimeStr)
         else:
             targetTime=Time(inHour_or_TimeStr,inMinute,inSecond)
+        targetSecond=targetTime.totalSecond
+        tripIDs,offsets=self.resolveTripIDs([inTripID])
+        inTripID,targetSecond=tripIDs[0],targetSecond-int(offsets[0])
         trip=self.trips[inTripID]
         if trip==None: raise ValueError('no such a trip ID')
 
-        stopTimes=self.stop_times[inTripID]
-        if stopTimes==None: raise ValueError('invalid GTFS-JP (no such a stop_times)')
+        stopTimes=self.stop_times.getSeqArrayByTripID(inTripID)
         numOfStopTimes=len(stopTimes)
-        if numOfStopTimes==0: raise ValueError('invalid GTFS-JP (zero stop_times)')
-
-        tripStartTime=Time(stopTimes[ 0].arrival_time)
-        tripEndTime  =Time(stopTimes[-1].departure_time)
+        if numOfStopTimes==0: raise ValueError('invalid GTFS-JP (no such a stop_times)')
+        arrival,departure=self.stop_times.getSecondsByTripID(inTripID)
+        if (arrival<0).any() or (departure<0).any():
+            raise ValueError('invalid GTFS-JP (stop_times may be corrupt.')
+        stopIDs=stopTimes[:,self.stop_times.index.stop_id]
 
         # for debug
-        #print('START:'+str(tripStartTime))
-        #print('END  :'+str(tripEndTime))
+        #print('START:'+secondsToTimeStr(arrival[0]))
+        #print('END  :'+secondsToTimeStr(departure[-1]))
         #print('TARGET:'+str(targetTime))
 
-        if targetTime<tripStartTime or tripEndTime<targetTime: return None
+        if targetSecond<arrival[0] or departure[-1]<targetSecond: return None
 
         if trip.shape_id==None: raise ValueError('no shape ID')
         shapeID=trip.shape_id
-        shapes=self.shapes[shapeID]
-        if shapes==None: raise ValueError('invalid GTFS-JP (no such a shape ID)')
+        if self.shapes.getRowRangeByKey(shapeID)[0] is None:
+            raise ValueError('invalid GTFS-JP (no such a shape ID)')
 
-        for stop in stopTimes:
-            if Time(stop.arrival_time)<=targetTime<=Time(stop.departure_time):
-                return self.getPosByStopID(stop.stop_id)
+        atStop=np.flatnonzero((arrival<=targetSecond) & (targetSecond<=departure))
+        if len(atStop)>0: return self.getPosByStopID(stopIDs[atStop[0]])
 
-        targetStopSegmentIndex=self.getStopIdSegmentIndex(stopTimes,targetTime)
+        targetStopSegmentIndex=getStopSegmentIndexBySeconds(arrival,departure,targetSecond)
         if targetStopSegmentIndex==None:
             raise ValueError('invalid GTFS-JP (stop_times may be corrupt.')
 
-        segmentStartTime=Time(stopTimes[targetStopSegmentIndex  ].departure_time)
-        segmentEndTime  =Time(stopTimes[targetStopSegmentIndex+1].arrival_time)
+        segmentStartSecond=int(departure[targetStopSegmentIndex  ])
+        segmentEndSecond  =int(arrival  [targetStopSegmentIndex+1])
+
+        startStopID=stopIDs[targetStopSegmentIndex  ]
+        endStopID  =stopIDs[targetStopSegmentIndex+1]
 
-        startStopPos=self.getPosByStopID(stopTimes[targetStopSegmentIndex].stop_id)
-        endStopPos  =self.getPosByStopID(stopTimes[targetStopSegmentIndex+1].stop_id)
-        #print('start stop pos='+str(startStopPos))
-        #print('end stop pos  ='+str(endStopPos))
-        #print('start stop='+str(self.stops[stopTimes[targetStopSegmentIndex].stop_id]))
-        #print('end   stop='+str(self.stops[stopTimes[targetStopSegmentIndex+1].stop_id]))
+        # 前後のバス停の投影位置（shape 始点からの距離）の間を、時刻の比率で線形に補間する
+        lat,lon=self.shapes.getLatLonArray(shapeID)
+        shapeCumDist=self.shapes.getCumulativeDistances(shapeID)
+        startDist=self.getStopProjection(shapeID,startStopID).alongDist
+        endDist  =self.getStopProjection(shapeID,endStopID).alongDist
+        if endDist<startDist:
+            endDist=self.getForwardAlongDist(shapeID,startStopID,endStopID)
+        distanceRatio=(targetSecond-segmentStartSecond)/(segmentEndSecond-segmentStartSecond)
+        return getPosOnShapeByDist(lat,lon,shapeCumDist,startDist+distanceRatio*(endDist-startDist))
 
-        targetSegmentPosList=self.getTargetSegmentPosList(shapes,startStopPos,endStopPos,epsilon=epsilon)
-        # print('targetSegmentPosList='+str(targetSegmentPosList))
+    # 説明：
+    #     shape ID inShapeID の shape に対する、バス停 inStopID の投影情報を返します。
+    #     返される値は、
+    #         segmentIndex      : 垂線の足が求まる線分のうち最も近い線分の番号（無い場合は -1）
+    #         segmentDist       : その線分までの距離（緯度経度空間）
+    #         footPos           : 垂線の足の位置 [lat,lon]
+    #         nearestPointIndex : 最も近い shape の点の番号
+    #         alongDist         : 投影位置の shape 始点からの距離 [m]
+    #     を持つ stop_projection オブジェクトです。
+    #     計算結果は (shape_id,stop_id) 毎に egGTFS オブジェクトにキャッシュされます。
+    def getStopProjection(self,inShapeID,inStopID):
+        self.validateStopProjectionCache()
+        key=(inShapeID,inStopID)
+        ret=self._stopProjection.get(key)
+        if ret is None:
+            self.buildStopProjections([(inShapeID,inStopID)])
+            ret=self._stopProjection.get(key)
+        return ret
 
-        shapeTripDistance=self.getPosListDistance(targetSegmentPosList)
-        # print('shape trip distance[m]='+str(shapeTripDistance))
+    def validateStopProjectionCache(self):
+        source=(self.shapes.data,self.stops.data)
+        if any(a is not b for a,b in zip(self._stopProjectionSource,source)):
+            self._stopProjection={}
+            self._stopProjectionSource=source
 
-        distanceRatio=(targetTime-segmentStartTime).totalSecond/(segmentEndTime-segmentStartTime).totalSecond
-        ret=self.getPosOnPosList(targetSegmentPosList,shapeTripDistance*distanceRatio)
+    # 説明：
+    #     (shape_id,stop_id) の組それぞれについて getStopProjection の計算を行い、
+    #     キャッシュします。inPairs を省略した場合は、trips と stop_times に現れる
+    #     全ての組について計算します。
+    def buildStopProjections(self,inPairs=None):
+        if self.shapes.valid==False: return
+        self.validateStopProjectionCache()
+        if inPairs is None:
+            tripShape=pd.Series(self.trips.getColumn('shape_id'),
+                                index=self.trips.getColumn('trip_id'))
+            tripShape=tripShape[~tripShape.index.duplicated()]
+            pairs=pd.DataFrame({ 'shape_id':tripShape.reindex(self.stop_times.getColumn('trip_id')).to_numpy(),
+                                 'stop_id':self.stop_times.getColumn('stop_id') })
+            inPairs=pairs.dropna().drop_duplicates().itertuples(index=False,name=None)
+        stopIDsByShape={}
+        for shapeID,stopID in inPairs:
+            if (shapeID,stopID) in self._stopProjection: continue
+            stopIDsByShape.setdefault(shapeID,[]).append(stopID)
+        for shapeID,stopIDs in stopIDsByShape.items():
+            lat,lon=self.shapes.getLatLonArray(shapeID)
+            if lat is None: continue
+            stopPos=np.array([self.getPosByStopID(t) for t in stopIDs],dtype=float).reshape(-1,2)
+            result=getNearestSegmentsAndPoints(lat,lon,stopPos[:,0],stopPos[:,1],
+                                               segmentIndex=self.shapes.getSegmentIndex(shapeID))
+            cumDist=self.shapes.getCumulativeDistances(shapeID)
+            for i,stopID in enumerate(stopIDs):
+                self._stopProjection[(shapeID,stopID)]= \
+                    stop_projection(lat,lon,cumDist,*[t[i] for t in result],
+                                    distanceMode=self.distanceMode)
+
+    # saveStopProjections で保存するファイルの形式の版（保存する内容を変えた場合は更新する）
+    stopProjectionFormatVersion=1
+
+    # 説明：
+    #     キャッシュされている投影情報をファイル（.npz 形式）に保存します。
+    #     loadStopProjections で読み込むことで、計算を省略できます。
+    #     distanceMode と、各組のバス停の位置、shape の点の数も合わせて保存します。
+    def saveStopProjections(self,inFilePath):
+        self.validateStopProjectionCache()
+        keys=list(self._stopProjection.keys())
+        values=[self._stopProjection[k] for k in keys]
+        np.savez_compressed(inFilePath,
+            formatVersion=np.array(egGTFS.stopProjectionFormatVersion),
+            distanceMode=np.array(self.distanceMode),
+            shape_id=np.array([str(k[0]) for k in keys],dtype=str),
+            stop_id=np.array([str(k[1]) for k in keys],dtype=str),
+            numOfShapePoints=np.array([self.getNumOfShapePoints(k[0]) for k in keys],dtype=np.int64),
+            stopPos=np.array([self.getPosByStopID(k[1]) for k in keys],dtype=float).reshape(-1,2),
+            segmentIndex=np.array([v.segmentIndex for v in values],dtype=np.int64),
+            segmentDist=np.array([v.segmentDist for v in values],dtype=float),
+            footPos=np.array([v.footPos for v in values],dtype=float).reshape(-1,2),
+            nearestPointIndex=np.array([v.nearestPointIndex for v in values],dtype=np.int64),
+            alongDist=np.array([v.alongDist for v in values],dtype=float))
+
+    # shape ID の shape の点の数を返す（存在しない場合は -1）。
+    def getNumOfShapePoints(self,inShapeID):
+        if self.shapes.valid==False: return -1
+        start,end=self.shapes.getRowRangeByKey(inShapeID)
+        return -1 if start is None else end-start
+
+    # 説明：
+    #     saveStopProjections で保存した投影情報を読み込み、キャッシュします。
+    #     保存時と distanceMode が異なるファイルや、形式の異なる古いファイルは ValueError とします。
+    #     保存時とバス停の位置や shape の点の数が異なる組は読み込まず、必要な時に計算し直します。
+    #     ex: gtfs.loadStopProjections('projections.npz')
+    def loadStopProjections(self,inFilePath):
+        self.validateStopProjectionCache()
+        with np.load(inFilePath) as f:
+            # NpzFile の添字による参照は毎回配列全体を展開するため、各配列を一度だけ読み出す
+            arrays={ name:f[name] for name in f.files }
+        formatVersion=int(arrays['formatVersion']) if 'formatVersion' in arrays else None
+        if formatVersion!=egGTFS.stopProjectionFormatVersion:
+            raise ValueError('unsupported stop projection file: '+str(inFilePath))
+        distanceMode=str(arrays['distanceMode'])
+        if distanceMode!=self.distanceMode:
+            raise ValueError('stop projections were saved with distanceMode: '+distanceMode)
+        shapeIDs={ str(k):k for k in self.shapes.getKeyIndex().keyPos } if self.shapes.valid else {}
+        stopIDs ={ str(k):k for k in self.stops.getKeyIndex().keyPos }
+        segmentIndex=arrays['segmentIndex'].tolist()
+        segmentDist=arrays['segmentDist'].tolist()
+        footPos=arrays['footPos'].tolist()
+        nearestPointIndex=arrays['nearestPointIndex'].tolist()
+        alongDist=arrays['alongDist'].tolist()
+        numOfShapePoints=arrays['numOfShapePoints'].tolist()
+        stopPos=arrays['stopPos'].tolist()
+        for i,(shapeID,stopID) in enumerate(zip(arrays['shape_id'].tolist(),arrays['stop_id'].tolist())):
+            shapeID=shapeIDs.get(shapeID); stopID=stopIDs.get(stopID)
+            if shapeID is None or stopID is None: continue
+            if self.getNumOfShapePoints(shapeID)!=numOfShapePoints[i] or \
+               [float(v) for v in self.getPosByStopID(stopID)]!=stopPos[i]: continue
+            projection=stop_projection.__new__(stop_projection)
+            projection.segmentIndex=segmentIndex[i]
+            projection.segmentDist=segmentDist[i]
+            projection.footPos=footPos[i]
+            projection.nearestPointIndex=nearestPointIndex[i]
+            projection.alongDist=alongDist[i]
+            self._stopProjection[(shapeID,stopID)]=projection
+
+    # shape が同じ場所を 2 度通る場合など、バス停 inEndStopID の投影位置が
+    # バス停 inStartStopID の投影位置より手前になる場合に用いる。
+    # inEndStopID を inStartStopID の投影位置以降の線分に投影し直し、shape 始点からの距離 [m] を返す。
+    def getForwardAlongDist(self,inShapeID,inStartStopID,inEndStopID):
+        lat,lon=self.shapes.getLatLonArray(inShapeID)
+        shapeCumDist=self.shapes.getCumulativeDistances(inShapeID)
+        start=self.getStopProjection(inShapeID,inStartStopID)
+        searchFrom=start.segmentIndex if start.segmentIndex>=0 else start.nearestPointIndex
+        endPos=self.getPosByStopID(inEndStopID)
+        result=getNearestSegmentsAndPoints(lat,lon,[endPos[0]],[endPos[1]],inSearchFrom=searchFrom,
+                                           segmentIndex=self.shapes.getSegmentIndex(inShapeID))
+        end=stop_projection(lat,lon,shapeCumDist,*[t[0] for t in result],distanceMode=self.distanceMode)
+        return max(end.alongDist,start.alongDist)
+
+    # 説明：
+    #     trip ID の配列と時刻の配列を与え、各時刻のバスの位置をまとめて計算し、
+    #     (N,2) の numpy 配列 [[lat,lon],...] として返します。
+    #     運行していない時刻や、存在しない trip ID に対応する行は NaN となります。
+    #     時刻は 'hh:mm:ss' 形式の文字列、Time オブジェクト、0 時からの経過秒数の
+    #     いずれでも指定できます。一方をスカラーとした場合は、他方の長さに合わせます。
+    #     shapes が無い trip については、バス停間を直線で補間した位置を返します。
+    #     ex: gtfs.getBusPositions(['trip1','trip2'],'08:00:00')
+    #         gtfs.getBusPositions('trip1',np.arange(7*3600,8*3600,10))
+    def getBusPositions(self,inTripIDs,inTimes):
+        tripIDs=np.asarray(inTripIDs,dtype=object)
+        if tripIDs.ndim==0: tripIDs=tripIDs.reshape(1)
+        seconds=toSecondsArray(inTimes if isArray(inTimes) and not isinstance(inTimes,str) else [inTimes])
+        if len(tripIDs)==1 and len(seconds)!=1:  tripIDs=np.repeat(tripIDs,len(seconds))
+        elif len(seconds)==1 and len(tripIDs)!=1: seconds=np.repeat(seconds,len(tripIDs))
+        if len(tripIDs)!=len(seconds): raise ValueError('length mismatch: trip IDs and times')
+        tripIDs,offsets=self.resolveTripIDs(tripIDs)
+        model=self.getBusPositionModel()
+        return model.getPositions(model.getTripNos(tripIDs),seconds-offsets)
+
+    # getBusPositions が用いる BusPositionModel を返す（最初の呼び出し時に作成される）。
+    # stop_times,stops,shapes,trips のいずれかの data が置き換えられた場合は作り直す。
+    def getBusPositionModel(self):
+        tables=(self.stop_times,self.stops,self.shapes,self.trips)
+        source=tuple(getattr(t,'data',None) for t in tables)
+        if self._busPositionModel is None or \
+           any(a is not b for a,b in zip(self._busPositionModelSource,source)):
+            if self.cache!=None and all(t.isCacheSource() or t.valid==False for t in tables):
+                entryName='busPositionModel.'+self.distanceMode
+                arrays,_=self.cache.load(entryName)
+                if arrays is None:
+                    model=BusPositionModel.build(self)
+                    self.cache.save(entryName,model.getArrays())
+                else:
+                    model=BusPositionModel(self.stop_times.getKeyIndex().keyPos,arrays)
+                self._busPositionModel=model
+            else:
+                self._busPositionModel=BusPositionModel.build(self)
+            self._busPositionModelSource=source
+        return self._busPositionModel
+
+    # calendar と calendar_dates より作成した ServiceCalendar を返す（最初の呼び出し時に作成される）。
+    # calendar,calendar_dates,trips のいずれかの data が置き換えられた場合は作り直す。
+    def getServiceCalendar(self):
+        source=tuple(getattr(t,'data',None) for t in (self.calendar,self.calendar_dates,self.trips))
+        if self._serviceCalendar is None or \
+           any(a is not b for a,b in zip(self._serviceCalendarSource,source)):
+            self._serviceCalendar=ServiceCalendar.build(self)
+            self._serviceCalendarSource=source
+            self._tripServiceNos=None
+            self._activeTripMask={}
+        return self._serviceCalendar
+
+    # 説明：
+    #     指定した日付に運行するサービスの service_id の配列を返します。
+    #     日付は datetime.date、'YYYYMMDD' や 'YYYY-MM-DD' 形式の文字列、
+    #     20230401 のような整数で指定します。
+    #     ex: serviceIDs=gtfs.activeServices('20230401')
+    def activeServices(self,inDate):
+        serviceCalendar=self.getServiceCalendar()
+        return serviceCalendar.serviceIDs[serviceCalendar.getServiceMask(toDayNumber(inDate))]
+
+    # 説明：
+    #     指定した日付に運行する trip を示す、trips の行と同じ並びの bool 配列を返します。
+    #     結果は日付毎にキャッシュされます（書き換えないで下さい）。
+    #     ex: gtfs.trips.filterByMask(gtfs.getActiveTripMask('20230401'))
+    def getActiveTripMask(self,inDate):
+        serviceCalendar=self.getServiceCalendar()
+        day=toDayNumber(inDate)
+        ret=self._activeTripMask.get(day)
+        if ret is None:
+            if self.trips.valid==False: return np.zeros(0,dtype=bool)
+            if self._tripServiceNos is None:
+                self._tripServiceNos=serviceCalendar.getServiceNos(self.trips.getColumn('service_id'))
+            ret=np.append(serviceCalendar.getServiceMask(day),False)[self._tripServiceNos]
+            ret.flags.writeable=False
+            self._activeTripMask[day]=ret
+        return ret
+
+    # 説明：
+    #     指定した日付に運行する trip の trip_id の配列を返します。
+    #     ex: tripIDs=gtfs.activeTrips('20230401')
+    def activeTrips(self,inDate):
+        mask=self.getActiveTripMask(inDate)
+        if len(mask)==0: return np.zeros(0,dtype=object)
+        return np.asarray(self.trips.getColumn('trip_id'),dtype=object)[mask]
+
+    # frequencies を展開した TripInstanceTable を返す（最初の呼び出し時に作成される）。
+    # frequencies,stop_times のいずれかの data が置き換えられた場合は作り直す。
+    def getTripInstanceTable(self):
+        source=tuple(getattr(t,'data',None) for t in (self.frequencies,self.stop_times))
+        if self._tripInstanceTable is None or \
+           any(a is not b for a,b in zip(self._tripInstanceTableSource,source)):
+            self._tripInstanceTable=TripInstanceTable.build(self)
+            self._tripInstanceTableSource=source
+        return self._tripInstanceTable
+
+    # 説明：
+    #     frequencies の各行を運行間隔毎の便（インスタンス）に展開した表を DataFrame で返します。
+    #     列は trip_id（インスタンスの trip ID）、base_trip_id（元の trip_id）、
+    #     start_time（始発の出発時刻、0 時からの経過秒数）、offset（元の trip の時刻に加える秒数）、
+    #     exact_times です。インスタンスの trip ID は getBusPos、getBusPositions、
+    #     getSecondsByTripID、tripsActiveBetween 等に通常の trip ID と同様に指定できます。
+    #     ex: instances=gtfs.expandFrequencies()
+    def expandFrequencies(self):
+        table=self.getTripInstanceTable()
+        return pd.DataFrame({ 'trip_id':table.instanceIDs,'base_trip_id':table.tripIDs,
+                              'start_time':table.start,'offset':table.offsets,
+                              'exact_times':table.exactTimes })
+
+    # trip ID（配列）を (元の trip_id の配列,時刻の offset の配列) に変換する。
+    # frequencies を展開したインスタンスでない trip ID はそのまま（offset は 0）となる。
+    def resolveTripIDs(self,inTripIDs):
+        return self.getTripInstanceTable().resolve(inTripIDs)
+
+    # 説明：
+    #     指定した trip の各停車の到着時刻と出発時刻（0 時からの経過秒数）の配列の組を返します。
+    #     frequencies を展開したインスタンスの trip ID を指定した場合は、
+    #     そのインスタンスの時刻を返します（時刻が無い停車は -1 となります）。
+    def getSecondsByTripID(self,inTripID):
+        tripIDs,offsets=self.resolveTripIDs([inTripID])
+        arrival,departure=self.stop_times.getSecondsByTripID(tripIDs[0])
+        if offsets[0]==0: return arrival,departure
+        offset=int(offsets[0])
+        return np.where(arrival>=0,arrival+offset,-1),np.where(departure>=0,departure+offset,-1)
+
+    # tripsActiveBetween が用いる TripTimeIndex を返す（最初の呼び出し時に作成される）。
+    # stop_times,trips,frequencies のいずれかの data が置き換えられた場合は作り直す。
+    def getTripTimeIndex(self):
+        source=tuple(getattr(t,'data',None) for t in (self.stop_times,self.trips,self.frequencies))
+        if self._tripTimeIndex is None or \
+           any(a is not b for a,b in zip(self._tripTimeIndexSource,source)):
+            self._tripTimeIndex=TripTimeIndex.build(self)
+            self._tripTimeIndexSource=source
+        return self._tripTimeIndex
+
+    # 説明：
+    #     運行時間帯（始発の到着時刻から終着の出発時刻まで）が [inStartTime,inEndTime] と
+    #     重なる trip の trip_id の配列を、始発時刻の昇順で返します。
+    #     時刻は 'hh:mm:ss' 形式の文字列、Time オブジェクト、0 時からの経過秒数で指定します。
+    #     date を指定した場合は、その日に運行する trip のみを返します。
+    #     ex: tripIDs=gtfs.tripsActiveBetween('07:00:00','08:00:00',date='20230403')
+    def tripsActiveBetween(self,inStartTime,inEndTime,date=None):
+        index=self.getTripTimeIndex()
+        i=index.getOverlapping(toSeconds(inStartTime),toSeconds(inEndTime))
+        if date!=None:
+            mask=np.append(self.getActiveTripMask(date),False)
+            i=i[mask[index.tripRowNos[i]]]
+        return index.tripIDs[i]
+
+    # departures が用いる StopDepartureIndex を返す（最初の呼び出し時に作成される）。
+    # stop_times,trips,frequencies のいずれかの data が置き換えられた場合は作り直す。
+    def getStopDepartureIndex(self):
+        source=tuple(getattr(t,'data',None) for t in (self.stop_times,self.trips,self.frequencies))
+        if self._stopDepartureIndex is None or \
+           any(a is not b for a,b in zip(self._stopDepartureIndexSource,source)):
+            self._stopDepartureIndex=StopDepartureIndex.build(self)
+            self._stopDepartureIndexSource=source
+        return self._stopDepartureIndex
+
+    # 説明：
+    #     バス停 inStopID から時刻 inAfter 以降に出発する便を、出発時刻の早い順に
+    #     最大 limit 個、departure_record（departure_time,trip_id,route_id,headsign）の
+    #     リストとして返します。時刻は 'hh:mm:ss' 形式の文字列、Time オブジェクト、
+    #     0 時からの経過秒数で指定します。date を指定した場合は、その日に運行する便のみを返します。
+    #     終着のバス停での停車や、乗車できない停車（pickup_type=1）は含まれません。
+    #     ex: gtfs.departures('akc0016','08:15:00',limit=5,date='20230403')
+    def departures(self,inStopID,inAfter,limit=10,date=None):
+        index=self.getStopDepartureIndex()
+        tripMask=self.getActiveTripMask(date) if date!=None else None
+        ret=[]
+        for i in index.getDepartures(inStopID,toSeconds(inAfter),limit,tripMask):
+            ret.append(departure_record(secondsToTimeStr(index.departure[i]),index.tripIDs[i],
+                                        index.routeIDs[i],index.headsigns[i]))
+        return ret
+
+    # 説明：
+    #     各便の連続するバス停の組（区間）について、前のバス停の出発時刻から次のバス停の
+    #     到着時刻までの所要時間 [秒] を集計し、
+    #         from_stop_id,to_stop_id,(hour),count,min,median,max
+    #     を列とする DataFrame を返します（count は区間を走行する便の数です）。
+    #     date を指定した場合は、その日に運行する便のみを集計します。
+    #     by_hour=True とすると、前のバス停の出発時刻の時（0 時からの経過時間、24 以上もあり得る）
+    #     毎に集計します。frequencies の便は、展開したインスタンス毎に 1 便として数えます。
+    #     ex: runTimes=gtfs.segmentRunTimes(date='20230403',by_hour=True)
+    def segmentRunTimes(self,date=None,by_hour=False):
+        columns=['from_stop_id','to_stop_id']+(['hour'] if by_hour else [])+['count','min','median','max']
+        stopTimes=self.stop_times
+        if stopTimes.valid==False or stopTimes.getKeyIndex() is None: return pd.DataFrame(columns=columns)
+        rows,tripNo,_,offsets,runNo,groupTripIDs=expandStopTimeRows(self)
+        arrival  =stopTimes.getColumn('arrival_time').astype(np.int64)[rows]
+        departure=stopTimes.getColumn('departure_time').astype(np.int64)[rows]
+        departure=np.where(departure>=0,departure,arrival)
+        arrival  =np.where(arrival>=0,arrival,departure)
+        hasTime=departure>=0
+        departure,arrival=departure+offsets,arrival+offsets
+        stopNo,stopIDs=pd.factorize(np.asarray(stopTimes.getColumn('stop_id'),dtype=object)[rows])
+
+        # 区間 j は行 j から行 j+1 まで
+        valid=(runNo[:-1]==runNo[1:]) & hasTime[:-1] & hasTime[1:] & (stopNo[:-1]>=0) & (stopNo[1:]>=0)
+        if date!=None:
+            tripRowNos=getRowNos(self.trips,groupTripIDs) if self.trips.valid \
+                       else np.full(len(groupTripIDs),-1,dtype=np.int64)
+            valid&=np.append(self.getActiveTripMask(date),False)[tripRowNos][tripNo[:-1]]
+        j=np.flatnonzero(valid)
+        edges=pd.DataFrame({ 'from':stopNo[j],'to':stopNo[j+1] })
+        if by_hour: edges['hour']=departure[j]//3600
+        edges['duration']=arrival[j+1]-departure[j]
+        keys=['from','to']+(['hour'] if by_hour else [])
+        ret=edges.groupby(keys,sort=True)['duration'].agg(['count','min','median','max']).reset_index()
+        stopIDs=np.asarray(stopIDs,dtype=object)
+        ret.insert(0,'from_stop_id',stopIDs[ret.pop('from').to_numpy()])
+        ret.insert(1,'to_stop_id',stopIDs[ret.pop('to').to_numpy()])
+        return ret[columns]
+
+    # 停車するバス停の並びが同じ trip をまとめた TripPatternTable を返す（最初の呼び出し時に作成される）。
+    # stop_times の data が置き換えられた場合は作り直す。
+    def getTripPatternTable(self):
+        source=(getattr(self.stop_times,'data',None),)
+        if self._tripPatternTable is None or \
+           any(a is not b for a,b in zip(self._tripPatternTableSource,source)):
+            self._tripPatternTable=TripPatternTable.build(self)
+            self._tripPatternTableSource=source
+        return self._tripPatternTable
+
+    # 説明：
+    #     停車するバス停の並びが同じ trip をまとめたパターンの一覧を、
+    #         pattern_id,num_trips,num_stops,first_stop_id,last_stop_id
+    #     を列とする DataFrame として返します。pattern_id は 0 から始まる番号です。
+    #     ex: patterns=gtfs.tripPatterns()
+    def tripPatterns(self):
+        table=self.getTripPatternTable()
+        numOfStops=np.diff(table.stopOffsets)
+        hasStops=numOfStops>0
+        first=np.full(len(table),None,dtype=object)
+        last=np.full(len(table),None,dtype=object)
+        first[hasStops]=table.stopIDs[table.stopOffsets[:-1][hasStops]]
+        last[hasStops]=table.stopIDs[table.stopOffsets[1:][hasStops]-1]
+        return pd.DataFrame({ 'pattern_id':np.arange(len(table)),'num_trips':np.diff(table.tripOffsets),
+                              'num_stops':numOfStops,'first_stop_id':first,'last_stop_id':last })
+
+    # 説明：
+    #     trip ID の trip が属するパターンの pattern_id を返します（存在しない場合は None）。
+    #     ex: patternID=gtfs.getPatternIdByTripID('trip1')
+    def getPatternIdByTripID(self,inTripID):
+        return self.getTripPatternTable().getPatternOfTrip(inTripID)[0]
+
+    # 説明：
+    #     パターン inPatternID の時刻表を、便（trip_id）を行、バス停（stop_id）を列とし、
+    #     'hh:mm:ss' 形式の時刻（時刻の無い停車は NaN）を値とする DataFrame として返します。
+    #     便は始発の時刻の順に並びます。kind='arrival' とすると到着時刻の表となります。
+    #     ex: gtfs.patternTimetable(0).to_csv('pattern0.csv')
+    def patternTimetable(self,inPatternID,kind='departure'):
+        if kind not in ('arrival','departure'): raise ValueError('invalid kind: '+str(kind))
+        table=self.getTripPatternTable()
+        times=table.getArrival(inPatternID) if kind=='arrival' else table.getDeparture(inPatternID)
+        values=np.array([secondsToTimeStr(t) for t in times.ravel()],dtype=object).reshape(times.shape)
+        return pd.DataFrame(values,index=pd.Index(table.getTripIDs(inPatternID),name='trip_id'),
+                            columns=table.getStopIDs(inPatternID))
+
+    # 説明：
+    #     パターン inPatternID の経路（最初の便の shape）とバス停を描いた地図を返します（getTripMap を参照）。
+    #     ex: gtfs.getPatternMap(0).save('pattern0.html')
+    def getPatternMap(self,inPatternID,weight=8,color="#0000FF"):
+        return self.getTripMap(self.getTripPatternTable().getTripIDs(inPatternID)[0],weight=weight,color=color)
+
+    # 説明：
+    #     パターン inPatternID の便のうち、時刻 inTime に運行している便を時刻の行列から求め、
+    #     その trip ID の配列と位置の (N,2) の numpy 配列 [[lat,lon],...] の組を返します。
+    #     位置は getBusPositions と同じ方法で求めます。frequencies の trip は、
+    #     frequencies.txt の時刻ではなく stop_times に記載された時刻で運行しているものとします。
+    #     ex: tripIDs,positions=gtfs.getPatternBusPositions(0,'08:00:00')
+    def getPatternBusPositions(self,inPatternID,inTime):
+        table=self.getTripPatternTable()
+        arrival,departure=table.getArrival(inPatternID),table.getDeparture(inPatternID)
+        second=toSeconds(inTime)
+        start=np.where(departure>=0,departure,arrival)
+        start=np.where(start>=0,start,np.iinfo(np.int32).max).min(axis=1)
+        end=np.where(arrival>=0,arrival,departure).max(axis=1)
+        running=np.flatnonzero((start<=second) & (second<=end))
+        tripIDs=table.getTripIDs(inPatternID)[running]
+        model=self.getBusPositionModel()
+        return tripIDs,model.getPositions(model.getTripNos(tripIDs),np.full(len(tripIDs),second,dtype=np.int64))
+
+    # 乗換案内のネットワーク（RaptorNetwork）を返す（date,walkDistance,walkSpeed 毎に最初の呼び出し時に作成される）。
+    # date を指定した場合は、その日に運行する便のみからなるネットワークとなる。
+    # 徒歩の乗換の距離と速さを省略した場合は、RaptorNetwork.walkDistance,walkSpeed とする。
+    def getRaptorNetwork(self,date=None,walkDistance=None,walkSpeed=None):
+        source=tuple(getattr(t,'data',None) for t in (self.stop_times,self.trips,self.stops,self.transfers,
+                                                      self.frequencies,self.calendar,self.calendar_dates))
+        if any(a is not b for a,b in zip(self._raptorNetworkSource,source)) or \
+           len(self._raptorNetworkSource)!=len(source):
+            self._raptorNetworks={}
+            self._raptorNetworkSource=source
+        walkDistance=walkDistance if walkDistance!=None else RaptorNetwork.walkDistance
+        walkSpeed=walkSpeed if walkSpeed!=None else RaptorNetwork.walkSpeed
+        key=(toDayNumber(date) if date!=None else None,walkDistance,walkSpeed)
+        ret=self._raptorNetworks.get(key)
+        if ret is None:
+            tripMask=self.getActiveTripMask(date) if date!=None else None
+            ret=self._raptorNetworks[key]=RaptorNetwork.build(self,tripMask,walkDistance=walkDistance,
+                                                              walkSpeed=walkSpeed)
+        return ret
+
+    # stop_id を stops の行番号に変換する（存在しない場合は ValueError）。
+    def getStopNo(self,inStopID):
+        ret=int(getRowNos(self.stops,np.array([inStopID],dtype=object))[0]) if self.stops.valid else -1
+        if ret<0: raise ValueError('no such a stop ID: '+str(inStopID))
+        return ret
+
+    # 説明：
+    #     バス停 inFromStop を時刻 inDepartAfter 以降に出発して、バス停 inToStop に最も早く着く経路を
+    #     求め、journey（legs,departure_time,arrival_time,transfers）として返します。
+    #     到着時刻が同じ経路のうちでは乗換の少ないものを返し、到達できない場合は None を返します。
+    #     経路は区間 journey_leg（mode,from_stop_id,to_stop_id,departure_time,arrival_time,trip_id,
+    #     route_id）のリストで、mode は 'transit'（便に乗車）または 'walk'（徒歩で乗換）です。
+    #     乗換は maxTransfers 回までとし、近くのバス停（RaptorNetwork.walkDistance 以内）と
+    #     transfers.txt の乗換で徒歩の乗換ができるものとします。
+    #     date を指定した場合は、その日に運行する便のみを用います。
+    #     ex: route=gtfs.plan('akc0016','akc0031','08:00:00',date='20230403')
+    def plan(self,inFromStop,inToStop,inDepartAfter,date=None,maxTransfers=4):
+        network=self.getRaptorNetwork(date)
+        fromStop,toStop=self.getStopNo(inFromStop),self.getStopNo(inToStop)
+        result=network.run([fromStop],toSeconds(inDepartAfter),maxTransfers,inTarget=toStop)
+        legs=result.getLegs(toStop)
+        return journey(legs) if legs is not None else None
+
+    # 説明：
+    #     バス停 inFromStop を時刻 inStartTime から inEndTime までの間に出発して、
+    #     バス停 inToStop に着く経路のうち、より遅く出発してより早く着く経路が他に無いもの
+    #     （パレート最適な経路）を、出発時刻の昇順に journey のリストとして返します。
+    #     出発地（と徒歩で乗り換えられるバス停）から出発する便の時刻毎に plan と同じ探索を行います。
+    #     ex: routes=gtfs.planProfile('akc0016','akc0031','07:00:00','09:00:00',date='20230403')
+    def planProfile(self,inFromStop,inToStop,inStartTime,inEndTime,date=None,maxTransfers=4):
+        network=self.getRaptorNetwork(date)
+        fromStop,toStop=self.getStopNo(inFromStop),self.getStopNo(inToStop)
+        start,end=toSeconds(inStartTime),toSeconds(inEndTime)
+        # 出発地と徒歩で乗り換えられるバス停からの出発時刻を、出発地を出る時刻に換算する
+        pos,_=RaptorNetwork.gatherRanges(network.footOffsets,np.array([fromStop]))
+        sources=np.append(fromStop,network.footTo[pos])
+        walkTimes=np.append(0,network.footTime[pos])
+        pos,k=RaptorNetwork.gatherRanges(network.stopPsOffsets,sources)
+        ps=network.stopPs[pos]
+        offsets=np.append(network.colStart,len(network.colDep))
+        pos,i=RaptorNetwork.gatherRanges(offsets,ps)
+        times=network.colDep[pos]-walkTimes[k[i]]
+        times=np.unique(times[(times>=start) & (times<=end)])[::-1]
+        ret=[]
+        bestArrival=RaptorNetwork.infinity
+        for t in times:
+            result=network.run([fromStop],t,maxTransfers,inTarget=toStop)
+            arrival=result.rounds[-1].tau[toStop]
+            if arrival<bestArrival:
+                ret.append(journey(result.getLegs(toStop)))
+                bestArrival=arrival
+        ret.reverse()
+        return ret
+
+    # 説明：
+    #     バス停 inFromStop を時刻 inDepartAfter 以降に出発した場合の、到達できる全てのバス停への
+    #     最も早い到着時刻を求め、stop_id,arrival（0 時からの経過秒数）,transfers（その時刻に着く
+    #     最少の乗換回数）を列とする DataFrame を到着時刻の昇順で返します。
+    #     引数は plan と同じです（出発地は transfers=0、arrival=出発時刻となります）。
+    #     ex: reach=gtfs.earliestArrivals('akc0016','08:00:00',date='20230403')
+    def earliestArrivals(self,inFromStop,inDepartAfter,date=None,maxTransfers=4):
+        network=self.getRaptorNetwork(date)
+        result=network.run([self.getStopNo(inFromStop)],toSeconds(inDepartAfter),maxTransfers)
+        tau,roundNo=result.getArrivals()
+        reached=np.flatnonzero(tau<RaptorNetwork.infinity)
+        reached=reached[np.lexsort((reached,tau[reached]))]
+        return pd.DataFrame({ 'stop_id':network.stopIDs[reached],'arrival':tau[reached],
+                              'transfers':np.maximum(roundNo[reached]-1,0) })
+
+    # 説明：
+    #     date に運行する全ての便（frequencies の便は展開したインスタンス）について、
+    #     step 秒毎（時刻が step の倍数）の位置を求め、便の組ごとに
+    #         { 'time':時刻（0 時からの経過秒数）,'trip_id':trip ID,'lat':緯度,'lon':経度 }
+    #     の numpy 配列の辞書として順に返すジェネレータです。
+    #     date を省略した場合は全ての便を対象とします。startTime,endTime を指定すると
+    #     その時間帯のみを対象とします。位置は getBusPositions と同じ方法で求めます。
+    #     workers に 2 以上を指定すると、便を分割してプロセスプールで並列に計算します。
+    #     この場合、位置の計算に用いる配列は一時ディレクトリに保存してメモリマップで
+    #     各プロセスから共有し、egGTFS オブジェクトはプロセス間で受け渡しません。
+    #     ex: for rows in gtfs.simulateFleet('20230403',step=10,workers=8):
+    #             df=pd.DataFrame(rows)
+    def simulateFleet(self,date=None,step=10,workers=None,startTime=None,endTime=None,
+                      batchRows=1000000):
+        index=self.getTripTimeIndex()
+        sel=np.arange(len(index.tripIDs))
+        if date!=None: sel=sel[np.append(self.getActiveTripMask(date),False)[index.tripRowNos]]
+        start,end=index.start[sel],index.end[sel]
+        if startTime!=None: start=np.maximum(start,toSeconds(startTime))
+        if endTime!=None:   end  =np.minimum(end,toSeconds(endTime))
+        tripIDs=index.tripIDs[sel]
+        baseTripIDs,offsets=self.resolveTripIDs(tripIDs)
+        model=self.getBusPositionModel()
+        tripNos=model.getTripNos(baseTripIDs)
+
+        # 位置の数がおよそ batchRows となるように便を分割する
+        counts=np.maximum((end-(-(-start//step)*step))//step+1,0)
+        numOfBatches=max(-(-int(counts.sum())//batchRows),1)
+        if workers!=None and workers>1: numOfBatches=max(numOfBatches,workers*4)
+        numOfBatches=max(min(numOfBatches,len(tripIDs)),1)
+        cum=np.cumsum(counts)
+        cuts=np.searchsorted(cum,np.arange(1,numOfBatches)*cum[-1]/numOfBatches) if len(cum)>0 else []
+        bounds=np.unique(np.concatenate(([0],cuts,[len(tripIDs)]))).astype(np.int64)
+        batches=list(zip(bounds[:-1],bounds[1:]))
+        toRows=lambda a,r: { 'time':r[1],'trip_id':tripIDs[a+r[0]],'lat':r[2],'lon':r[3] }
+        args=lambda a,b: (tripNos[a:b],offsets[a:b],start[a:b],end[a:b],step)
+
+        if workers==None or workers<=1:
+            for a,b in batches: yield toRows(a,simulateFleetBatch(model,*args(a,b)))
+            return
+        storePath=tempfile.mkdtemp(prefix='egGTFS-fleet-')
+        try:
+            FeedCache.fromPath(storePath).save('busPositionModel',model.getArrays())
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # 結果を順に返しながら、計算中の組の数を workers の 2 倍までとする
+                pending=[]
+                for a,b in batches:
+                    pending.append((a,executor.submit(simulateFleetBatchInProcess,storePath,*args(a,b))))
+                    if len(pending)>=workers*2:
+                        a,future=pending.pop(0)
+                        yield toRows(a,future.result())
+                for a,future in pending: yield toRows(a,future.result())
+        finally:
+            shutil.rmtree(storePath,ignore_errors=True)
+
+    # 説明：
+    #     simulateFleet の結果を、ディレクトリ inOutDir に便の組ごとの Parquet ファイル
+    #     （part-00000.parquet,...）として保存し、保存したファイルのパスのリストを返します。
+    #     引数は simulateFleet と同じです。Parquet の保存には pyarrow が必要です
+    #     （pip install egGTFS[parquet]）。pyarrow が無い場合は ImportError となります。
+    #     ex: gtfs.simulateFleetToParquet('fleet-20230403','20230403',step=10,workers=8)
+    def simulateFleetToParquet(self,inOutDir,date=None,step=10,workers=None,**inOptions):
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ImportError('simulateFleetToParquet requires pyarrow (pip install egGTFS[parquet])')
+        os.makedirs(inOutDir,exist_ok=True)
+        ret=[]
+        for i,rows in enumerate(self.simulateFleet(date,step=step,workers=workers,**inOptions)):
+            path=os.path.join(inOutDir,'part-{:05d}.parquet'.format(i))
+            pd.DataFrame(rows).to_parquet(path,engine='pyarrow',index=False)
+            ret.append(path)
         return ret
 
     def getPosByStopID(self,inStopID): return self.stops.getPosByStopID(inStopID)
@@ -920,12 +4195,9 @@ class egGTFS:
     # inTargetTime で与えられた時間が存在する、バス停の区間のインデックス値 n を返す。
     # targetTime in [n,n+1]
     def getStopIdSegmentIndex(self,inStopTimes,inTargetTime):
-        n=len(inStopTimes)
-        for i in range(n-1):
-            t1=Time(inStopTimes[i].arrival_time)
-            t2=Time(inStopTimes[i+1].departure_time)
-            if t1<=inTargetTime<=t2: return i
-        return None
+        arrival  =timeStrArrayToSeconds([t.arrival_time   for t in inStopTimes])
+        departure=timeStrArrayToSeconds([t.departure_time for t in inStopTimes])
+        return getStopSegmentIndexBySeconds(arrival,departure,toSeconds(inTargetTime))
             
     def getTargetSegmentPosList(self,inShapes,inStartPos,inEndPos,epsilon=0.00003):
         if inShapes[-1].shape_pt_lat==inStartPos[0] and inShapes[-1].shape_pt_lon==inStartPos[1]:
@@ -1023,48 +4295,141 @@ class egGTFS:
 
     # 与えられた [[lat1,lon1],[lat2,lon2],...]  の配列の距離をメートル単位で返す
     def getPosListDistance(self,inPosList):
-        n=len(inPosList)
-        ret=0
-        for i in range(n-1): ret+=geodesic(inPosList[i],inPosList[i+1]).m
-        return ret
+        if len(inPosList)<2: return 0
+        return float(polylineCumulativeDistances(inPosList,distanceMode=self.distanceMode)[-1])
 
     # inTargetDistance はメートル単位で指定すること
     def getPosOnPosList(self,inPosList,inTargetDistance):
-        if self.getPosListDistance(inPosList)<inTargetDistance:
-            raise ValueError('inPosList is shorter than inTargetDistance.')
-        rest=inTargetDistance
-        n=len(inPosList)
-        for i in range(n-1):
-            d=geodesic(inPosList[i],inPosList[i+1]).m
-            if rest>d:
-                rest-=d
-                continue
-            else:
-                break
-        if d==rest: return inPosList[i+1]
-        t=rest/d
-        dLat=inPosList[i+1][0]-inPosList[i][0]
-        dLon=inPosList[i+1][1]-inPosList[i][1]
-        lat=t*dLat+inPosList[i][0]
-        lon=t*dLon+inPosList[i][1]
-        return [lat,lon]
-
-    def save(self,inOutputZipFilePath):
+        cumDist=polylineCumulativeDistances(inPosList,distanceMode=self.distanceMode)
+        return getPosOnPosListByCumDist(inPosList,cumDist,inTargetDistance)
+
+    # compresslevel : 指定した場合は、その圧縮レベル（0 - 9）で deflate 圧縮して保存する
+    #                 （省略した場合は従来通り無圧縮）
+    # workers       : 2 以上を指定すると、その数のスレッドで各構成ファイルの CSV を並行して作成する
+    #                 （zip ファイルへの書き込みは構成ファイルごとに順に行う）
+    # 並行して作成する場合に、構成ファイルごとに書き込み待ちとするチャンクの数の上限
+    saveQueueSize=4
+    def save(self,inOutputZipFilePath,compresslevel=None,workers=None):
         targetZipFilePath=inOutputZipFilePath if inOutputZipFilePath.endswith(".zip") else inOutputZipFilePath+".zip"
         if(os.path.isfile(targetZipFilePath)): os.remove(targetZipFilePath)
 
-        gtfsObjName=[ "agency","agency_jp","stops","routes","routes_jp","trips",
-            "office_jp","stop_times","calendar","calendar_dates","fare_attributes",
-            "fare_rules","shapes","frequencies","transfers","feed_info","translations"]
-        with zipfile.ZipFile(targetZipFilePath,"a") as destZf:
-            for objName in gtfsObjName:
-                t=getattr(self,objName)
-                saveMethod=getattr(t,"save")
-                saveMethod(destZf)
+        compression=zipfile.ZIP_STORED if compresslevel==None else zipfile.ZIP_DEFLATED
+        tables=[ getattr(self,objName) for objName,_,_ in egGTFS.tableInfoList ]
+        with zipfile.ZipFile(targetZipFilePath,"a",compression=compression,
+                             compresslevel=compresslevel) as destZf:
+            if workers==None or workers<=1:
+                for t in tables: t.save(destZf)
+            else:
+                # 各構成ファイルの CSV のチャンクを、上限のあるキューを通して作成した順に書き込む
+                # （書き込み待ちのチャンクは構成ファイルごとに saveQueueSize 個までとなる）
+                queues=[ queue.Queue(maxsize=egGTFS.saveQueueSize) for _ in tables ]
+                stop=threading.Event()
+                def put(inQueue,inItem):
+                    while not stop.is_set():
+                        try:
+                            inQueue.put(inItem,timeout=0.1)
+                            return True
+                        except queue.Full:
+                            pass
+                    return False
+                def produce(inTable,inQueue):
+                    try:
+                        if inTable.valid:
+                            for chunk in inTable.iterCsvChunks():
+                                if not put(inQueue,chunk): return
+                        put(inQueue,None)
+                    except Exception as e:
+                        put(inQueue,e)
+                def consume(inQueue):
+                    while True:
+                        chunk=inQueue.get()
+                        if chunk is None: return
+                        if isinstance(chunk,Exception): raise chunk
+                        yield chunk
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    try:
+                        for t,q in zip(tables,queues): executor.submit(produce,t,q)
+                        for t,q in zip(tables,queues): t.save(destZf,consume(q))
+                    finally:
+                        stop.set()
 
     # ---------------------------------------------------------------
     # filtered GTFS
     # ---------------------------------------------------------------
+    # 説明：
+    #     停留所・路線・便の選択を外部キーに沿って各構成ファイルに伝搬させ、
+    #     選択に関連するレコードのみを残すように一括して絞り込みます。
+    #     stops, routes, trips には ID の集合、または getMask と同じ形式の条件の辞書
+    #     （ex: stops={'stop_name':Contains('美術')}）を指定します。
+    #     指定した全ての選択を満たす便（指定した停留所に停車する便など）を求め、
+    #     それらの便が参照する routes, stops, shapes, calendar 等と、
+    #     それらを参照する stop_times, frequencies, transfers 等を絞り込みます。
+    #     戻り値は構成ファイル名をキー、残す行を表す bool 型の配列を値とする辞書です。
+    #     update=False の場合は絞り込みを行わず、この辞書のみを返します。
+    def subset(self,stops=None,routes=None,trips=None,update=True):
+        uniqueValues=lambda inValues: pd.Series(np.asarray(inValues)).dropna().unique()
+        hasField=lambda inTable,inFieldName: inTable.valid and getattr(inTable.index,inFieldName,-1)>=0
+        def selectionMask(inTable,inSelection,inKeyFieldName):
+            if isinstance(inSelection,dict): return inTable.getMask(**inSelection)
+            return inTable.getMask(**{ inKeyFieldName:IsIn(inSelection) })
+        def valuesOf(inTable,inFieldName,inMask):
+            return uniqueValues(inTable.getColumn(inFieldName)[inMask])
+
+        masks={}
+        tripMask=self.trips.getMask()
+        if trips!=None: tripMask&=selectionMask(self.trips,trips,'trip_id')
+        if routes!=None:
+            routeIDs=valuesOf(self.routes,'route_id',selectionMask(self.routes,routes,'route_id'))
+            tripMask&=self.trips.getMask(route_id=IsIn(routeIDs))
+        if stops!=None:
+            stopIDs=valuesOf(self.stops,'stop_id',selectionMask(self.stops,stops,'stop_id'))
+            servingMask=self.stop_times.getMask(stop_id=IsIn(stopIDs))
+            tripMask&=self.trips.getMask(trip_id=IsIn(valuesOf(self.stop_times,'trip_id',servingMask)))
+        masks['trips']=tripMask
+
+        # 便を参照する表
+        tripIDs=valuesOf(self.trips,'trip_id',tripMask)
+        masks['stop_times']=self.stop_times.getMask(trip_id=IsIn(tripIDs))
+        if hasField(self.frequencies,'trip_id'):
+            masks['frequencies']=self.frequencies.getMask(trip_id=IsIn(tripIDs))
+
+        # 便が参照する表
+        routeIDs=valuesOf(self.trips,'route_id',tripMask)
+        masks['routes']=self.routes.getMask(route_id=IsIn(routeIDs))
+        if hasField(self.routes_jp,'route_id'):
+            masks['routes_jp']=self.routes_jp.getMask(route_id=IsIn(routeIDs))
+        serviceIDs=valuesOf(self.trips,'service_id',tripMask)
+        for name in ('calendar','calendar_dates'):
+            if hasField(self[name],'service_id'):
+                masks[name]=self[name].getMask(service_id=IsIn(serviceIDs))
+        if hasField(self.trips,'shape_id') and hasField(self.shapes,'shape_id'):
+            masks['shapes']=self.shapes.getMask(shape_id=IsIn(valuesOf(self.trips,'shape_id',tripMask)))
+        if hasField(self.trips,'jp_office_id') and hasField(self.office_jp,'office_id'):
+            masks['office_jp']=self.office_jp.getMask(
+                office_id=IsIn(valuesOf(self.trips,'jp_office_id',tripMask)))
+
+        # 停留所（親駅を含む）と、停留所を参照する表
+        stopIDs=valuesOf(self.stop_times,'stop_id',masks['stop_times'])
+        stopMask=self.stops.getMask(stop_id=IsIn(stopIDs))
+        if hasField(self.stops,'parent_station'):
+            stopMask|=self.stops.getMask(stop_id=IsIn(valuesOf(self.stops,'parent_station',stopMask)))
+            stopIDs=valuesOf(self.stops,'stop_id',stopMask)
+        masks['stops']=stopMask
+        if hasField(self.transfers,'from_stop_id') and hasField(self.transfers,'to_stop_id'):
+            masks['transfers']=self.transfers.getMask(from_stop_id=IsIn(stopIDs),to_stop_id=IsIn(stopIDs))
+
+        # 運賃（route_id の指定の無い運賃ルールは残す）
+        if hasField(self.fare_rules,'route_id'):
+            masks['fare_rules']=self.fare_rules.getMask(route_id=IsIn(routeIDs)) \
+                                | pd.isna(self.fare_rules.getColumn('route_id'))
+            if hasField(self.fare_rules,'fare_id') and hasField(self.fare_attributes,'fare_id'):
+                masks['fare_attributes']=self.fare_attributes.getMask(
+                    fare_id=IsIn(valuesOf(self.fare_rules,'fare_id',masks['fare_rules'])))
+
+        if update:
+            for name,mask in masks.items(): self[name].filterByMask(mask)
+        return masks
+
     def replaceFiltered_agency(self):
         self.agency.agency_id="Not_a_correct_GTFS_because_it_is_filtered."
         self.agency.agency_name="Not a correct GTFS because it is filtered."
@@ -1073,12 +4438,15 @@ class egGTFS:
         self.agency.agency_fare_url=""
         self.agency.agency_email=""
 
-def version(): return "2.1.1"
+def version(): return "2.1.2"
 
-def open(inGtfsZipFilePath):
+def open(inGtfsZipFilePath,storage='object',distanceMode='geodesic',lazy=False,cacheDir=None,
+         readOnly=False,chunkSize=None,columns=None,workers=None):
     if os.path.exists(inGtfsZipFilePath)==False:
         raise FileNotFoundError("ERROR: no such GTFS file '"+inGtfsZipFilePath+"'")
-    return egGTFS(inGtfsZipFilePath)
+    return egGTFS(inGtfsZipFilePath,storage=storage,distanceMode=distanceMode,lazy=lazy,
+                  cacheDir=cacheDir,readOnly=readOnly,chunkSize=chunkSize,columns=columns,
+                  workers=workers)
 
 def isArray(x): return hasattr(x,'__len__')
 
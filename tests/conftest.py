@@ -0,0 +1,37 @@
+import os
+import re
+import zipfile
+
+import pytest
+
+import egGTFS
+
+dataDir=os.path.join(os.path.dirname(__file__),'data','feed')
+
+# tests/data/feed の各ファイルを GTFS の zip ファイルにまとめ、そのパスを返す。
+@pytest.fixture(scope='session')
+def feedPath(tmp_path_factory):
+    path=tmp_path_factory.mktemp('feed')/'feed.zip'
+    with zipfile.ZipFile(path,'w') as zf:
+        for fileName in sorted(os.listdir(dataDir)):
+            zf.write(os.path.join(dataDir,fileName),fileName)
+    return str(path)
+
+@pytest.fixture(params=['object','columnar'])
+def gtfs(request,feedPath):
+    return egGTFS.open(feedPath,storage=request.param)
+
+# trip_id を数値（T1a -> 11 等）に置き換えたフィードを作成し、そのパスを返す。
+numericTripIDs={ 'T1a':'11','T1b':'12','T1c':'13','T2a':'21','T2b':'22','T2c':'23','T3':'31' }
+
+@pytest.fixture(scope='session')
+def numericTripFeedPath(tmp_path_factory):
+    path=tmp_path_factory.mktemp('numeric')/'feed.zip'
+    pattern=re.compile(r'(?<![^,\n])('+'|'.join(numericTripIDs)+r')(?=,|\r?\n|$)')
+    with zipfile.ZipFile(path,'w') as zf:
+        for fileName in sorted(os.listdir(dataDir)):
+            with open(os.path.join(dataDir,fileName),encoding='utf-8') as f: text=f.read()
+            if fileName in ('trips.txt','stop_times.txt','frequencies.txt'):
+                text=pattern.sub(lambda m: numericTripIDs[m.group(1)],text)
+            zf.writestr(fileName,text)
+    return str(path)
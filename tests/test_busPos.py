@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+import egGTFS
+
+
+def test_getBusPosInterpolatesAlongShape(gtfs):
+    # S1 は A,B,C,G を通る東西方向の直線で、T1a は A を 08:00、B を 08:05 に出発する
+    pos=gtfs.getBusPos('T1a','08:02:30')
+    assert pos==pytest.approx([39.7,140.105],abs=1e-9)
+    assert gtfs.getBusPos('T1a','08:05:00')==pytest.approx(gtfs.getPosByStopID('B'))
+    assert gtfs.getBusPos('T1a','07:59:59')==None
+
+
+def test_getBusPosMatchesGetBusPositions(gtfs):
+    for tripID in ('T1a','T2b','T3@08:20:00'):
+        arrival,departure=gtfs.getSecondsByTripID(tripID)
+        for second in range(int(arrival[0]),int(departure[-1])+1,37):
+            pos=gtfs.getBusPos(tripID,str(egGTFS.Time.fromTotalSecond(second)))
+            expected=gtfs.getBusPositions(tripID,second)[0]
+            assert np.allclose(pos,expected,atol=1e-6)
@@ -0,0 +1,29 @@
+import importlib
+import os
+import re
+
+import egGTFS
+
+module=importlib.import_module('egGTFS.egGTFS')
+
+
+def test_versionMatchesPyproject():
+    path=os.path.join(os.path.dirname(__file__),'..','pyproject.toml')
+    with open(path,encoding='utf-8') as f:
+        match=re.search(r"^version\s*=\s*'([^']+)'",f.read(),re.MULTILINE)
+    assert match and egGTFS.version()==match.group(1)
+
+
+def test_cacheKeyDependsOnFormatVersion(monkeypatch,feedPath):
+    key=module.FeedCache.makeKey(feedPath)
+    assert key.endswith('-'+egGTFS.version()+'-'+str(module.FeedCache.formatVersion))
+    monkeypatch.setattr(module.FeedCache,'formatVersion',module.FeedCache.formatVersion+1)
+    assert module.FeedCache.makeKey(feedPath)!=key
+
+
+def test_cacheRoundTrip(feedPath,tmp_path):
+    cacheDir=str(tmp_path/'cache')
+    first=egGTFS.open(feedPath,storage='columnar',cacheDir=cacheDir)
+    second=egGTFS.open(feedPath,readOnly=True,cacheDir=cacheDir)
+    assert list(first.stop_times.getColumn('stop_id'))==list(second.stop_times.getColumn('stop_id'))
+    assert list(first.stop_times.getColumn('drop_off_type'))==list(second.stop_times.getColumn('drop_off_type'))
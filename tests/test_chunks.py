@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import egGTFS
+
+
+def assertSameColumns(inExpected,inActual):
+    for name in inExpected.fieldNameList:
+        expected=inExpected.getColumn(name)
+        actual=inActual.getColumn(name)
+        if expected is None:
+            assert actual is None,name
+            continue
+        assert expected.dtype==actual.dtype,name
+        assert pd.Series(expected).equals(pd.Series(actual)),name
+
+
+@pytest.mark.parametrize('chunkSize',[1,3,100])
+def test_chunkedBuilderGivesSameTables(feedPath,chunkSize):
+    whole=egGTFS.open(feedPath,storage='columnar')
+    chunked=egGTFS.open(feedPath,storage='columnar',chunkSize=chunkSize)
+    for tableName in ('stops','stop_times','trips','shapes','frequencies','transfers'):
+        assertSameColumns(getattr(whole,tableName),getattr(chunked,tableName))
+    assert chunked.plan('A','E','07:55:00',date='20240401').arrival_time== \
+           whole.plan('A','E','07:55:00',date='20240401').arrival_time
+
+
+def test_iterChunksGivesSameRowsAsWholeLoad(gtfs):
+    chunks=list(gtfs.stop_times.iterChunks(4,columns=['trip_id','arrival_time','stop_id']))
+    assert [ len(t) for t in chunks ]==[4,4,4,4,2]
+    df=pd.concat(chunks,ignore_index=True)
+    assert list(df.columns)==['trip_id','arrival_time','stop_id']
+    # iterChunks はファイルの行の順に返す（fixture の stop_times は trip、stop_sequence の順）
+    assert list(df['trip_id'])==list(gtfs.stop_times.getColumn('trip_id'))
+    assert list(df['stop_id'])==list(gtfs.stop_times.getColumn('stop_id'))
+    assert np.array_equal(df['arrival_time'].to_numpy(dtype=np.int64),
+                          gtfs.stop_times.getColumn('arrival_time').astype(np.int64))
+
+
+def test_chunkSizeRequiresColumnarStorage(feedPath):
+    with pytest.raises(ValueError):
+        egGTFS.open(feedPath,chunkSize=100)
+    gtfs=egGTFS.open(feedPath,storage='columnar',chunkSize=100,lazy=True)
+    assert len(gtfs.stop_times.getColumn('trip_id'))==18
@@ -0,0 +1,16 @@
+def getDepartureTuples(inDepartures):
+    return [ (t.departure_time,t.trip_id) for t in inDepartures ]
+
+
+def test_departuresAcrossFrequencyInstances(gtfs):
+    # T3 は 08:00〜09:00 の間 1200 秒毎に運行する（exact_times=1）
+    assert getDepartureTuples(gtfs.departures('H','08:10:00',date='20240401'))== \
+           [('08:20:00','T3@08:20:00'),('08:40:00','T3@08:40:00')]
+    assert getDepartureTuples(gtfs.departures('H','07:00:00',limit=1))==[('08:00:00','T3@08:00:00')]
+
+
+def test_departuresSkipLastStopAndOtherDays(gtfs):
+    # 終着のバス停での停車は含まれない
+    assert gtfs.departures('K','00:00:00')==[]
+    assert getDepartureTuples(gtfs.departures('A','08:10:00',date='20240401'))==[('08:20:00','T1b')]
+    assert getDepartureTuples(gtfs.departures('A','08:10:00',date='20240406'))==[('09:00:00','T1c')]
@@ -0,0 +1,67 @@
+import importlib
+
+import numpy as np
+import pytest
+from geopy.distance import geodesic, great_circle
+
+import egGTFS
+
+module=importlib.import_module('egGTFS.egGTFS')
+
+pairs=[ ((39.7,140.10),(39.7,140.11)),
+        ((39.7003,140.12),(39.71,140.12)),
+        ((35.6812,139.7671),(34.7025,135.4959)),
+        ((0.0,0.0),(0.0,0.0)),
+        ((-33.8688,151.2093),(51.5074,-0.1278)) ]
+
+
+def test_vincentyMatchesGeopy():
+    lat1,lon1=np.array([ p for p,_ in pairs ]).T
+    lat2,lon2=np.array([ q for _,q in pairs ]).T
+    dist=module.vincentyDistance(lat1,lon1,lat2,lon2)
+    for d,(p,q) in zip(dist,pairs):
+        assert d==pytest.approx(geodesic(p,q).m,abs=1e-3)
+    # 説明：スカラーを渡した場合も計算できること
+    assert float(module.vincentyDistance(39.7,140.10,39.7,140.11))== \
+           pytest.approx(geodesic((39.7,140.10),(39.7,140.11)).m,abs=1e-3)
+    # 説明：ほぼ対蹠点となる組は geopy にて計算される
+    assert float(module.vincentyDistance(0.0,0.0,0.5,179.7))== \
+           pytest.approx(geodesic((0.0,0.0),(0.5,179.7)).m,abs=1e-3)
+
+
+def test_haversineMatchesGreatCircle():
+    for p,q in pairs:
+        d=float(module.haversineDistance(p[0],p[1],q[0],q[1]))
+        assert d==pytest.approx(great_circle(p,q).m,rel=1e-6,abs=1e-6)
+
+
+def test_cumulativeDistancesRestartPerGroup():
+    lat=np.array([39.7,39.7,39.7,39.7003,39.71])
+    lon=np.array([140.10,140.11,140.12,140.12,140.12])
+    d=module.cumulativeDistances(lat,lon,np.array([0,3,5]))
+    assert d[0]==0 and d[3]==0
+    assert d[2]==pytest.approx(geodesic((39.7,140.10),(39.7,140.11)).m+
+                               geodesic((39.7,140.11),(39.7,140.12)).m,abs=1e-3)
+    assert d[4]==pytest.approx(geodesic((39.7003,140.12),(39.71,140.12)).m,abs=1e-3)
+    with pytest.raises(ValueError):
+        module.segmentDistances(lat,lon,lat,lon,distanceMode='flat')
+
+
+@pytest.mark.parametrize('distanceMode',['geodesic','haversine'])
+def test_shapeDistanceTable(feedPath,distanceMode):
+    gtfs=egGTFS.open(feedPath,storage='columnar',distanceMode=distanceMode)
+    measure=geodesic if distanceMode=='geodesic' else great_circle
+    cum=gtfs.shapes.getCumulativeDistances('S1')
+    posList=[ [39.7,140.10+0.01*i] for i in range(4) ]
+    expected=np.cumsum([0]+[ measure(posList[i],posList[i+1]).m for i in range(3) ])
+    assert np.allclose(cum,expected,rtol=1e-6)
+    # 説明：geodesic の場合は shapes.txt の shape_dist_traveled とほぼ一致すること
+    if distanceMode=='geodesic': assert np.allclose(cum,[0.0,857.7,1715.3,2573.0],atol=1.0)
+    assert len(gtfs.shapes.getDistanceTable())==len(gtfs.shapes.data)
+    assert gtfs.getPosListDistance(posList)==pytest.approx(expected[-1],rel=1e-6)
+    assert gtfs.getPosListDistance(posList[:1])==0
+
+
+def test_invalidDistanceMode(feedPath):
+    with pytest.raises(ValueError):
+        egGTFS.open(feedPath,distanceMode='flat')
@@ -0,0 +1,65 @@
+import re
+import zipfile
+
+import numpy as np
+import pytest
+
+import egGTFS
+from egGTFS import IsIn
+
+
+def test_dropOffTypeIsTypedInColumnarStorage(feedPath):
+    gtfs=egGTFS.open(feedPath,storage='columnar')
+    column=gtfs.stop_times.getColumn('drop_off_type')
+    assert column.dtype==np.int32
+    assert list(column[:4])==[1,0,0,0]
+
+
+def test_dropOffTypeGetterAndSave(feedPath,tmp_path):
+    gtfs=egGTFS.open(feedPath)
+    record=gtfs.stop_times.data[0]
+    assert int(gtfs.stop_times.drop_off_type(record))==1
+    path=str(tmp_path/'saved.zip')
+    gtfs.save(path)
+    saved=egGTFS.open(path,storage='columnar')
+    assert list(saved.stop_times.getColumn('drop_off_type'))== \
+           list(gtfs.stop_times.getColumn('drop_off_type').astype(int))
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_shapeDistTraveled(feedPath,storage):
+    gtfs=egGTFS.open(feedPath,storage=storage)
+    column=gtfs.shapes.getColumn('shape_dist_traveled')
+    assert column is not None
+    if storage=='columnar': assert column.dtype.kind=='f'
+    assert [ float(t) for t in column[:4] ]==[0.0,857.7,1715.3,2573.0]
+    assert float(gtfs.shapes.shape_dist_traveled(gtfs.shapes.data[1]))==857.7
+
+
+# route_id を数値の文字列（R1 -> 01 等）に置き換えたフィードを作成する
+def makeNumericRouteFeed(inFeedPath,inPath):
+    with zipfile.ZipFile(inFeedPath) as src, zipfile.ZipFile(inPath,'w') as dst:
+        for name in src.namelist():
+            text=src.read(name).decode('utf-8')
+            if name in ('routes.txt','trips.txt','fare_rules.txt'):
+                text=re.sub(r'(^|\n|,)R(\d)(?=,|\r?\n|$)',r'\g<1>0\2',text)
+            dst.writestr(name,text)
+    return inPath
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_numericIDsAreReadAsStrings(feedPath,tmp_path,storage):
+    gtfs=egGTFS.open(makeNumericRouteFeed(feedPath,str(tmp_path/'numeric.zip')),storage=storage)
+    assert list(gtfs.routes.getColumn('route_id'))==['01','02','03']
+    assert gtfs.trips.route_id(gtfs.trips.data[0])=='01'
+    assert gtfs.routes['02'].route_long_name=='線2'
+    assert len(gtfs.trips.filterBy(route_id='01',update=False))==3
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_intLookupMatchesNumericIDs(feedPath,tmp_path,storage):
+    gtfs=egGTFS.open(makeNumericRouteFeed(feedPath,str(tmp_path/'numeric.zip')),storage=storage)
+    assert gtfs.routes[2].route_long_name=='線2'
+    assert gtfs.routes[4]==None
+    assert len(gtfs.trips.filterBy(route_id=1,update=False))==3
+    assert len(gtfs.trips.filterBy(route_id=IsIn([2,3]),update=False))==4
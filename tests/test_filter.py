@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from egGTFS import Between, Contains, IsIn
+
+
+def test_conditionsMatchPredicate(gtfs):
+    stopTimes=gtfs.stop_times
+    mask=stopTimes.getMask(departure_time=Between('08:10:00','08:30:00'))
+    expected=[ '08:10:00'<=t.departure_time<='08:30:00' for t in map(stopTimes.recordClass,stopTimes.data) ]
+    assert list(mask)==expected and mask.sum()==9
+    mask=stopTimes.getMask(trip_id=IsIn(['T1a','T3']),stop_sequence=Between(2))
+    assert [ stopTimes.stop_id(int(i)) for i in np.flatnonzero(mask) ]==['B','C','G','K']
+    assert list(np.flatnonzero(gtfs.stops.getMask(stop_name=Contains('K,北'))))==[7]
+    assert gtfs.stops.getMask(stop_id='C').sum()==1
+    assert gtfs.stops.getMask().all()
+    with pytest.raises(ValueError):
+        gtfs.stops.getMask(no_such_field=1)
+
+
+def test_filterBy(gtfs):
+    filtered=gtfs.trips.filterBy(route_id=IsIn(['R2','R3']),update=False)
+    assert len(filtered)==4 and len(gtfs.trips.data)==7
+    gtfs.trips.filterBy(service_id='WE')
+    assert [ gtfs.trips.trip_id(0) ]==['T1c'] and len(gtfs.trips.data)==1
+    assert gtfs.trips['T1a']==None
+    assert gtfs.agency.agency_name=='Not a correct GTFS because it is filtered.'
+
+
+def test_subsetByStops(gtfs):
+    masks=gtfs.subset(stops=['E'],update=False)
+    assert list(gtfs.trips.getColumn('trip_id')[masks['trips']])==['T2a','T2b','T2c']
+    assert masks['stop_times'].sum()==6
+    assert list(gtfs.routes.getColumn('route_id')[masks['routes']])==['R2']
+    assert list(gtfs.stops.getColumn('stop_id')[masks['stops']])==['D','E']
+    assert list(gtfs.shapes.getColumn('shape_id')[masks['shapes']])==['S2','S2']
+    assert masks['calendar'].sum()==1 and masks['calendar_dates'].sum()==1
+    assert masks['frequencies'].sum()==0 and masks['transfers'].sum()==0
+    assert masks['fare_rules'].sum()==1 and masks['fare_attributes'].sum()==1
+    assert len(gtfs.trips.data)==7
+
+
+def test_subsetUpdatesTables(gtfs):
+    gtfs.subset(routes={ 'route_short_name':Contains('3') })
+    assert len(gtfs.trips.data)==1 and gtfs.trips['T3'].route_id=='R3'
+    assert [ t.stop_id for t in gtfs.stop_times.getSeqByTripID('T3') ]==['H','K']
+    assert len(gtfs.frequencies.data)==1
+    assert sorted(gtfs.stops.getColumn('stop_id'))==['H','K']
+    assert len(gtfs.transfers.data)==0
+
+
+def test_subsetCombinesSelections(gtfs):
+    masks=gtfs.subset(routes=['R1'],trips={ 'service_id':'WE' },update=False)
+    assert list(gtfs.trips.getColumn('trip_id')[masks['trips']])==['T1c']
+    assert list(gtfs.stops.getColumn('stop_id')[masks['stops']])==['A','B']
@@ -0,0 +1,35 @@
+import importlib
+
+import numpy as np
+
+module=importlib.import_module('egGTFS.egGTFS')
+
+
+def test_keyIndexGroupsRowsByKey():
+    index=module.KeyIndex(np.array(['b','a','b','c','a'],dtype=object))
+    assert list(index.getRows('a'))==[1,4]
+    assert list(index.getRows('b'))==[0,2]
+    assert list(index.getRows('c'))==[3]
+    assert index.getRows('d') is None
+    assert index.getRange(['unhashable'])==(None,None)
+
+
+def test_keyIndexUsesSlicesForContiguousKeys():
+    index=module.KeyIndex(np.array(['a','a','b','c','c','c'],dtype=object))
+    assert index.order is None
+    assert index.getRows('c')==slice(3,6)
+
+
+def test_lookupsMatchFullColumnScan(gtfs):
+    for table,fieldName in ((gtfs.trips,'trip_id'),(gtfs.stop_times,'trip_id'),
+                            (gtfs.shapes,'shape_id'),(gtfs.stops,'stop_id')):
+        column=np.asarray(table.getColumn(fieldName),dtype=object)
+        keyIndex=table.getKeyIndex()
+        for key in set(column):
+            rowNos=np.arange(len(column))[keyIndex.getRows(key)]
+            assert list(rowNos)==list(np.flatnonzero(column==key))
+            assert len(table.getRowsByKey(key))==len(rowNos)
+    assert gtfs.trips['T1b'].trip_headsign=='G行'
+    assert len(gtfs.stop_times['T1a'])==4
+    assert gtfs.trips['no_such_trip']==None
+    assert gtfs.stops['nope']==None
@@ -0,0 +1,41 @@
+import pytest
+
+import egGTFS
+
+tableNames=[ name for name,_,_ in egGTFS.egGTFS.tableInfoList ]
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_lazyLoadsTablesOnFirstAccess(feedPath,storage):
+    gtfs=egGTFS.open(feedPath,storage=storage,lazy=True)
+    assert not any(gtfs.isLoaded(name) for name in tableNames)
+    assert gtfs.stops['C'].stop_name=='停留所C'
+    assert gtfs.isLoaded('stops')
+    assert not gtfs.isLoaded('stop_times') and not gtfs.isLoaded('shapes')
+    assert gtfs['trips']['T1b'].trip_headsign=='G行'
+    assert gtfs.isLoaded('trips')
+    # 説明：2 回目以降のアクセスでは同じオブジェクトを返す
+    assert gtfs.stops is gtfs.stops
+
+
+def test_lazyMatchesEagerLoad(feedPath):
+    eager=egGTFS.open(feedPath)
+    lazy=egGTFS.open(feedPath,lazy=True)
+    for name in ('stops','trips','stop_times','shapes','frequencies','transfers'):
+        # 説明：欠損値（NaN）を含むため文字列にして比較する
+        assert [ list(map(str,t)) for t in lazy[name].data ]==[ list(map(str,t)) for t in eager[name].data ]
+    assert eager.isLoaded('calendar') and not lazy.isLoaded('calendar')
+
+
+def test_lazyWithColumns(feedPath):
+    gtfs=egGTFS.open(feedPath,lazy=True,columns={ 'stop_times':['trip_id','stop_id','stop_sequence'] })
+    assert [ t.stop_id for t in gtfs.stop_times.getSeqByTripID('T1a') ]==['A','B','C','G']
+    assert gtfs.stop_times.getColumn('arrival_time') is None
+
+
+def test_lazyUnknownTable(feedPath):
+    gtfs=egGTFS.open(feedPath,lazy=True)
+    with pytest.raises(AttributeError):
+        gtfs.no_such_table
+    with pytest.raises(ValueError):
+        gtfs.loadTable('no_such_table')
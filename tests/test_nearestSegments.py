@@ -0,0 +1,49 @@
+import importlib
+
+import numpy as np
+import pytest
+
+import egGTFS
+
+module=importlib.import_module('egGTFS.egGTFS')
+
+
+def assertSameResult(inExpected,inActual):
+    for expected,actual in zip(inExpected,inActual):
+        assert np.array_equal(np.asarray(expected),np.asarray(actual),equal_nan=True)
+
+
+@pytest.mark.parametrize('seed',range(20))
+def test_segmentIndexGivesSameResultAsDenseSearch(seed,monkeypatch):
+    monkeypatch.setattr(module,'nearestSegmentsDenseMaxSize',0)
+    rng=np.random.default_rng(seed)
+    n=int(rng.integers(2,80))
+    lat=39.7+np.cumsum(rng.normal(0,5e-4,n))
+    lon=140.1+np.cumsum(rng.normal(0,5e-4,n))
+    if seed%2==1:
+        # 格子点上の点列（距離の等しい線分や点が多数ある場合）
+        lat,lon=np.round(lat,3),np.round(lon,3)
+    m=int(rng.integers(1,30))
+    pointLat=lat.mean()+rng.normal(0,0.01,m)
+    pointLon=lon.mean()+rng.normal(0,0.01,m)
+    if seed%2==1: pointLat,pointLon=np.round(pointLat,3),np.round(pointLon,3)
+    index=module.SegmentGridIndex(lat,lon,cellSize=[None,5.0,50.0][seed%3])
+    for searchFrom in (0,int(rng.integers(0,n-1))):
+        expected=module.getNearestSegmentsAndPoints(lat,lon,pointLat,pointLon,inSearchFrom=searchFrom)
+        actual=module.getNearestSegmentsAndPoints(lat,lon,pointLat,pointLon,inSearchFrom=searchFrom,
+                                                  segmentIndex=index)
+        assertSameResult(expected,actual)
+
+
+def test_stopProjectionsWithSegmentIndex(feedPath,monkeypatch):
+    dense=egGTFS.open(feedPath)
+    dense.buildStopProjections()
+    monkeypatch.setattr(module,'nearestSegmentsDenseMaxSize',0)
+    indexed=egGTFS.open(feedPath)
+    indexed.buildStopProjections()
+    for shapeID,stopID in [('S1','A'),('S1','C'),('S2','D'),('S3','K')]:
+        a=dense.getStopProjection(shapeID,stopID)
+        b=indexed.getStopProjection(shapeID,stopID)
+        assert vars(a).keys()==vars(b).keys()
+        for name in vars(a):
+            assert repr(getattr(a,name))==repr(getattr(b,name)),name
@@ -0,0 +1,37 @@
+import importlib
+import io
+
+import pandas as pd
+
+import egGTFS
+
+module=importlib.import_module('egGTFS.egGTFS')
+
+csvText=('stop_id,stop_name,note\n'
+         '0001,"name, with comma",\n'
+         '0002,"multi\nline",a\n'
+         '0003,"say ""hi""",\n'
+         '0004,plain,"q\r\nq"\n')*50
+
+
+def test_readCsvInParallelHandlesQuotedFields(monkeypatch):
+    monkeypatch.setattr(module,'parallelParseBlockBytes',37)
+    data=csvText.encode()
+    expected=pd.read_csv(io.BytesIO(data),dtype={'stop_id':str})
+    for workers in (2,3):
+        df=module.readCsvInParallel(io.BytesIO(data),workers,fieldTypes={'stop_id':'id'})
+        assert df is not None
+        pd.testing.assert_frame_equal(df,expected)
+
+
+def test_openWithWorkersMatchesSerial(monkeypatch,feedPath):
+    monkeypatch.setattr(module,'parallelParseMinBytes',0)
+    monkeypatch.setattr(module,'parallelParseBlockBytes',64)
+    serial=egGTFS.open(feedPath,storage='columnar')
+    parallel=egGTFS.open(feedPath,storage='columnar',workers=3)
+    for tableName in ('stops','stop_times','trips'):
+        for fieldName in ('stop_id','stop_name','trip_id','arrival_time'):
+            a=getattr(serial,tableName).getColumn(fieldName)
+            b=getattr(parallel,tableName).getColumn(fieldName)
+            assert (a is None)==(b is None)
+            if a is not None: assert list(a)==list(b)
@@ -0,0 +1,28 @@
+import pytest
+
+
+def test_tripPatterns(gtfs):
+    patterns=gtfs.tripPatterns()
+    rows=sorted(zip(patterns['first_stop_id'],patterns['last_stop_id'],
+                    patterns['num_stops'],patterns['num_trips']))
+    assert rows==[('A','B',2,1),('A','G',4,2),('D','E',2,3),('H','K',2,1)]
+
+
+def test_patternOfTrips(gtfs):
+    patternID=gtfs.getPatternIdByTripID('T1a')
+    assert gtfs.getPatternIdByTripID('T1b')==patternID
+    assert gtfs.getPatternIdByTripID('T1c')!=patternID
+    assert gtfs.getPatternIdByTripID('no_such_trip')==None
+    timetable=gtfs.patternTimetable(patternID)
+    assert list(timetable.index)==['T1a','T1b']
+    assert list(timetable.columns)==['A','B','C','G']
+    assert list(timetable.loc['T1b'])==['08:20:00','08:25:00','08:30:00','08:35:00']
+
+
+def test_patternTimetableKind(gtfs):
+    patternID=gtfs.getPatternIdByTripID('T2a')
+    arrival=gtfs.patternTimetable(patternID,kind='arrival')
+    assert list(arrival.index)==['T2a','T2b','T2c']
+    assert list(arrival['E'])==['08:22:00','08:30:00','08:50:00']
+    with pytest.raises(ValueError):
+        gtfs.patternTimetable(patternID,kind='both')
@@ -0,0 +1,42 @@
+def getLegTuples(inJourney):
+    return [ (leg.mode,leg.from_stop_id,leg.to_stop_id,str(leg.departure_time),str(leg.arrival_time),leg.trip_id)
+             for leg in inJourney.legs ]
+
+
+def test_planWithTransferLeg(gtfs):
+    route=gtfs.plan('A','E','07:55:00',date='20240401')
+    assert route.transfers==1
+    # C -> D は transfers.txt の min_transfer_time（300 秒）で歩くため、08:12 発の T2a には乗れない
+    assert getLegTuples(route)==[('transit','A','C','08:00:00','08:10:00','T1a'),
+                                 ('walk','C','D','08:10:00','08:15:00',None),
+                                 ('transit','D','E','08:20:00','08:30:00','T2b')]
+
+
+def test_planExcludesTransferType3(gtfs):
+    # G と H は近いが、transfers.txt で乗換不可（transfer_type=3）とされている
+    assert gtfs.plan('A','K','07:55:00',date='20240401')==None
+    assert gtfs.plan('H','K','07:55:00',date='20240401').arrival_time!=None
+
+
+def test_planUsesOnlyServiceOfDate(gtfs):
+    # T1c（WE）は平日には運行しない
+    route=gtfs.plan('A','B','08:30:00',date='20240401')
+    assert route==None
+    route=gtfs.plan('A','B','08:30:00',date='20240406')
+    assert getLegTuples(route)==[('transit','A','B','09:00:00','09:05:00','T1c')]
+
+
+def test_earliestArrivals(gtfs):
+    reach=gtfs.earliestArrivals('A','07:55:00',date='20240401')
+    rows={ stopID:(arrival,transfers) for stopID,arrival,transfers in
+           zip(reach['stop_id'],reach['arrival'],reach['transfers']) }
+    assert rows=={ 'A':(28500,0),'B':(29100,0),'C':(29400,0),'D':(29700,0),
+                   'G':(29700,0),'E':(30600,1) }
+    assert list(reach['arrival'])==sorted(reach['arrival'])
+
+
+def test_planProfile(gtfs):
+    routes=gtfs.planProfile('A','E','07:50:00','08:30:00',date='20240401')
+    assert [ (str(t.departure_time),str(t.arrival_time)) for t in routes ]== \
+           [('08:00:00','08:30:00'),('08:20:00','08:50:00')]
+    assert [ t.legs[-1].trip_id for t in routes ]==['T2b','T2c']
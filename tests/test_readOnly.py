@@ -0,0 +1,59 @@
+import importlib
+import os
+
+import numpy as np
+import pytest
+
+import egGTFS
+
+module=importlib.import_module('egGTFS.egGTFS')
+
+
+def columnArrays(inTable):
+    for column in inTable.data.columns:
+        if isinstance(column,module.CategoryColumn):
+            yield column.codes
+            yield column.categories
+        else:
+            yield column.array
+
+
+@pytest.mark.parametrize('cached',[False,True])
+def test_readOnlyUsesMemoryMappedArrays(feedPath,tmp_path,cached):
+    cacheDir=str(tmp_path/'cache')
+    if cached: egGTFS.open(feedPath,storage='columnar',cacheDir=cacheDir)
+    gtfs=egGTFS.open(feedPath,readOnly=True,cacheDir=cacheDir)
+    assert gtfs.stop_times.storage=='columnar'
+    for name in ('stops','trips','stop_times','shapes'):
+        for t in columnArrays(gtfs[name]):
+            assert isinstance(t,np.memmap)
+            assert not t.flags.writeable
+    column=gtfs.stop_times.getColumn('arrival_time')
+    with pytest.raises(ValueError):
+        column[0]=0
+    assert os.path.isdir(cacheDir)
+
+
+def test_readOnlyGettersMatchObjectStorage(feedPath,tmp_path):
+    gtfs=egGTFS.open(feedPath,readOnly=True,cacheDir=str(tmp_path/'cache'))
+    plain=egGTFS.open(feedPath)
+    assert gtfs.trips['T1b'].trip_headsign=='G行'
+    assert gtfs.stops['K'].stop_name=='停留所K,北'
+    assert [ t.stop_id for t in gtfs.stop_times.getSeqByTripID('T1a') ]==['A','B','C','G']
+    assert list(gtfs.stop_times.getSecondsByTripID('T2b')[0])==[30000,30600]
+    assert list(gtfs.shapes.getCumulativeDistances('S1'))== \
+           pytest.approx(list(plain.shapes.getCumulativeDistances('S1')))
+    assert gtfs.getBusPositions('T1a','08:07:30')==pytest.approx(plain.getBusPositions('T1a','08:07:30'))
+
+
+def test_readOnlyDefaultCacheDir(feedPath,tmp_path,monkeypatch):
+    monkeypatch.setenv('EGGTFS_CACHE_DIR',str(tmp_path/'default'))
+    gtfs=egGTFS.open(feedPath,readOnly=True)
+    assert gtfs.cache.path.startswith(str(tmp_path/'default'))
+    assert gtfs.trips['T3'].route_id=='R3'
+
+
+def test_readOnlyRequiresCache(feedPath):
+    gtfs=egGTFS.open(feedPath)
+    with pytest.raises(ValueError):
+        module.stops(gtfs.gtfsZipFileObj,storage='columnar',readOnly=True)
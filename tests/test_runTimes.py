@@ -0,0 +1,54 @@
+import zipfile
+
+import pytest
+
+import egGTFS
+
+
+def toDict(inRunTimes,inKeys=('from_stop_id','to_stop_id')):
+    return { tuple(t[k] for k in inKeys):(t['count'],t['min'],t['median'],t['max'])
+             for _,t in inRunTimes.iterrows() }
+
+
+def test_segmentRunTimes(gtfs):
+    runTimes=gtfs.segmentRunTimes()
+    assert list(runTimes.columns)==['from_stop_id','to_stop_id','count','min','median','max']
+    # 説明：T3 は frequencies の 3 つのインスタンスとして数える
+    assert toDict(runTimes)=={ ('A','B'):(3,300,300,300),('B','C'):(2,300,300,300),
+                               ('C','G'):(2,300,300,300),('D','E'):(3,600,600,600),
+                               ('H','K'):(3,600,600,600) }
+
+
+def test_segmentRunTimesWithDate(gtfs):
+    assert toDict(gtfs.segmentRunTimes(date='20240406'))=={ ('A','B'):(1,300,300,300) }
+    assert toDict(gtfs.segmentRunTimes(date='20240401'))[('A','B')]==(2,300,300,300)
+    assert len(gtfs.segmentRunTimes(date='20250401'))==0
+
+
+def test_segmentRunTimesByHour(gtfs):
+    runTimes=gtfs.segmentRunTimes(by_hour=True)
+    assert 'hour' in runTimes.columns
+    byHour=toDict(runTimes,('from_stop_id','to_stop_id','hour'))
+    assert byHour[('A','B',8)]==(2,300,300,300)
+    assert byHour[('A','B',9)]==(1,300,300,300)
+    assert byHour[('H','K',8)]==(3,600,600,600)
+    assert sum(v[0] for v in byHour.values())==13
+
+
+# T1b の C の到着・出発時刻を 08:32:00 に置き換えたフィードを作成する
+def makeSlowTripFeed(inFeedPath,inPath):
+    with zipfile.ZipFile(inFeedPath) as src, zipfile.ZipFile(inPath,'w') as dst:
+        for name in src.namelist():
+            text=src.read(name).decode('utf-8')
+            if name=='stop_times.txt':
+                text=text.replace('T1b,08:30:00,08:30:00','T1b,08:32:00,08:32:00')
+            dst.writestr(name,text)
+    return inPath
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_segmentRunTimesStatistics(feedPath,tmp_path,storage):
+    gtfs=egGTFS.open(makeSlowTripFeed(feedPath,str(tmp_path/'slow.zip')),storage=storage)
+    runTimes=toDict(gtfs.segmentRunTimes())
+    assert runTimes[('B','C')]==(2,300,360,420)
+    assert runTimes[('C','G')]==(2,180,240,300)
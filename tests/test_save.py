@@ -0,0 +1,22 @@
+import importlib
+import zipfile
+
+import egGTFS
+
+module=importlib.import_module('egGTFS.egGTFS')
+
+
+def readMembers(inPath):
+    with zipfile.ZipFile(inPath) as zf:
+        return { name:zf.read(name) for name in zf.namelist() }
+
+
+def test_saveWithWorkersMatchesSerial(monkeypatch,feedPath,tmp_path):
+    monkeypatch.setattr(module.RecordSet,'saveChunkSize',2)
+    monkeypatch.setattr(module.egGTFS,'saveQueueSize',1)
+    gtfs=egGTFS.open(feedPath)
+    gtfs.save(str(tmp_path/'serial.zip'))
+    gtfs.save(str(tmp_path/'parallel.zip'),workers=3)
+    serial=readMembers(tmp_path/'serial.zip')
+    assert serial==readMembers(tmp_path/'parallel.zip')
+    assert egGTFS.open(str(tmp_path/'parallel.zip')).stops.getNameByStopID('K')=='停留所K,北'
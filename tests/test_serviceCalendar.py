@@ -0,0 +1,39 @@
+import datetime
+
+import numpy as np
+
+
+def test_activeServicesByWeekday(gtfs):
+    assert list(gtfs.activeServices('20240401'))==['WD']
+    assert list(gtfs.activeServices('20240406'))==['WE']
+    assert list(gtfs.activeServices(datetime.date(2024,4,7)))==['WE']
+    assert list(gtfs.activeServices('2024-04-05'))==['WD']
+    # 説明：期間外の日付では運行するサービスは無い
+    assert list(gtfs.activeServices(20240331))==[]
+    assert list(gtfs.activeServices(20250401))==[]
+
+
+def test_calendarDatesExceptions(gtfs):
+    # 説明：20240429（月曜日）は calendar_dates にて WD が削除、WE が追加されている
+    assert list(gtfs.activeServices(20240429))==['WE']
+    assert list(gtfs.activeTrips(20240429))==['T1c']
+
+
+def test_activeTrips(gtfs):
+    assert list(gtfs.activeTrips('20240401'))==['T1a','T1b','T2a','T2b','T2c','T3']
+    assert list(gtfs.activeTrips('20240406'))==['T1c']
+    mask=gtfs.getActiveTripMask('20240406')
+    assert mask.dtype==bool and not mask.flags.writeable
+    gtfs.trips.filterBy(route_id='R1')
+    assert list(gtfs.activeTrips('20240401'))==['T1a','T1b']
+
+
+def test_activeServicesMatchCalendarRules(gtfs):
+    day=datetime.date(2024,3,30)
+    while day<=datetime.date(2025,4,2):
+        inRange=datetime.date(2024,4,1)<=day<=datetime.date(2025,3,31)
+        expected={ 'WD':inRange and day.weekday()<5,'WE':inRange and day.weekday()>=5 }
+        if day==datetime.date(2024,4,29): expected={ 'WD':False,'WE':True }
+        assert sorted(gtfs.activeServices(day))==sorted(k for k,v in expected.items() if v)
+        day+=datetime.timedelta(days=1)
+    assert isinstance(gtfs.activeTrips(20240401),np.ndarray)
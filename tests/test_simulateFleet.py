@@ -0,0 +1,25 @@
+import importlib.util
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_simulateFleetToParquet(gtfs,tmp_path):
+    pytest.importorskip('pyarrow')
+    paths=gtfs.simulateFleetToParquet(str(tmp_path/'fleet'),'20240401',step=60)
+    df=pd.concat([ pd.read_parquet(path) for path in paths ],ignore_index=True)
+    expected=pd.concat([ pd.DataFrame(rows) for rows in gtfs.simulateFleet('20240401',step=60) ],
+                       ignore_index=True)
+    assert len(df)>0
+    assert list(df['trip_id'])==list(expected['trip_id'])
+    assert np.array_equal(df['time'],expected['time'])
+
+
+def test_simulateFleetToParquetWithoutPyarrow(gtfs,tmp_path,monkeypatch):
+    findSpec=importlib.util.find_spec
+    monkeypatch.setattr(importlib.util,'find_spec',
+                        lambda name,*args: None if name=='pyarrow' else findSpec(name,*args))
+    with pytest.raises(ImportError,match='pyarrow'):
+        gtfs.simulateFleetToParquet(str(tmp_path/'fleet'),'20240401')
+    assert not (tmp_path/'fleet').exists()
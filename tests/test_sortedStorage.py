@@ -0,0 +1,50 @@
+import zipfile
+
+import pytest
+
+import egGTFS
+
+
+# stop_times.txt と shapes.txt のデータ行を逆順に並べ替えたフィードを作成する
+def makeShuffledFeed(inFeedPath,inPath):
+    with zipfile.ZipFile(inFeedPath) as src, zipfile.ZipFile(inPath,'w') as dst:
+        for name in src.namelist():
+            text=src.read(name).decode('utf-8')
+            if name in ('stop_times.txt','shapes.txt'):
+                lines=text.strip().split('\n')
+                text='\n'.join([lines[0]]+lines[:0:-1])+'\n'
+            dst.writestr(name,text)
+    return inPath
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_stopTimesAreSortedBySequence(feedPath,tmp_path,storage):
+    path=makeShuffledFeed(feedPath,str(tmp_path/'shuffled.zip'))
+    gtfs=egGTFS.open(path,storage=storage)
+    seq=gtfs.stop_times.getSeqByTripID('T1a')
+    assert [ t.stop_id for t in seq ]==['A','B','C','G']
+    assert [ int(t.stop_sequence) for t in seq ]==[1,2,3,4]
+    assert [ t.departure_time for t in gtfs.stop_times.getSeqByTripID('T2b') ]== \
+           ['08:20:00','08:30:00']
+    # 説明：並べ替え後は同じ trip_id の行が連続し、スライスで参照される。
+    assert gtfs.stop_times.getKeyIndex().order is None
+    assert isinstance(gtfs.stop_times.getKeyIndex().getRows('T1b'),slice)
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_shapeArrayIsSortedBySequence(feedPath,tmp_path,storage):
+    path=makeShuffledFeed(feedPath,str(tmp_path/'shuffled.zip'))
+    gtfs=egGTFS.open(path,storage=storage)
+    shape=gtfs.shapes.getShapeArray('S1')
+    assert [ int(t[gtfs.shapes.index.shape_pt_sequence]) for t in shape ]==[1,2,3,4]
+    lat,lon=gtfs.shapes.getLatLonArray('S1')
+    assert list(lon)==[140.10,140.11,140.12,140.13]
+    assert gtfs.shapes.getKeyIndex().order is None
+
+
+def test_shuffledFeedMatchesOriginal(feedPath,tmp_path):
+    original=egGTFS.open(feedPath)
+    shuffled=egGTFS.open(makeShuffledFeed(feedPath,str(tmp_path/'shuffled.zip')))
+    for tripID in ('T1a','T1b','T1c','T2a','T2b','T2c','T3'):
+        assert [ list(t) for t in shuffled.stop_times.getSeqArrayByTripID(tripID) ]== \
+               [ list(t) for t in original.stop_times.getSeqArrayByTripID(tripID) ]
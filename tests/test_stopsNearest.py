@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+
+queries=[ (39.7000,140.1000),(39.7002,140.1199),(39.7050,140.1250),(39.7500,140.2000),(39.7100,140.1300) ]
+
+
+def bruteForce(inGtfs,inLat,inLon):
+    stops=inGtfs.stops
+    pairs=[ (geodesic((inLat,inLon),stops.pos(t)).m,stops.stop_id(t)) for t in stops.data ]
+    return sorted(pairs)
+
+
+def test_nearestMatchesBruteForce(gtfs):
+    for lat,lon in queries:
+        expected=bruteForce(gtfs,lat,lon)
+        stopID,dist=gtfs.stops.nearest(lat,lon)
+        assert stopID==expected[0][1]
+        assert dist==pytest.approx(expected[0][0],abs=1e-3)
+        stopIDs,dists=gtfs.stops.nearest(lat,lon,k=3)
+        assert list(stopIDs)==[ t[1] for t in expected[:3] ]
+        assert np.allclose(dists,[ t[0] for t in expected[:3] ],atol=1e-3)
+
+
+def test_nearestForArraysAndLargeK(gtfs):
+    lat,lon=np.array(queries).T
+    stopIDs,dists=gtfs.stops.nearest(lat,lon,k=10)
+    assert stopIDs.shape==(len(queries),10) and dists.shape==(len(queries),10)
+    for i,(qLat,qLon) in enumerate(queries):
+        expected=bruteForce(gtfs,qLat,qLon)
+        assert list(stopIDs[i,:8])==[ t[1] for t in expected ]
+        assert list(stopIDs[i,8:])==[None,None]
+        assert np.isinf(dists[i,8:]).all()
+
+
+@pytest.mark.parametrize('radius',[0,50,1000,5000])
+def test_withinMatchesBruteForce(gtfs,radius):
+    for lat,lon in queries:
+        expected=[ t for t in bruteForce(gtfs,lat,lon) if t[0]<=radius ]
+        stopIDs,dists=gtfs.stops.within(lat,lon,radius)
+        assert list(stopIDs)==[ t[1] for t in expected ]
+        assert np.allclose(dists,[ t[0] for t in expected ],atol=1e-3)
+    lat,lon=np.array(queries).T
+    q,stopIDs,dists=gtfs.stops.within(lat,lon,radius)
+    assert list(zip(q,stopIDs))==[ (i,t[1]) for i,(qLat,qLon) in enumerate(queries)
+                                   for t in bruteForce(gtfs,qLat,qLon) if t[0]<=radius ]
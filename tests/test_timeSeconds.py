@@ -0,0 +1,60 @@
+import importlib
+import zipfile
+
+import numpy as np
+import pytest
+
+import egGTFS
+
+module=importlib.import_module('egGTFS.egGTFS')
+
+
+def test_timeStrArrayToSeconds():
+    seconds=module.timeStrArrayToSeconds(['08:00:00','25:30:15','8:05:00',None,'','ab:cd:ef','08:00:00'])
+    assert seconds.dtype==np.int32
+    assert list(seconds)==[28800,91815,29100,-1,-1,-1,28800]
+    assert module.secondsToTimeStr(91815)=='25:30:15'
+
+
+def test_toSeconds():
+    assert module.toSeconds('24:10:00')==87000
+    assert module.toSeconds(module.Time('08:05:00'))==29100
+    assert module.toSeconds(np.int32(60))==60
+    assert list(module.toSecondsArray(['08:00:00','24:00:01']))==[28800,86401]
+    assert list(module.toSecondsArray(np.array([1,2])))==[1,2]
+
+
+# T3 の時刻を 24:00:00 以降（24:50:00 - 25:00:00）に置き換えたフィードを作成する
+def makeLateNightFeed(inFeedPath,inPath):
+    with zipfile.ZipFile(inFeedPath) as src, zipfile.ZipFile(inPath,'w') as dst:
+        for name in src.namelist():
+            text=src.read(name).decode('utf-8')
+            if name=='stop_times.txt':
+                text=text.replace('T3,00:00:00,00:00:00','T3,24:50:00,24:50:00') \
+                         .replace('T3,00:10:00,00:10:00','T3,25:00:00,25:00:00')
+            dst.writestr(name,text)
+    return inPath
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_stopTimesAreIntSeconds(feedPath,tmp_path,storage):
+    gtfs=egGTFS.open(makeLateNightFeed(feedPath,str(tmp_path/'late.zip')),storage=storage)
+    arrival,departure=gtfs.stop_times.getSecondsByTripID('T1a')
+    assert arrival.dtype==np.int32
+    assert list(arrival)==[28800,29100,29400,29700]
+    assert list(departure)==list(arrival)
+    arrival,_=gtfs.stop_times.getSecondsByTripID('T3')
+    assert list(arrival)==[89400,90000]
+    # 説明：レコードの値は従来通り 'hh:mm:ss' 形式の文字列となる
+    assert [ t.arrival_time for t in gtfs.stop_times.getSeqByTripID('T3') ]==['24:50:00','25:00:00']
+    arrival,_=gtfs.stop_times.getSecondsByTripID('no_such_trip')
+    assert len(arrival)==0
+
+
+def test_columnarTimeColumnIsInt32(feedPath):
+    gtfs=egGTFS.open(feedPath,storage='columnar')
+    column=gtfs.stop_times.getColumn('departure_time')
+    assert column.dtype==np.int32
+    assert gtfs.stop_times.departure_time(0)=='08:00:00'
+    startRecord,endRecord=gtfs.stop_times.getStartEndRecordsByTime('T1a','08:07:30')
+    assert (startRecord.stop_id,endRecord.stop_id)==('B','C')
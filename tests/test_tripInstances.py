@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import egGTFS
+
+
+def test_tripsActiveBetweenReturnsInstances(gtfs):
+    tripIDs=list(gtfs.tripsActiveBetween('08:00:00','09:00:00',date='20240401'))
+    assert 'T3@08:20:00' in tripIDs
+    assert 'T3' not in tripIDs
+    assert 'T1c' not in tripIDs
+
+
+def test_tripsActiveBetweenIDsWorkWithPublicGetters(gtfs):
+    for tripID in gtfs.tripsActiveBetween('07:00:00','10:00:00'):
+        arrival,departure=gtfs.getSecondsByTripID(tripID)
+        assert len(arrival)>0 and len(departure)>0
+        seconds=np.arange(arrival[0],departure[-1]+1,60)
+        positions=gtfs.getBusPositions(tripID,seconds)
+        assert not np.isnan(positions).any()
+        assert gtfs.getBusPos(tripID,str(egGTFS.Time.fromTotalSecond(int(arrival[0]))))!=None
+
+
+def test_getSecondsByTripIDShiftsInstances(gtfs):
+    arrival,departure=gtfs.getSecondsByTripID('T3@08:20:00')
+    assert list(arrival)==[8*3600+20*60,8*3600+30*60]
+    assert list(departure)==[8*3600+20*60,8*3600+30*60]
+
+
+@pytest.mark.parametrize('storage',['object','columnar'])
+def test_numericTripIDsWithFrequencies(numericTripFeedPath,storage):
+    gtfs=egGTFS.open(numericTripFeedPath,storage=storage)
+    tripIDs=[ str(t) for t in gtfs.tripsActiveBetween('08:00:00','09:00:00',date='20240401') ]
+    assert '31@08:20:00' in tripIDs and '31' not in tripIDs
+    assert gtfs.getBusPos(11,'08:05:00')!=None
+    assert gtfs.getBusPos('31@08:20:00','08:25:00')!=None
+    arrival,_=gtfs.getSecondsByTripID('31@08:40:00')
+    assert list(arrival)==[8*3600+40*60,8*3600+50*60]
+    assert [ t.trip_id for t in gtfs.departures('H','08:10:00',date='20240401') ]== \
+           ['31@08:20:00','31@08:40:00']
+    route=gtfs.plan('A','E','07:55:00',date='20240401')
+    assert [ str(leg.trip_id) for leg in route.legs ]==['11','None','22']
+    assert len(gtfs.segmentRunTimes(date='20240401'))>0
@@ -0,0 +1,43 @@
+import itertools
+
+import numpy as np
+import pytest
+
+# frequencies の展開後の全ての便（T3 は 08:00:00 から 1200 秒間隔のインスタンスとなる）
+allTripIDs=['T1a','T1b','T1c','T2a','T2b','T2c','T3@08:00:00','T3@08:20:00','T3@08:40:00']
+
+
+def bruteForce(inGtfs,inStart,inEnd,inTripIDs):
+    ret=[]
+    for tripID in inTripIDs:
+        arrival,departure=inGtfs.getSecondsByTripID(tripID)
+        if arrival[0]<=inEnd and inStart<=departure[-1]: ret.append((int(arrival[0]),tripID))
+    return ret
+
+
+def test_tripsActiveBetweenMatchesBruteForce(gtfs):
+    times=range(7*3600+50*60,9*3600+20*60,5*60)
+    for start,end in itertools.combinations_with_replacement(times,2):
+        tripIDs=list(gtfs.tripsActiveBetween(start,end))
+        expected=bruteForce(gtfs,start,end,allTripIDs)
+        assert sorted(tripIDs)==sorted(t for _,t in expected)
+        starts=[ int(gtfs.getSecondsByTripID(t)[0][0]) for t in tripIDs ]
+        assert starts==sorted(starts)
+
+
+@pytest.mark.parametrize('date',['20240401','20240406'])
+def test_tripsActiveBetweenWithDate(gtfs,date):
+    active=set(gtfs.activeTrips(date))
+    candidates=[ t for t in allTripIDs if t.split('@')[0] in active ]
+    tripIDs=list(gtfs.tripsActiveBetween('08:00:00','09:00:00',date=date))
+    assert sorted(tripIDs)==sorted(t for _,t in bruteForce(gtfs,8*3600,9*3600,candidates))
+
+
+def test_tripsActiveBetweenBoundaries(gtfs):
+    # 説明：運行時間帯の端の時刻も重なりに含む
+    assert list(gtfs.tripsActiveBetween('08:15:00','08:15:00'))==['T1a','T2a']
+    assert list(gtfs.tripsActiveBetween('09:05:01','23:00:00'))==[]
+    assert list(gtfs.tripsActiveBetween(9*3600+5*60,9*3600+5*60))==['T1c']
+    index=gtfs.getTripTimeIndex()
+    assert index.maxDuration==15*60
+    assert np.all(np.diff(index.start)>=0)